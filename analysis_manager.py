@@ -0,0 +1,142 @@
+"""
+Analysis Manager
+
+Memoizes per-function CFG analyses (CFG, immediate dominators, dominators,
+dominance tree, dominance frontier, back edges, natural loops and the loop nest forest) so that
+passes run back to back can share them instead of recomputing them from
+scratch.
+
+Results are keyed on the function name. A pass that changes a function must
+invalidate the analyses it does not preserve; the pass manager does this
+after every pass, using the analyses that pass declares it preserves.
+
+Cached results are shared between passes: callers must treat them as read
+only, and copy anything they want to modify.
+"""
+
+from cfg import form_cfg_succs_preds
+from dominator_utilities import (get_immediate_dominators_w_cfg, get_dominated_by_from_idoms,
+                                 get_dominates_from_dominated_by, build_dominance_tree_from_idoms,
+                                 build_dominance_frontier_from_idoms,
+                                 get_backedges_helper, get_natural_loops_w_cfg,
+                                 get_loop_nest_forest_w_cfg)
+from bril_core_constants import NAME, INSTRS
+
+
+CFG = "cfg"
+IMMEDIATE_DOMINATORS = "immediate dominators"
+DOMINATORS = "dominators"
+DOMINANCE_TREE = "dominance tree"
+DOMINANCE_FRONTIER = "dominance frontier"
+BACKEDGES = "backedges"
+NATURAL_LOOPS = "natural loops"
+LOOP_NEST_FOREST = "loop nest forest"
+
+# analyses that depend only on the shape of the CFG
+CFG_ANALYSES = [CFG, IMMEDIATE_DOMINATORS, DOMINATORS, DOMINANCE_TREE,
+                DOMINANCE_FRONTIER, BACKEDGES, NATURAL_LOOPS, LOOP_NEST_FOREST]
+PRESERVES_NONE = []
+PRESERVES_CFG = CFG_ANALYSES
+
+
+def compute_cfg(am, func):
+    return form_cfg_succs_preds(func[INSTRS])
+
+
+def compute_immediate_dominators(am, func):
+    cfg = am.get(func, CFG)
+    return get_immediate_dominators_w_cfg(cfg)
+
+
+def compute_dominators(am, func):
+    cfg = am.get(func, CFG)
+    imm_dom = am.get(func, IMMEDIATE_DOMINATORS)
+    domby = get_dominated_by_from_idoms(cfg, imm_dom)
+    dom = get_dominates_from_dominated_by(cfg, domby)
+    return dom, domby
+
+
+def compute_dominance_tree(am, func):
+    cfg = am.get(func, CFG)
+    imm_dom = am.get(func, IMMEDIATE_DOMINATORS)
+    return build_dominance_tree_from_idoms(cfg, imm_dom)
+
+
+def compute_dominance_frontier(am, func):
+    cfg = am.get(func, CFG)
+    imm_dom = am.get(func, IMMEDIATE_DOMINATORS)
+    return build_dominance_frontier_from_idoms(cfg, imm_dom)
+
+
+def compute_backedges(am, func):
+    cfg = am.get(func, CFG)
+    dom, _ = am.get(func, DOMINATORS)
+    return get_backedges_helper(cfg, dom)
+
+
+def compute_natural_loops(am, func):
+    cfg = am.get(func, CFG)
+    backedges = am.get(func, BACKEDGES)
+    return get_natural_loops_w_cfg(cfg, backedges)
+
+
+def compute_loop_nest_forest(am, func):
+    cfg = am.get(func, CFG)
+    natural_loops = am.get(func, NATURAL_LOOPS)
+    return get_loop_nest_forest_w_cfg(cfg, natural_loops)
+
+
+ANALYSES = {
+    CFG: compute_cfg,
+    IMMEDIATE_DOMINATORS: compute_immediate_dominators,
+    DOMINATORS: compute_dominators,
+    DOMINANCE_TREE: compute_dominance_tree,
+    DOMINANCE_FRONTIER: compute_dominance_frontier,
+    BACKEDGES: compute_backedges,
+    NATURAL_LOOPS: compute_natural_loops,
+    LOOP_NEST_FOREST: compute_loop_nest_forest,
+}
+
+
+class AnalysisManager(object):
+    def __init__(self):
+        # function name -> analysis name -> result
+        self.cache = dict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, func, analysis):
+        """
+        Get analysis for func, computing it only if it is not cached
+        """
+        if analysis not in ANALYSES:
+            raise RuntimeError(f"Unknown analysis {analysis}.")
+        func_cache = self.cache.setdefault(func[NAME], dict())
+        if analysis in func_cache:
+            self.hits += 1
+        else:
+            self.misses += 1
+            func_cache[analysis] = ANALYSES[analysis](self, func)
+        return func_cache[analysis]
+
+    def invalidate(self, func, preserved=PRESERVES_NONE):
+        """
+        Drop all analyses of func that are not in preserved
+        """
+        name = func[NAME]
+        if name not in self.cache:
+            return
+        func_cache = self.cache[name]
+        for analysis in list(func_cache.keys()):
+            if analysis not in preserved:
+                del func_cache[analysis]
+
+    def invalidate_all(self, preserved=PRESERVES_NONE):
+        """
+        Drop all analyses not in preserved, for every function
+        """
+        for name in list(self.cache.keys()):
+            func_cache = self.cache[name]
+            for analysis in list(func_cache.keys()):
+                if analysis not in preserved:
+                    del func_cache[analysis]
@@ -7,6 +7,7 @@ from collections import OrderedDict
 from cfg import form_cfg, form_blocks, form_block_dict
 from bril_core_constants import *
 from worklist_solver import Worklist
+from bit_vector_lattice import BitVectorUniverse, BitVectorLattice, INTERSECTION
 
 
 AVAILABLE_GENERATORS = [
@@ -108,19 +109,61 @@ def merge(blocks):
     return merged
 
 
-def available_exprs_func(function):
+def available_exprs_bit_vector(entry, cfg, blocks):
+    """
+    Available expressions over bit vectors, with expressions numbered once
+    for the whole function. Results are converted back into sets.
+
+    The instructions of a block are composed into a single (gen, kill) pair:
+    an instruction generating g and killing k maps (gen, kill) to
+    ((gen | g) & ~k, kill | k).
+    """
+    universe = BitVectorUniverse()
+    var2exprs = dict()
+    for block in blocks.values():
+        for instr in block:
+            for expr in gens(instr):
+                if expr not in universe.index:
+                    universe.add(expr)
+                    for a in expr[1:]:
+                        var2exprs[a] = var2exprs.get(
+                            a, 0) | universe.bit(expr)
+
+    bit_blocks = OrderedDict()
+    for name, block in blocks.items():
+        gen = 0
+        kill = 0
+        for instr in block:
+            instr_gen = universe.to_bits(gens(instr))
+            instr_kill = 0
+            for k in kills(instr):
+                instr_kill |= var2exprs.get(k, 0)
+            gen = (gen | instr_gen) & ~instr_kill
+            kill |= instr_kill
+        bit_blocks[name] = (gen, kill)
+
+    lattice = BitVectorLattice(universe, INTERSECTION)
+    worklist = Worklist(entry, cfg, bit_blocks, 0,
+                        lattice.merge, lattice.transfer)
+    (in_dict, out_dict) = worklist.solve()
+    return (lattice.to_sets(in_dict), lattice.to_sets(out_dict))
+
+
+def available_exprs_func(function, bitvector=False):
     cfg = form_cfg(function)
     assert len(cfg) != 0
     entry = list(cfg.items())[0][0]
     blocks = form_block_dict(form_blocks(function["instrs"]))
+    if bitvector:
+        return available_exprs_bit_vector(entry, cfg, blocks)
     init = set()
     worklist = Worklist(entry, cfg, blocks, init, merge, transfer)
     return worklist.solve()
 
 
-def available_exprs(program):
+def available_exprs(program, bitvector=False):
     for func in program["functions"]:
-        (in_dict, out_dict) = available_exprs_func(func)
+        (in_dict, out_dict) = available_exprs_func(func, bitvector)
 
         final_in_dict = OrderedDict()
         for (key, inner_set) in in_dict.items():
@@ -153,11 +196,12 @@ def available_exprs(program):
 
 @click.command()
 @click.option('--pretty-print', default=False, help='Pretty Print Original Program.')
-def main(pretty_print):
+@click.option('--bitvector', default=False, help='Solve with Bit Vectors instead of Sets.')
+def main(pretty_print, bitvector):
     prog = json.load(sys.stdin)
     if pretty_print:
         print(json.dumps(prog, indent=4, sort_keys=True))
-    available_exprs(prog)
+    available_exprs(prog, bitvector)
 
 
 if __name__ == "__main__":
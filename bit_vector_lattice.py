@@ -0,0 +1,98 @@
+"""
+Bit Vector Lattice for Gen/Kill Data Flow Problems
+
+The facts of a gen/kill problem (definitions, variables, expressions, ...)
+are numbered once per function, and a set of facts becomes a Python int with
+bit i set iff fact i is in the set. Merges become bitwise or/and, and the
+transfer function of a whole basic block is summarized by a (gen, kill) pair:
+
+    out = gen | (in & ~kill)
+
+The Worklist solver drives a BitVectorLattice directly: pass the
+(gen, kill) pair of each block as the block, and the lattice's merge and
+transfer as the merge and transfer functions.
+"""
+
+UNION = "union"
+INTERSECTION = "intersection"
+
+
+class BitVectorUniverse(object):
+    """
+    Numbering of a finite universe of facts, in insertion order
+    """
+
+    def __init__(self, elements=[]) -> None:
+        self.elements = []
+        self.index = dict()
+        for e in elements:
+            self.add(e)
+
+    def add(self, element):
+        if element not in self.index:
+            self.index[element] = len(self.elements)
+            self.elements.append(element)
+        return self.index[element]
+
+    def __len__(self):
+        return len(self.elements)
+
+    def bit(self, element):
+        return 1 << self.index[element]
+
+    def to_bits(self, elements):
+        bits = 0
+        for e in elements:
+            bits |= 1 << self.index[e]
+        return bits
+
+    def from_bits(self, bits):
+        elements = set()
+        i = 0
+        while bits:
+            if bits & 1:
+                elements.add(self.elements[i])
+            bits >>= 1
+            i += 1
+        return elements
+
+    def full(self):
+        return (1 << len(self.elements)) - 1
+
+
+class BitVectorLattice(object):
+    """
+    Gen/kill lattice over a universe, with union (may) or intersection (must)
+    as the merge
+    """
+
+    def __init__(self, universe, meet=UNION) -> None:
+        assert meet in [UNION, INTERSECTION]
+        self.universe = universe
+        self.meet = meet
+
+    def merge(self, bit_vectors):
+        if len(bit_vectors) == 0:
+            return 0
+        if self.meet == UNION:
+            merged = 0
+            for b in bit_vectors:
+                merged |= b
+            return merged
+        merged = bit_vectors[0]
+        for b in bit_vectors:
+            merged &= b
+        return merged
+
+    def transfer(self, in_bits, block):
+        (gen, kill) = block
+        return gen | (in_bits & ~kill)
+
+    def to_sets(self, bits_dict):
+        """
+        Converts a block name -> bit vector map into a block name -> set map
+        """
+        out = type(bits_dict)()
+        for name, bits in bits_dict.items():
+            out[name] = self.universe.from_bits(bits)
+        return out
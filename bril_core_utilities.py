@@ -387,9 +387,17 @@ def lvn_value_is_call(lvn_value):
     return lvn_value[0] == CALL
 
 
-def get_lvn_value(curr_lvn_num, var2value_num, expr2value_num):
+def get_lvn_value(curr_lvn_num, var2value_num, expr2value_num, value_num2expr=None):
+    """
+    Expression of the value number of curr_lvn_num; value_num2expr, the
+    inverse of expr2value_num, replaces a scan of expr2value_num
+    """
     if curr_lvn_num in var2value_num:
         value_num = var2value_num[curr_lvn_num]
+        if value_num2expr != None:
+            if value_num in value_num2expr:
+                return value_num2expr[value_num]
+            raise RuntimeError("Value not bound in expr2value_num.")
         for expr, val in expr2value_num.items():
             if val == value_num:
                 return expr
@@ -398,7 +406,11 @@ def get_lvn_value(curr_lvn_num, var2value_num, expr2value_num):
         raise RuntimeError("LVN Num must be in var2value_num dictionary.")
 
 
-def interpret_lvn_value(lvn_value, var2value_num, expr2value_num):
+def interpret_lvn_value(lvn_value, var2value_num, expr2value_num, value_num2expr=None, memo=None):
+    """
+    Interprets lvn_value as far as its arguments are constants. memo, if
+    given, caches the interpretation of each argument value number.
+    """
     assert type(lvn_value) == tuple
     assert len(lvn_value) >= 2
     if lvn_value_is_const(lvn_value):
@@ -409,14 +421,20 @@ def interpret_lvn_value(lvn_value, var2value_num, expr2value_num):
         return lvn_value
     new_args = []
     for arg_lvn_num in lvn_value[1:]:
+        if memo != None and arg_lvn_num in memo:
+            new_args.append(memo[arg_lvn_num])
+            continue
         try:
             arg_lvn_value = get_lvn_value(
-                arg_lvn_num, var2value_num, expr2value_num)
+                arg_lvn_num, var2value_num, expr2value_num, value_num2expr)
         except:
             # cannot simplify
             return lvn_value
-        new_args.append(interpret_lvn_value(
-            arg_lvn_value, var2value_num, expr2value_num))
+        arg_interpreted = interpret_lvn_value(
+            arg_lvn_value, var2value_num, expr2value_num, value_num2expr, memo)
+        if memo != None:
+            memo[arg_lvn_num] = arg_interpreted
+        new_args.append(arg_interpreted)
     all_constants = True
     for a in new_args:
         if not lvn_value_is_const(a):
@@ -5,3 +5,11 @@ FSUB = "fsub"
 FLOAT = "float"
 
 FLOAT_OPS = [FADD, FMUL, FDIV, FSUB]
+
+FEQ = "feq"
+FLT = "flt"
+FGT = "fgt"
+FLE = "fle"
+FGE = "fge"
+
+FLOAT_COMP_OPS = [FEQ, FLT, FGT, FLE, FGE]
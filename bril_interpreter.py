@@ -0,0 +1,725 @@
+"""
+Bril Interpreter
+
+A reference interpreter for Bril in pure Python, covering the core, float,
+memory, speculation and vector (see bril_vector_constants.py) extensions,
+so programs can be run and measured in process, without brili.
+
+Each function is decoded once, before execution: every instruction becomes a
+tuple (opcode, dest, arg1, arg2, aux), with an integer opcode (see bril_ir),
+variables replaced by slot indices into a per call list of values, and an
+opcode specific operand in aux, e.g. the value of a const or the resolved
+targets of a branch. Execution is then a single loop over the decoded
+instructions, with an explicit call stack, so deep recursion does not hit
+Python's recursion limit.
+
+Like brili -p, -p reports the number of executed instructions on stderr.
+--op-counts also reports how often each opcode executed, and -v how many
+vectors were created, as brili-vc -v does, along with the number of vector
+and scalar instructions executed. Vector operations run on Python lists, or
+with --numpy-vectors on the NumPy register file of bril_vector_engine.py.
+
+Operand types are not checked at runtime; run the Bril type checker for
+that.
+
+Usage:
+    bril2json < prog.bril | python3 bril_interpreter.py -p 10 20
+"""
+
+import sys
+import json
+import math
+import click
+from collections import OrderedDict
+
+import bril_ir
+from bril_ir import opcode_id, OPCODE_NAMES, LABEL_OPCODE, TERMINATOR_OPCODES
+from bril_core_constants import *
+from bril_float_constants import *
+from bril_memory_extension_constants import *
+from bril_speculation_constants import *
+from bril_vector_constants import *
+
+
+# 64 bit integer range of Bril ints
+INT_MIN = -(1 << 63)
+INT_MAX = (1 << 63) - 1
+
+# opcodes of the pseudo instructions ending every decoded function, and
+# starting every basic block when collecting a block profile
+END_OPCODE = -2
+BLOCK_OPCODE = -3
+
+CONST_OPCODE = opcode_id(CONST)
+ID_OPCODE = opcode_id(ID)
+ADD_OPCODE = opcode_id(ADD)
+SUB_OPCODE = opcode_id(SUB)
+MUL_OPCODE = opcode_id(MUL)
+DIV_OPCODE = opcode_id(DIV)
+EQ_OPCODE = opcode_id(EQ)
+LT_OPCODE = opcode_id(LT)
+GT_OPCODE = opcode_id(GT)
+LE_OPCODE = opcode_id(LE)
+GE_OPCODE = opcode_id(GE)
+NOT_OPCODE = opcode_id(NOT)
+AND_OPCODE = opcode_id(AND)
+OR_OPCODE = opcode_id(OR)
+JMP_OPCODE = opcode_id(JMP)
+BR_OPCODE = opcode_id(BR)
+CALL_OPCODE = opcode_id(CALL)
+RET_OPCODE = opcode_id(RET)
+PRINT_OPCODE = opcode_id(PRINT)
+NOP_OPCODE = opcode_id(NOP)
+PHI_OPCODE = opcode_id(PHI)
+
+FADD_OPCODE = opcode_id(FADD)
+FSUB_OPCODE = opcode_id(FSUB)
+FMUL_OPCODE = opcode_id(FMUL)
+FDIV_OPCODE = opcode_id(FDIV)
+FEQ_OPCODE = opcode_id(FEQ)
+FLT_OPCODE = opcode_id(FLT)
+FGT_OPCODE = opcode_id(FGT)
+FLE_OPCODE = opcode_id(FLE)
+FGE_OPCODE = opcode_id(FGE)
+
+ALLOC_OPCODE = opcode_id(ALLOC)
+FREE_OPCODE = opcode_id(FREE)
+LOAD_OPCODE = opcode_id(LOAD)
+STORE_OPCODE = opcode_id(STORE)
+PTRADD_OPCODE = opcode_id(PTRADD)
+
+SPECULATE_OPCODE = opcode_id(SPECULATE)
+GUARD_OPCODE = opcode_id(GUARD)
+COMMIT_OPCODE = opcode_id(COMMIT)
+
+VECZERO_OPCODE = opcode_id(VECZERO)
+VECLOAD_OPCODE = opcode_id(VECLOAD)
+VECSTORE_OPCODE = opcode_id(VECSTORE)
+VECADD_OPCODE = opcode_id(VECADD)
+VECSUB_OPCODE = opcode_id(VECSUB)
+VECMUL_OPCODE = opcode_id(VECMUL)
+VECDIV_OPCODE = opcode_id(VECDIV)
+VECMAC_OPCODE = opcode_id(VECMAC)
+VECNEG_OPCODE = opcode_id(VECNEG)
+VECMOVE_OPCODE = opcode_id(VECMOVE)
+
+VECTOR_INSTRS = [*VEC_OPS, VECLOAD, VECSTORE, VECZERO]
+
+INTERPRETED_OPCODES = frozenset(
+    opcode_id(op) for op in [*BRIL_CORE_INSTRS, *FLOAT_OPS, *FLOAT_COMP_OPS,
+                             *MEM_OPS, *SPEC_OPS, *VECTOR_INSTRS])
+
+
+def wrap_int(n):
+    """
+    n wrapped around to a 64 bit two's complement integer
+    """
+    n &= (1 << 64) - 1
+    if n > INT_MAX:
+        return n - (1 << 64)
+    return n
+
+
+def int_div(n, d):
+    """
+    Bril integer division, which truncates towards 0
+    """
+    if d == 0:
+        raise RuntimeError(f"Division by zero.")
+    q = abs(n) // abs(d)
+    if (n < 0) != (d < 0):
+        q = -q
+    if q > INT_MAX:
+        # INT_MIN / -1
+        q = wrap_int(q)
+    return q
+
+
+def float_div(n, d):
+    """
+    IEEE floating point division, as in JavaScript, instead of raising on 0
+    """
+    if d != 0:
+        return n / d
+    if n == 0 or n != n:
+        return float("nan")
+    if (n < 0) != (math.copysign(1, d) < 0):
+        return float("-inf")
+    return float("inf")
+
+
+class Pointer(object):
+    """
+    Pointer to offset within the heap allocation base
+    """
+    __slots__ = ("base", "offset")
+
+    def __init__(self, base, offset) -> None:
+        self.base = base
+        self.offset = offset
+
+    def __repr__(self):
+        return f"Pointer({self.base}, {self.offset})"
+
+
+def format_value(val):
+    """
+    Value as printed by brili
+    """
+    if val == None:
+        raise RuntimeError(f"Undefined variable in print.")
+    typ = type(val)
+    if typ == bool:
+        return "true" if val else "false"
+    if typ == float:
+        if val != val:
+            return "NaN"
+        if val in [float("inf"), float("-inf")]:
+            return "Infinity" if val > 0 else "-Infinity"
+        return f"{val:.17f}"
+    if typ == list:
+        return "[" + ",".join(str(e) for e in val) + "]"
+    return str(val)
+
+
+def check_lane(lane):
+    if not (0 <= lane < VECTOR_LANE_WIDTH):
+        raise RuntimeError(f"Vector index was out of bounds {lane}.")
+
+
+class ListVectorEngine(object):
+    """
+    Executes vector operations on vectors stored as Python lists, updated in
+    place by vecload as brili-vc does
+
+    Other vector engines (see bril_vector_engine.py) provide the same
+    methods, and their vectors print as brili-vc prints vectors.
+    """
+
+    def __init__(self) -> None:
+        self.vectors_created = 0
+
+    def zero(self):
+        self.vectors_created += 1
+        return [0] * VECTOR_LANE_WIDTH
+
+    def load(self, vec, lane, val):
+        check_lane(lane)
+        vec[lane] = val
+
+    def store(self, vec, lane):
+        check_lane(lane)
+        return vec[lane]
+
+    def add(self, vec1, vec2):
+        return [wrap_int(x + y) for x, y in zip(vec1, vec2)]
+
+    def sub(self, vec1, vec2):
+        return [wrap_int(x - y) for x, y in zip(vec1, vec2)]
+
+    def mul(self, vec1, vec2):
+        return [wrap_int(x * y) for x, y in zip(vec1, vec2)]
+
+    def div(self, vec1, vec2):
+        return [int_div(x, y) for x, y in zip(vec1, vec2)]
+
+    def mac(self, vec1, vec2, vec3):
+        return [wrap_int(x * y + z) for x, y, z in zip(vec1, vec2, vec3)]
+
+    def neg(self, vec):
+        return [wrap_int(-x) for x in vec]
+
+    def move(self, vec):
+        return list(vec)
+
+
+class DecodedFunction(object):
+    """
+    A function decoded for execution; code is a list of
+    (opcode, dest, arg1, arg2, aux) tuples, slots maps variable names to
+    their index in the list of values of a call, and args is a list of
+    (name, type) pairs
+    """
+    __slots__ = ("name", "code", "slots", "args", "param_slots", "type")
+
+    def __init__(self, name, code, slots, args, param_slots, type) -> None:
+        self.name = name
+        self.code = code
+        self.slots = slots
+        self.args = args
+        self.param_slots = param_slots
+        self.type = type
+
+    def __repr__(self):
+        return f"DecodedFunction({self.name}, {len(self.code)} instructions)"
+
+
+def block_names(instrs):
+    """
+    Dictionary from the index of the first instruction of every basic block
+    of instrs to the name of the block, the same blocks and names as
+    cfg.form_block_dict(cfg.form_blocks(instrs))
+    """
+    names = OrderedDict()
+    in_block = False
+    for i, instr in enumerate(instrs):
+        if instr.opcode == LABEL_OPCODE:
+            names[i] = instr.label
+            in_block = True
+            continue
+        if not in_block:
+            names[i] = f"b{len(names)}"
+            in_block = True
+        if instr.opcode in TERMINATOR_OPCODES:
+            in_block = False
+    return names
+
+
+def decode_function(func, profile_blocks=False):
+    """
+    Decodes bril_ir Function func for execution
+
+    Label pseudo instructions are only kept in functions with phis, where
+    executing them records the label control came from; otherwise jumps go
+    straight to the instruction after the label. With profile_blocks, a
+    block pseudo instruction, whose aux is (function name, block name),
+    starts every basic block, and the aux of a call ends with the index of
+    the call among the calls of the function.
+    """
+    slots = OrderedDict()
+
+    def slot(name):
+        if name not in slots:
+            slots[name] = len(slots)
+        return slots[name]
+
+    param_slots = [slot(name) for (name, _) in (func.args or [])]
+    keep_labels = any(instr.opcode == PHI_OPCODE for instr in func.instrs)
+
+    blocks = block_names(func.instrs) if profile_blocks else dict()
+
+    label_pcs = dict()
+    pc = 0
+    for i, instr in enumerate(func.instrs):
+        if i in blocks:
+            # a label always starts a block, so jumps go to its block
+            # pseudo instruction
+            pc += 1
+        if instr.opcode == LABEL_OPCODE:
+            label_pcs[instr.label] = pc - 1 if i in blocks else pc
+            if not keep_labels:
+                continue
+        pc += 1
+
+    def target(label):
+        if label not in label_pcs:
+            raise RuntimeError(f"Label {label} not found in function {func.name}.")
+        return label_pcs[label]
+
+    code = []
+    num_calls = 0
+    for i, instr in enumerate(func.instrs):
+        if i in blocks:
+            code.append((BLOCK_OPCODE, None, None, None, (func.name, blocks[i])))
+        op = instr.opcode
+        if op == LABEL_OPCODE:
+            if keep_labels:
+                code.append((LABEL_OPCODE, None, None, None, instr.label))
+            continue
+        if op not in INTERPRETED_OPCODES:
+            raise RuntimeError(f"Unknown opcode {OPCODE_NAMES[op]}.")
+
+        dest = slot(instr.dest) if instr.dest != None else None
+        args = tuple(slot(a) for a in (instr.args or []))
+        arg1 = args[0] if len(args) > 0 else None
+        arg2 = args[1] if len(args) > 1 else None
+        aux = None
+        if op == CONST_OPCODE:
+            aux = instr.value
+            if instr.type == FLOAT:
+                aux = float(aux)
+            elif instr.type == INT:
+                aux = int(aux)
+        elif op == JMP_OPCODE or op == GUARD_OPCODE:
+            aux = target(instr.labels[0])
+        elif op == BR_OPCODE:
+            aux = (target(instr.labels[0]), target(instr.labels[1]))
+        elif op == CALL_OPCODE:
+            aux = (instr.funcs[0], args, num_calls)
+            num_calls += 1
+        elif op == PRINT_OPCODE:
+            aux = args
+        elif op == PHI_OPCODE:
+            aux = dict()
+            for (a, label) in zip(args, instr.labels or []):
+                aux.setdefault(label, a)
+        elif op == VECLOAD_OPCODE or op == VECMAC_OPCODE:
+            aux = args[2]
+        code.append((op, dest, arg1, arg2, aux))
+    code.append((END_OPCODE, None, None, None, None))
+
+    return DecodedFunction(func.name, code, slots, func.args or [], param_slots, func.type)
+
+
+def decode_prog(prog, profile_blocks=False):
+    """
+    Decodes Bril JSON program prog for execution, into a dictionary from
+    function names to decoded functions
+    """
+    program = bril_ir.from_json(prog)
+    funcs = OrderedDict()
+    for func in program.functions:
+        if func.name in funcs:
+            raise RuntimeError(f"Multiple functions named {func.name}.")
+        funcs[func.name] = decode_function(func, profile_blocks)
+    return funcs
+
+
+def parse_main_args(func, args):
+    if len(args) != len(func.param_slots):
+        raise RuntimeError(
+            f"Mismatched main argument arity: expected {len(func.param_slots)}; got {len(args)}.")
+    values = []
+    for (_, typ), arg in zip(func.args, args):
+        if typ == INT:
+            values.append(int(arg))
+        elif typ == FLOAT:
+            values.append(float(arg))
+        elif typ == BOOL:
+            if arg not in ["true", "false"]:
+                raise RuntimeError(
+                    f"Boolean argument to main must be 'true'/'false'; got {arg}.")
+            values.append(arg == "true")
+        else:
+            raise RuntimeError(f"Unsupported main argument type {typ}.")
+    return values
+
+
+class Profile(object):
+    """
+    Dynamic counts of an execution; op_counts maps opcodes to how often they
+    executed, most executed first, and vector_dyn_inst counts the executed
+    vector instructions
+    """
+
+    def __init__(self, total_dyn_inst, op_counts, vectors_created) -> None:
+        self.total_dyn_inst = total_dyn_inst
+        self.op_counts = op_counts
+        self.vectors_created = vectors_created
+        self.vector_dyn_inst = sum(op_counts.get(op, 0) for op in VECTOR_INSTRS)
+        self.scalar_dyn_inst = total_dyn_inst - self.vector_dyn_inst
+
+    def __repr__(self):
+        return f"Profile({self.total_dyn_inst} instructions)"
+
+
+class BlockProfile(object):
+    """
+    Execution counts of basic blocks, keyed by (function, block), of CFG
+    edges, keyed by (function, source block, target block), and of call
+    sites, keyed by (function, index of the call among the calls of the
+    function)
+    """
+
+    def __init__(self) -> None:
+        self.block_counts = OrderedDict()
+        self.edge_counts = OrderedDict()
+        self.call_counts = OrderedDict()
+
+    def add_function(self, func):
+        """
+        Adds a count of 0 for every block and call site of decoded function
+        func, so blocks and call sites that never execute are recorded too
+        """
+        for (op, _, _, _, aux) in func.code:
+            if op == BLOCK_OPCODE:
+                self.block_counts[aux] = 0
+            elif op == CALL_OPCODE:
+                self.call_counts[(func.name, aux[2])] = 0
+
+    def __repr__(self):
+        return f"BlockProfile({len(self.block_counts)} blocks)"
+
+
+def execute(funcs, main_values, out, vectors, block_profile=None):
+    """
+    Runs main of decoded functions funcs on main_values, writing printed
+    lines to out and running vector operations on vector engine vectors,
+    and returns the list of executions per opcode
+
+    Block, edge and call site counts are added to block_profile, if any.
+    """
+    write = out.write
+    counts = [0] * (len(OPCODE_NAMES) + 3)
+    if block_profile != None:
+        block_counts = block_profile.block_counts
+        edge_counts = block_profile.edge_counts
+        call_counts = block_profile.call_counts
+    else:
+        call_counts = None
+    prev_block = None
+    heap = dict()
+    next_base = 0
+
+    func = funcs[MAIN]
+    code = func.code
+    env = [None] * len(func.slots)
+    for s, val in zip(func.param_slots, main_values):
+        env[s] = val
+    pc = 0
+    last_label = None
+    cur_label = None
+    frames = []
+    speculations = []
+
+    while True:
+        (op, dest, a, b, aux) = code[pc]
+        counts[op] += 1
+        pc += 1
+        if op == CONST_OPCODE:
+            env[dest] = aux
+        elif op == ADD_OPCODE:
+            val = env[a] + env[b]
+            if val > INT_MAX or val < INT_MIN:
+                val = wrap_int(val)
+            env[dest] = val
+        elif op == BR_OPCODE:
+            if env[a]:
+                pc = aux[0]
+            else:
+                pc = aux[1]
+        elif op == JMP_OPCODE:
+            pc = aux
+        elif op == LT_OPCODE:
+            env[dest] = env[a] < env[b]
+        elif op == ID_OPCODE:
+            env[dest] = env[a]
+        elif op == LOAD_OPCODE:
+            ptr = env[a]
+            data = heap.get(ptr.base)
+            if data == None or not (0 <= ptr.offset < len(data)):
+                raise RuntimeError(f"Load from illegal memory location {ptr}.")
+            val = data[ptr.offset]
+            if val == None:
+                raise RuntimeError(f"Load from uninitialized memory location {ptr}.")
+            env[dest] = val
+        elif op == PTRADD_OPCODE:
+            ptr = env[a]
+            env[dest] = Pointer(ptr.base, ptr.offset + env[b])
+        elif op == MUL_OPCODE:
+            val = env[a] * env[b]
+            if val > INT_MAX or val < INT_MIN:
+                val = wrap_int(val)
+            env[dest] = val
+        elif op == SUB_OPCODE:
+            val = env[a] - env[b]
+            if val > INT_MAX or val < INT_MIN:
+                val = wrap_int(val)
+            env[dest] = val
+        elif op == EQ_OPCODE:
+            env[dest] = env[a] == env[b]
+        elif op == STORE_OPCODE:
+            ptr = env[a]
+            data = heap.get(ptr.base)
+            if data == None or not (0 <= ptr.offset < len(data)):
+                raise RuntimeError(f"Store to illegal memory location {ptr}.")
+            data[ptr.offset] = env[b]
+        elif op == GT_OPCODE:
+            env[dest] = env[a] > env[b]
+        elif op == LE_OPCODE:
+            env[dest] = env[a] <= env[b]
+        elif op == GE_OPCODE:
+            env[dest] = env[a] >= env[b]
+        elif op == DIV_OPCODE:
+            env[dest] = int_div(env[a], env[b])
+        elif op == NOT_OPCODE:
+            env[dest] = not env[a]
+        elif op == AND_OPCODE:
+            env[dest] = env[a] and env[b]
+        elif op == OR_OPCODE:
+            env[dest] = env[a] or env[b]
+        elif op == LABEL_OPCODE:
+            last_label = cur_label
+            cur_label = aux
+        elif op == PHI_OPCODE:
+            src = aux.get(last_label)
+            env[dest] = env[src] if src != None else None
+        elif op == FADD_OPCODE:
+            env[dest] = env[a] + env[b]
+        elif op == FSUB_OPCODE:
+            env[dest] = env[a] - env[b]
+        elif op == FMUL_OPCODE:
+            env[dest] = env[a] * env[b]
+        elif op == FDIV_OPCODE:
+            env[dest] = float_div(env[a], env[b])
+        elif op == FEQ_OPCODE:
+            env[dest] = env[a] == env[b]
+        elif op == FLT_OPCODE:
+            env[dest] = env[a] < env[b]
+        elif op == FGT_OPCODE:
+            env[dest] = env[a] > env[b]
+        elif op == FLE_OPCODE:
+            env[dest] = env[a] <= env[b]
+        elif op == FGE_OPCODE:
+            env[dest] = env[a] >= env[b]
+        elif op == CALL_OPCODE:
+            if speculations != []:
+                raise RuntimeError(f"Call not allowed during speculation.")
+            (callee_name, arg_slots, call_site) = aux
+            if call_counts != None:
+                call_counts[(func.name, call_site)] += 1
+            if callee_name not in funcs:
+                raise RuntimeError(f"No function named {callee_name}.")
+            callee = funcs[callee_name]
+            if len(arg_slots) != len(callee.param_slots):
+                raise RuntimeError(
+                    f"Function {callee_name} expected {len(callee.param_slots)} arguments, got {len(arg_slots)}.")
+            callee_env = [None] * len(callee.slots)
+            for s, arg_slot in zip(callee.param_slots, arg_slots):
+                callee_env[s] = env[arg_slot]
+            frames.append((func, env, pc, dest, last_label, cur_label, prev_block))
+            func = callee
+            code = callee.code
+            env = callee_env
+            pc = 0
+            last_label = None
+            cur_label = None
+            prev_block = None
+        elif op == RET_OPCODE or op == END_OPCODE:
+            if speculations != []:
+                raise RuntimeError(f"Return not allowed during speculation.")
+            val = env[a] if a != None else None
+            if frames == []:
+                break
+            (func, env, pc, dest, last_label, cur_label, prev_block) = frames.pop()
+            code = func.code
+            if dest != None:
+                if val == None:
+                    raise RuntimeError(f"Non-void function returned nothing.")
+                env[dest] = val
+        elif op == PRINT_OPCODE:
+            write(" ".join([format_value(env[s]) for s in aux]) + "\n")
+        elif op == NOP_OPCODE:
+            pass
+        elif op == ALLOC_OPCODE:
+            size = env[a]
+            if size <= 0:
+                raise RuntimeError(f"Must allocate a positive amount of memory: {size} <= 0.")
+            heap[next_base] = [None] * size
+            env[dest] = Pointer(next_base, 0)
+            next_base += 1
+        elif op == FREE_OPCODE:
+            ptr = env[a]
+            if ptr.offset != 0 or ptr.base not in heap:
+                raise RuntimeError(f"Tried to free illegal memory location {ptr}.")
+            del heap[ptr.base]
+        elif op == SPECULATE_OPCODE:
+            speculations.append((env, last_label, cur_label, prev_block))
+            env = list(env)
+        elif op == GUARD_OPCODE:
+            if not env[a]:
+                if speculations == []:
+                    raise RuntimeError(f"Abort in non-speculative state.")
+                # instructions executed speculatively stay counted
+                (env, last_label, cur_label, prev_block) = speculations.pop()
+                pc = aux
+        elif op == COMMIT_OPCODE:
+            if speculations == []:
+                raise RuntimeError(f"Commit in non-speculative state.")
+            speculations = []
+        elif op == VECZERO_OPCODE:
+            env[dest] = vectors.zero()
+        elif op == VECLOAD_OPCODE:
+            vectors.load(env[a], env[b], env[aux])
+        elif op == VECSTORE_OPCODE:
+            env[dest] = vectors.store(env[a], env[b])
+        elif op == VECADD_OPCODE:
+            env[dest] = vectors.add(env[a], env[b])
+        elif op == VECSUB_OPCODE:
+            env[dest] = vectors.sub(env[a], env[b])
+        elif op == VECMUL_OPCODE:
+            env[dest] = vectors.mul(env[a], env[b])
+        elif op == VECDIV_OPCODE:
+            env[dest] = vectors.div(env[a], env[b])
+        elif op == VECMAC_OPCODE:
+            env[dest] = vectors.mac(env[a], env[b], env[aux])
+        elif op == VECNEG_OPCODE:
+            env[dest] = vectors.neg(env[a])
+        elif op == VECMOVE_OPCODE:
+            env[dest] = vectors.move(env[a])
+        elif op == BLOCK_OPCODE:
+            block_counts[aux] += 1
+            if prev_block != None:
+                edge = (aux[0], prev_block, aux[1])
+                edge_counts[edge] = edge_counts.get(edge, 0) + 1
+            prev_block = aux[1]
+        else:
+            raise RuntimeError(f"Unhandled opcode {OPCODE_NAMES[op]}.")
+
+    if len(heap) > 0:
+        raise RuntimeError(f"Some memory locations have not been freed by end of execution.")
+    return counts
+
+
+def interpret(prog, args=(), out=None, vectors=None, block_profile=None):
+    """
+    Runs Bril JSON program prog with command line arguments args for main,
+    writing printed lines to out (stdout by default) and running vector
+    operations on vector engine vectors (a ListVectorEngine by default), and
+    returns the Profile of the execution
+
+    If block_profile is a BlockProfile, block, edge and call site counts
+    are collected into it.
+    """
+    if out == None:
+        out = sys.stdout
+    if vectors == None:
+        vectors = ListVectorEngine()
+    funcs = decode_prog(prog, block_profile != None)
+    if MAIN not in funcs:
+        raise RuntimeError(f"No main function defined.")
+    if block_profile != None:
+        for func in funcs.values():
+            block_profile.add_function(func)
+    main_values = parse_main_args(funcs[MAIN], list(args))
+    counts = execute(funcs, main_values, out, vectors, block_profile)
+
+    # the label, end and block pseudo instructions are not counted
+    op_counts = OrderedDict()
+    for opcode in sorted(range(len(OPCODE_NAMES)), key=lambda o: -counts[o]):
+        if counts[opcode] > 0:
+            op_counts[OPCODE_NAMES[opcode]] = counts[opcode]
+    return Profile(sum(op_counts.values()), op_counts, vectors.vectors_created)
+
+
+@click.command(context_settings={"ignore_unknown_options": True})
+@click.option('-p', '--profile', is_flag=True, help='Print the Total Dynamic Instruction Count to stderr.')
+@click.option('-v', '--count-vectors', is_flag=True, help='Print the Number of Vectors Created to stderr.')
+@click.option('--op-counts', is_flag=True, help='Print Dynamic Counts per Opcode to stderr.')
+@click.option('--numpy-vectors', is_flag=True, help='Run Vector Operations on a NumPy Register File.')
+@click.argument('args', nargs=-1, type=click.UNPROCESSED)
+def main(profile, count_vectors, op_counts, numpy_vectors, args):
+    prog = json.load(sys.stdin)
+    vectors = None
+    if numpy_vectors:
+        from bril_vector_engine import VectorRegisterFile
+        vectors = VectorRegisterFile()
+    try:
+        result = interpret(prog, args, vectors=vectors)
+    except RuntimeError as e:
+        sys.stdout.flush()
+        print(f"error: {e}", file=sys.stderr)
+        sys.exit(2)
+    if profile:
+        print(f"total_dyn_inst: {result.total_dyn_inst}", file=sys.stderr)
+    if count_vectors:
+        print(f"total_vectors_created: {result.vectors_created}", file=sys.stderr)
+        print(f"total_vector_inst: {result.vector_dyn_inst}", file=sys.stderr)
+        print(f"total_scalar_inst: {result.scalar_dyn_inst}", file=sys.stderr)
+    if op_counts:
+        for op, count in result.op_counts.items():
+            print(f"{op}: {count}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+"""
+Compact Bril IR
+
+An optional typed in memory representation of Bril programs, as an
+alternative to the raw JSON dictionaries every pass manipulates.
+
+Program, Function, BasicBlock and Instr use __slots__, so an instruction is a
+handful of attributes rather than a dictionary, and fields are read with
+attribute access rather than `KEY in instr` tests and dictionary lookups.
+Opcodes are small integers (see OPCODE_IDS / OPCODE_NAMES), and variable,
+label and function names are interned, so equal names share one string and
+compare by identity first.
+
+Conversion from and to Bril JSON is loss free: absent fields stay absent
+(None), and keys the IR does not know about (e.g. source positions) are kept
+in an extras dictionary and written back out.
+
+Usage:
+    bril2json < prog.bril | python3 bril_ir.py --check=True
+"""
+
+import sys
+import json
+import click
+from collections import OrderedDict
+
+from bril_core_constants import *
+from bril_float_constants import *
+from bril_memory_extension_constants import *
+from bril_speculation_constants import *
+from bril_vector_constants import *
+
+
+# opcode name <-> opcode id
+OPCODE_NAMES = []
+OPCODE_IDS = dict()
+
+
+def opcode_id(op):
+    """
+    Integer id of opcode op, registering op if it is new
+    """
+    if op not in OPCODE_IDS:
+        OPCODE_IDS[op] = len(OPCODE_NAMES)
+        OPCODE_NAMES.append(sys.intern(op))
+    return OPCODE_IDS[op]
+
+
+for _op in [*BRIL_CORE_INSTRS, *FLOAT_OPS, *FLOAT_COMP_OPS, *MEM_OPS, *SPEC_OPS,
+            *VEC_OPS, VECLOAD, VECSTORE, VECZERO]:
+    opcode_id(_op)
+
+
+# opcode of a label pseudo instruction
+LABEL_OPCODE = -1
+
+TERMINATOR_OPCODES = frozenset(OPCODE_IDS[op] for op in TERMINATORS)
+JUMP_OPCODES = frozenset([OPCODE_IDS[JMP], OPCODE_IDS[BR]])
+PHI_OPCODE = OPCODE_IDS[PHI]
+CONST_OPCODE = OPCODE_IDS[CONST]
+
+INSTR_KEYS = frozenset([LABEL, OP, DEST, TYPE, ARGS, FUNCS, LABELS, VALUE])
+FUNCTION_KEYS = frozenset([NAME, ARGS, TYPE, INSTRS])
+PROGRAM_KEYS = frozenset([FUNCTIONS])
+
+
+def intern_type(typ):
+    if type(typ) == str:
+        return sys.intern(typ)
+    return typ
+
+
+def intern_names(names):
+    if names == None:
+        return None
+    return [sys.intern(n) for n in names]
+
+
+def get_extras(d, known_keys):
+    extras = None
+    for key in d:
+        if key not in known_keys:
+            if extras == None:
+                extras = dict()
+            extras[key] = d[key]
+    return extras
+
+
+class Instr(object):
+    """
+    A Bril instruction, or label pseudo instruction (opcode LABEL_OPCODE)
+
+    Fields absent from the JSON instruction are None.
+    """
+    __slots__ = ("opcode", "dest", "type", "args", "funcs",
+                 "labels", "value", "label", "extras")
+
+    def __init__(self, opcode, dest=None, type=None, args=None, funcs=None,
+                 labels=None, value=None, label=None, extras=None) -> None:
+        self.opcode = opcode
+        self.dest = dest
+        self.type = type
+        self.args = args
+        self.funcs = funcs
+        self.labels = labels
+        self.value = value
+        self.label = label
+        self.extras = extras
+
+    @staticmethod
+    def from_json(instr):
+        assert type(instr) == dict
+        extras = get_extras(instr, INSTR_KEYS)
+        if LABEL in instr:
+            return Instr(LABEL_OPCODE, label=sys.intern(instr[LABEL]), extras=extras)
+        dest = instr.get(DEST)
+        return Instr(opcode_id(instr[OP]),
+                     dest=sys.intern(dest) if dest != None else None,
+                     type=intern_type(instr.get(TYPE)),
+                     args=intern_names(instr.get(ARGS)),
+                     funcs=intern_names(instr.get(FUNCS)),
+                     labels=intern_names(instr.get(LABELS)),
+                     value=instr.get(VALUE),
+                     extras=extras)
+
+    def to_json(self):
+        if self.opcode == LABEL_OPCODE:
+            out = {LABEL: self.label}
+        else:
+            out = {OP: OPCODE_NAMES[self.opcode]}
+            if self.dest != None:
+                out[DEST] = self.dest
+            if self.type != None:
+                out[TYPE] = self.type
+            if self.args != None:
+                out[ARGS] = list(self.args)
+            if self.funcs != None:
+                out[FUNCS] = list(self.funcs)
+            if self.labels != None:
+                out[LABELS] = list(self.labels)
+            if self.value != None:
+                out[VALUE] = self.value
+        if self.extras != None:
+            out.update(self.extras)
+        return out
+
+    @property
+    def op(self):
+        if self.opcode == LABEL_OPCODE:
+            return None
+        return OPCODE_NAMES[self.opcode]
+
+    def is_label(self):
+        return self.opcode == LABEL_OPCODE
+
+    def is_terminator(self):
+        return self.opcode in TERMINATOR_OPCODES
+
+    def copy(self):
+        """
+        Copy of the instruction, with its own argument, function and label
+        lists; a cheap replacement for deepcopy
+        """
+        return Instr(self.opcode,
+                     dest=self.dest,
+                     type=self.type,
+                     args=list(self.args) if self.args != None else None,
+                     funcs=list(self.funcs) if self.funcs != None else None,
+                     labels=list(self.labels) if self.labels != None else None,
+                     value=self.value,
+                     label=self.label,
+                     extras=dict(self.extras) if self.extras != None else None)
+
+    def __repr__(self):
+        return f"Instr({self.to_json()})"
+
+
+class BasicBlock(object):
+    """
+    A named basic block of a function, with the names of its predecessors
+    and successors
+    """
+    __slots__ = ("name", "instrs", "preds", "succs")
+
+    def __init__(self, name, instrs, preds=None, succs=None) -> None:
+        self.name = name
+        self.instrs = instrs
+        self.preds = preds if preds != None else []
+        self.succs = succs if succs != None else []
+
+    def __repr__(self):
+        return f"BasicBlock({self.name}, preds={self.preds}, succs={self.succs})"
+
+
+class Function(object):
+    """
+    A Bril function; args is a list of (name, type) pairs, and type is the
+    return type, or None
+    """
+    __slots__ = ("name", "args", "type", "instrs", "arg_extras", "extras")
+
+    def __init__(self, name, args=None, type=None, instrs=None,
+                 arg_extras=None, extras=None) -> None:
+        self.name = name
+        self.args = args
+        self.type = type
+        self.instrs = instrs if instrs != None else []
+        self.arg_extras = arg_extras
+        self.extras = extras
+
+    @staticmethod
+    def from_json(func):
+        assert type(func) == dict
+        args = None
+        arg_extras = None
+        if ARGS in func:
+            args = []
+            for a in func[ARGS]:
+                args.append((sys.intern(a[NAME]), intern_type(a[TYPE])))
+                a_extras = get_extras(a, frozenset([NAME, TYPE]))
+                if a_extras != None:
+                    if arg_extras == None:
+                        arg_extras = dict()
+                    arg_extras[len(args) - 1] = a_extras
+        return Function(sys.intern(func[NAME]),
+                        args=args,
+                        type=intern_type(func.get(TYPE)),
+                        instrs=[Instr.from_json(i) for i in func.get(INSTRS, [])],
+                        arg_extras=arg_extras,
+                        extras=get_extras(func, FUNCTION_KEYS))
+
+    def to_json(self):
+        out = {NAME: self.name}
+        if self.args != None:
+            out[ARGS] = []
+            for i, (name, typ) in enumerate(self.args):
+                a = {NAME: name, TYPE: typ}
+                if self.arg_extras != None and i in self.arg_extras:
+                    a.update(self.arg_extras[i])
+                out[ARGS].append(a)
+        if self.type != None:
+            out[TYPE] = self.type
+        out[INSTRS] = [i.to_json() for i in self.instrs]
+        if self.extras != None:
+            out.update(self.extras)
+        return out
+
+    def form_blocks(self):
+        """
+        Splits the body into basic blocks, exactly as cfg.form_blocks does
+        """
+        blocks = []
+        cur_block = []
+        for instr in self.instrs:
+            if instr.opcode != LABEL_OPCODE:
+                cur_block.append(instr)
+                if instr.opcode in TERMINATOR_OPCODES:
+                    blocks.append(cur_block)
+                    cur_block = []
+            else:
+                if cur_block:
+                    blocks.append(cur_block)
+                cur_block = [instr]
+        if cur_block:
+            blocks.append(cur_block)
+        return blocks
+
+    def form_cfg(self):
+        """
+        Basic blocks of the function, by name, with predecessors and
+        successors; names and successors follow cfg.form_block_dict and
+        cfg.get_cfg, and labels are retained in the blocks
+        """
+        out = OrderedDict()
+        for i, block in enumerate(self.form_blocks()):
+            if block[0].opcode == LABEL_OPCODE:
+                name = block[0].label
+            else:
+                name = f"b{i}"
+            out[name] = BasicBlock(name, block)
+
+        names = list(out.keys())
+        for i, (name, bb) in enumerate(out.items()):
+            last = bb.instrs[-1]
+            if last.opcode in JUMP_OPCODES:
+                bb.succs = list(last.labels)
+            elif last.opcode == OPCODE_IDS[RET] or i == len(names) - 1:
+                bb.succs = []
+            else:
+                bb.succs = [names[i + 1]]
+        for name, bb in out.items():
+            for succ in bb.succs:
+                if succ in out and name not in out[succ].preds:
+                    out[succ].preds.append(name)
+        return out
+
+    def __repr__(self):
+        return f"Function({self.name}, {len(self.instrs)} instrs)"
+
+
+class Program(object):
+    """
+    A Bril program: a list of functions
+    """
+    __slots__ = ("functions", "extras")
+
+    def __init__(self, functions=None, extras=None) -> None:
+        self.functions = functions if functions != None else []
+        self.extras = extras
+
+    @staticmethod
+    def from_json(prog):
+        assert type(prog) == dict
+        return Program([Function.from_json(f) for f in prog[FUNCTIONS]],
+                       extras=get_extras(prog, PROGRAM_KEYS))
+
+    def to_json(self):
+        out = {FUNCTIONS: [f.to_json() for f in self.functions]}
+        if self.extras != None:
+            out.update(self.extras)
+        return out
+
+    def get_function(self, name):
+        for f in self.functions:
+            if f.name == name:
+                return f
+        raise RuntimeError(f"No function named {name}.")
+
+    def __repr__(self):
+        return f"Program({[f.name for f in self.functions]})"
+
+
+def from_json(prog):
+    return Program.from_json(prog)
+
+
+def to_json(program):
+    return program.to_json()
+
+
+@click.command()
+@click.option('--check', default=False, help='Check that Conversion to the IR and back is Loss Free.')
+@click.option('--pretty-print', default=False, help='Pretty Print Original Program.')
+def main(check, pretty_print):
+    prog = json.load(sys.stdin)
+    if pretty_print:
+        print(json.dumps(prog, indent=4, sort_keys=True))
+    final_prog = to_json(from_json(prog))
+    if check and final_prog != prog:
+        raise RuntimeError(f"Conversion of program to IR and back is lossy.")
+    print(json.dumps(final_prog))
+
+
+if __name__ == "__main__":
+    main()
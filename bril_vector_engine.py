@@ -0,0 +1,140 @@
+"""
+NumPy Vector Engine
+
+Executes the vector extension (see bril_vector_constants.py) for
+bril_interpreter.py, with vector registers stored as contiguous rows of a
+NumPy int64 register file. Vector operations are NumPy operations on whole
+rows, written straight into the destination row, rather than Python loops
+over lanes, and int64 arithmetic wraps around just like Bril ints.
+
+A vector value is a VectorRegister handle on a row. As in brili-vc, handles
+are shared rather than copied by id, phis and calls, so a vecload into a
+vector is seen through every variable holding it. A row is recycled as soon
+as the last handle on it is dropped, so the register file only grows with
+the number of live vectors.
+
+Usage:
+    bril2json < prog.bril | python3 bril_interpreter.py --numpy-vectors -v
+"""
+
+import numpy as np
+
+from bril_vector_constants import VECTOR_LANE_WIDTH
+
+
+INITIAL_NUM_REGISTERS = 64
+
+
+class VectorRegister(object):
+    """
+    Handle on row index of register_file; prints as brili-vc prints vectors
+    """
+    __slots__ = ("index", "register_file")
+
+    def __init__(self, index, register_file) -> None:
+        self.index = index
+        self.register_file = register_file
+
+    def __del__(self):
+        self.register_file.free_registers.append(self.index)
+
+    def __str__(self):
+        return "[" + ",".join(str(e) for e in self.register_file.rows[self.index]) + "]"
+
+    def __repr__(self):
+        return f"VectorRegister({self.index}, {self})"
+
+
+class VectorRegisterFile(object):
+    """
+    Vector engine for bril_interpreter.py, with the same methods as
+    bril_interpreter.ListVectorEngine
+    """
+
+    def __init__(self, num_registers=INITIAL_NUM_REGISTERS, width=VECTOR_LANE_WIDTH) -> None:
+        self.rows = np.zeros((num_registers, width), dtype=np.int64)
+        self.free_registers = list(reversed(range(num_registers)))
+        self.width = width
+        self.vectors_created = 0
+
+    def allocate(self):
+        """
+        Handle on an unused register, doubling the register file when every
+        register is in use
+        """
+        if self.free_registers == []:
+            num_registers = self.rows.shape[0]
+            self.rows = np.concatenate(
+                [self.rows, np.zeros((num_registers, self.width), dtype=np.int64)])
+            self.free_registers = list(
+                reversed(range(num_registers, 2 * num_registers)))
+        return VectorRegister(self.free_registers.pop(), self)
+
+    def check_lane(self, lane):
+        if not (0 <= lane < self.width):
+            raise RuntimeError(f"Vector index was out of bounds {lane}.")
+
+    def zero(self):
+        dest = self.allocate()
+        self.rows[dest.index] = 0
+        self.vectors_created += 1
+        return dest
+
+    def load(self, vec, lane, val):
+        self.check_lane(lane)
+        self.rows[vec.index, lane] = val
+
+    def store(self, vec, lane):
+        self.check_lane(lane)
+        return int(self.rows[vec.index, lane])
+
+    def binop(self, ufunc, vec1, vec2):
+        dest = self.allocate()
+        rows = self.rows
+        ufunc(rows[vec1.index], rows[vec2.index], out=rows[dest.index])
+        return dest
+
+    def add(self, vec1, vec2):
+        return self.binop(np.add, vec1, vec2)
+
+    def sub(self, vec1, vec2):
+        return self.binop(np.subtract, vec1, vec2)
+
+    def mul(self, vec1, vec2):
+        return self.binop(np.multiply, vec1, vec2)
+
+    def div(self, vec1, vec2):
+        """
+        Lane wise division, truncating towards 0 like Bril's div
+        """
+        rows = self.rows
+        numerator = rows[vec1.index]
+        denominator = rows[vec2.index]
+        if not denominator.all():
+            raise RuntimeError(f"Division by zero.")
+        dest = self.allocate()
+        rows = self.rows
+        quotient = rows[dest.index]
+        np.floor_divide(numerator, denominator, out=quotient)
+        # floor division rounds down where truncation rounds up
+        inexact = (numerator - quotient * denominator) != 0
+        quotient += inexact & ((numerator < 0) != (denominator < 0))
+        return dest
+
+    def mac(self, vec1, vec2, vec3):
+        dest = self.allocate()
+        rows = self.rows
+        np.multiply(rows[vec1.index], rows[vec2.index], out=rows[dest.index])
+        np.add(rows[dest.index], rows[vec3.index], out=rows[dest.index])
+        return dest
+
+    def neg(self, vec):
+        dest = self.allocate()
+        rows = self.rows
+        np.negative(rows[vec.index], out=rows[dest.index])
+        return dest
+
+    def move(self, vec):
+        dest = self.allocate()
+        self.rows[dest.index] = self.rows[vec.index]
+        return dest
@@ -22,13 +22,7 @@ def form_cfg_succs_preds(body):
     blocks = form_blocks(body)
     name2block = form_block_dict(blocks)
     succs_cfg = get_cfg(name2block)
-    preds_cfg = OrderedDict()
-    for bb_name in succs_cfg:
-        preds = []
-        for bb_name1, succs in succs_cfg.items():
-            if bb_name in succs:
-                preds.append(bb_name1)
-        preds_cfg[bb_name] = preds
+    preds_cfg = get_preds(succs_cfg)
 
     out = OrderedDict()
     for bb_name in succs_cfg:
@@ -36,6 +30,19 @@ def form_cfg_succs_preds(body):
     return out
 
 
+def get_preds(succs_cfg):
+    """
+    Predecessors of each block of a successor labeled CFG, in block order,
+    each predecessor listed once
+    """
+    preds_cfg = OrderedDict((bb_name, []) for bb_name in succs_cfg)
+    for bb_name, succs in succs_cfg.items():
+        for succ in succs:
+            if succ in preds_cfg and (preds_cfg[succ] == [] or preds_cfg[succ][-1] != bb_name):
+                preds_cfg[succ].append(bb_name)
+    return preds_cfg
+
+
 def form_blocks(body):
     cur_block = []
     for instr in body:
@@ -118,6 +125,7 @@ def get_cfg(name2block):
     Converts Name2Block into a Successor Labeled CFG
     """
     out = OrderedDict()
+    names = list(name2block.keys())
     for i, (name, block) in enumerate(name2block.items()):
         if block != []:
             last = block[-1]
@@ -129,13 +137,13 @@ def get_cfg(name2block):
                 if i == len(name2block) - 1:
                     succ = []
                 else:
-                    succ = [list(name2block.keys())[i + 1]]
+                    succ = [names[i + 1]]
             out[name] = succ
         else:
             if i == len(name2block) - 1:
                 succ = []
             else:
-                succ = [list(name2block.keys())[i + 1]]
+                succ = [names[i + 1]]
             out[name] = succ
     return out
 
@@ -146,6 +154,7 @@ def get_cfg_w_blocks(name2block):
     WITH BLOCKS of Instructions
     """
     succs_cfg = OrderedDict()
+    names = list(name2block.keys())
     for i, (name, block) in enumerate(name2block.items()):
         if block != []:
             last = block[-1]
@@ -157,24 +166,19 @@ def get_cfg_w_blocks(name2block):
                 if i == len(name2block) - 1:
                     succ = []
                 else:
-                    succ = [list(name2block.keys())[i + 1]]
+                    succ = [names[i + 1]]
             result = {INSTRS: block, SUCCS: succ, PREDS: []}
             succs_cfg[name] = result
         else:
             if i == len(name2block) - 1:
                 succ = []
             else:
-                succ = [list(name2block.keys())[i + 1]]
+                succ = [names[i + 1]]
             result = {INSTRS: block, SUCCS: succ, PREDS: []}
             succs_cfg[name] = result
 
-    preds_cfg = OrderedDict()
-    for bb_name in succs_cfg:
-        preds = []
-        for bb_name_pred, triple_dict in succs_cfg.items():
-            if bb_name in triple_dict[SUCCS]:
-                preds.append(bb_name_pred)
-        preds_cfg[bb_name] = preds
+    preds_cfg = get_preds(OrderedDict(
+        (bb_name, triple_dict[SUCCS]) for bb_name, triple_dict in succs_cfg.items()))
 
     out = OrderedDict()
     for bb_name, triple_dict in succs_cfg.items():
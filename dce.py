@@ -5,11 +5,14 @@ import sys
 import json
 
 from ssa import bril_to_ssa, is_ssa
-from dominator_utilities import build_dominance_frontier_w_cfg, get_backedges_w_cfg, get_dominators_w_cfg, build_dominance_tree_w_cfg
+from dominator_utilities import (build_post_dominance_frontier_w_cfg, build_dominance_frontier_from_idoms,
+                                 get_backedges_w_cfg, get_immediate_dominators_w_cfg)
 from cfg import (form_blocks, join_blocks,
                  form_cfg_w_blocks, add_unique_exit_to_cfg, reverse_cfg, INSTRS, SUCCS, PREDS)
 from bril_core_constants import *
 from bril_core_utilities import *
+from bril_memory_extension_utilities import is_store, is_free
+from bril_speculation_utilities import is_spec
 
 
 # ---------- MARK SWEEP DEAD CODE ELIMINATIONS -------------
@@ -20,116 +23,166 @@ NOT_MARKED = not MARKED
 
 
 def is_critical(instr):
-    return is_io(instr) or is_call(instr) or is_ret(instr)
+    return (is_io(instr) or is_call(instr) or is_ret(instr)
+            or is_store(instr) or is_free(instr) or is_spec(instr))
 
 
-def find_nearest_useful_rec(curr_block, useful_post_dominators, post_dominator_tree):
-    children = post_dominator_tree[curr_block]
-    for c in children:
-        if c in useful_post_dominators:
-            return c
-        else:
-            result = find_nearest_useful_rec(
-                c, useful_post_dominators, post_dominator_tree)
-            if result != None:
-                return result
-    return None
+def get_block_terminators(cfg):
+    """
+    Map from each block of cfg to its terminator instruction, or None if
+    the block falls through
+    """
+    block2terminator = OrderedDict()
+    for block in cfg:
+        block2terminator[block] = None
+        instrs = cfg[block][INSTRS]
+        if instrs != [] and is_terminator(instrs[-1]):
+            block2terminator[block] = instrs[-1]
+    return block2terminator
+
+
+def build_def_use_indexes(cfg):
+    """
+    Maps from instruction ids to instructions and to their blocks, and from
+    each variable to the id of its (last) definition
+    """
+    id2instr = OrderedDict()
+    id2block = OrderedDict()
+    def2id = OrderedDict()
+    for block in cfg:
+        for instr in cfg[block][INSTRS]:
+            id2instr[id(instr)] = instr
+            if DEST in instr:
+                def2id[instr[DEST]] = id(instr)
+            id2block[id(instr)] = block
+    return id2instr, id2block, def2id
 
 
-def find_nearest_useful_post_dominator(curr_block, useful_blocks, post_dominating_blocks, post_dominator_tree):
-    useful_post_dominators = list(
-        set(useful_blocks).intersection(
-            set(post_dominating_blocks)
-        )
-    )
-    if useful_post_dominators == []:
-        return None
-    return find_nearest_useful_rec(curr_block, useful_post_dominators, post_dominator_tree)
+def find_nearest_useful_post_dominator(curr_block, useful_blocks, imm_post_dom, nearest):
+    """
+    Walk up the post dominator tree from the immediate post dominator of
+    curr_block to the first useful block, memoizing results in nearest.
+    None if there is no useful post dominator.
+    """
+    path = []
+    block = curr_block
+    result = None
+    while block in imm_post_dom and imm_post_dom[block] != block:
+        block = imm_post_dom[block]
+        if block in nearest:
+            result = nearest[block]
+            break
+        if block in useful_blocks:
+            result = block
+            break
+        path.append(block)
+    for b in path:
+        nearest[b] = result
+    return result
 
 
 def function_mark_sweep(func):
     """
     ASSUMES SSA FORM
     https://yunmingzhang.files.wordpress.com/2013/12/dcereport-2.pdf
+
+    Mark: critical instructions are live, as are the definitions of the
+    arguments of live instructions, and the branches the blocks of live
+    instructions are control dependent on (their post dominance frontier).
+    A live phi also keeps alive the branches deciding which predecessor it
+    reads from. Branches in blocks that cannot reach the exit are critical,
+    so infinite loops are kept.
+
+    Sweep: dead branches become jumps to the nearest useful post dominator,
+    labels and jumps are kept, and all other dead instructions are deleted.
     """
     # set up data structures
     cfg = form_cfg_w_blocks(func)
     cfg_w_exit = add_unique_exit_to_cfg(cfg, UNIQUE_CFG_EXIT)
     cdg = reverse_cfg(cfg_w_exit)
-    _, post_dominated_by = get_dominators_w_cfg(cdg, UNIQUE_CFG_EXIT)
-    post_dominator_tree = build_dominance_tree_w_cfg(cdg, UNIQUE_CFG_EXIT)
-    post_dominator_frontier = build_dominance_frontier_w_cfg(
-        cdg, UNIQUE_CFG_EXIT)
+    imm_post_dom = get_immediate_dominators_w_cfg(cdg, UNIQUE_CFG_EXIT)
+    control_dependence = build_dominance_frontier_from_idoms(
+        cdg, imm_post_dom, UNIQUE_CFG_EXIT)
+
+    id2instr, id2block, def2id = build_def_use_indexes(cfg)
+    block2terminator = get_block_terminators(cfg)
 
     # initialize
-    id2instr = dict()
-    id2block = dict()
-    id2mark = dict()
-    def2id = dict()
+    id2mark = {instr_id: NOT_MARKED for instr_id in id2instr}
     useful_blocks = set()
     worklist = []
+
+    def mark(instr):
+        instr_id = id(instr)
+        if id2mark[instr_id] == NOT_MARKED:
+            id2mark[instr_id] = MARKED
+            worklist.append(instr_id)
+
     for block in cfg:
         for instr in cfg[block][INSTRS]:
-            instr_id = id(instr)
             if is_critical(instr):
-                worklist.append(instr_id)
-                id2mark[instr_id] = MARKED
-                useful_blocks.add(block)
-            else:
-                id2mark[instr_id] = NOT_MARKED
-            if DEST in instr:
-                def2id[instr[DEST]] = instr_id
-            id2instr[instr_id] = instr
-            id2block[instr_id] = block
+                mark(instr)
+        terminator = block2terminator[block]
+        if block not in imm_post_dom and terminator != None:
+            mark(terminator)
 
     # mark phase
     while worklist != []:
         current_inst_id = worklist.pop()
         current_inst = id2instr[current_inst_id]
+        curr_block = id2block[current_inst_id]
+        useful_blocks.add(curr_block)
         if ARGS in current_inst:
             for defining in current_inst[ARGS]:
-                if id2mark[def_id] == NOT_MARKED:
-                    def_id = def2id[defining]
-                    id2mark[def_id] = MARKED
-                    useful_blocks.add(id2block[def_id])
-                    worklist.append(def_id)
-
-        curr_block = id2block[current_inst_id]
-        for rdf_block in post_dominator_frontier[curr_block]:
-            last_instr = None
-            for block_instr in reversed(cfg[rdf_block][INSTRS]):
-                last_instr = block_instr
-                break
-            if last_instr != None:
-                last_instr_id = id(last_instr)
-                id2mark[last_instr_id] = MARKED
-                useful_blocks.add(id2block[last_instr_id])
-                worklist.append(last_instr_id)
+                # function arguments have no definition
+                if defining in def2id:
+                    mark(id2instr[def2id[defining]])
+
+        control_blocks = [curr_block]
+        if is_phi(current_inst):
+            for pred in current_inst[LABELS]:
+                if pred in cfg:
+                    control_blocks.append(pred)
+                    if block2terminator[pred] != None:
+                        mark(block2terminator[pred])
+        for block in control_blocks:
+            useful_blocks.add(block)
+            for rdf_block in control_dependence.get(block, []):
+                terminator = block2terminator[rdf_block]
+                if terminator != None:
+                    mark(terminator)
 
     # sweep phase
-    final_instrs = []
-    for instr in func[INSTRS]:
-        instr_id = id(instr)
-        if id2mark[instr_id] == MARKED:
-            final_instrs.append(instr)
-        else:
-            if is_br(instr):
+    nearest = dict()
+    new_blocks = OrderedDict()
+    jump_targets = set()
+    for block in cfg:
+        new_block = []
+        for instr in cfg[block][INSTRS]:
+            if id2mark[id(instr)] == MARKED:
+                new_block.append(instr)
+            elif is_br(instr):
                 # replace branch to jmp to nearest useful post dominator
-                curr_block = id2block[instr_id]
-                post_dominating_blocks = list(
-                    set(post_dominated_by[curr_block]) - {curr_block})
-                nearest = find_nearest_useful_post_dominator(
-                    curr_block, useful_blocks, post_dominating_blocks, post_dominator_tree)
-                if nearest != None:
-                    new_jmp = {OP: JMP, LABELS: [nearest]}
-                    final_instrs.append(new_jmp)
-            elif is_label(instr):
-                final_instrs.append(instr)
-            elif is_jmp(instr):
-                final_instrs.append(instr)
+                target = find_nearest_useful_post_dominator(
+                    block, useful_blocks, imm_post_dom, nearest)
+                if target == None:
+                    # no useful work is left on any path to the exit
+                    new_block.append(build_void_ret())
+                else:
+                    jump_targets.add(target)
+                    new_block.append({OP: JMP, LABELS: [target]})
+            elif is_label(instr) or is_jmp(instr):
+                new_block.append(instr)
             else:
                 # deleted
                 pass
+        new_blocks[block] = new_block
+
+    final_instrs = []
+    for block, new_block in new_blocks.items():
+        if block in jump_targets and (new_block == [] or not is_label(new_block[0])):
+            final_instrs.append({LABEL: block})
+        final_instrs += new_block
     return final_instrs
 
 
@@ -145,7 +198,7 @@ def mark_sweep_dce(program):
     except:
         program = bril_to_ssa(program)
     for func in program[FUNCTIONS]:
-        new_instrs = function_safe_adce(func)
+        new_instrs = function_mark_sweep(func)
         func[INSTRS] = new_instrs
     is_ssa(program)
     return program
@@ -175,7 +228,7 @@ def function_safe_adce(func):
     From: http://www.cs.cmu.edu/afs/cs/academic/class/15745-s12/public/lectures/L14-SSA-Optimizations-1up.pdf
     Mark all instructions as Live that are:
         I/O
-        Store into memory TODO: when Bril has memory instructions
+        Store into memory, Free, Speculation
         Terminator - RET
         Calls a function with side effects (e.g. most functions)
         Label
@@ -196,28 +249,19 @@ def function_safe_adce(func):
     cfg_w_exit = add_unique_exit_to_cfg(cfg, UNIQUE_CFG_EXIT)
     backedge_start_blocks = set(
         list(map(lambda pair: pair[1], get_backedges_w_cfg(cfg, entry))))
-    cdg = reverse_cfg(cfg_w_exit)
-    cdg[entry][PREDS].append(UNIQUE_CFG_EXIT)
-    cdg[UNIQUE_CFG_EXIT][SUCCS].append(entry)
-    control_dependence = build_dominance_frontier_w_cfg(cdg, UNIQUE_CFG_EXIT)
+    control_dependence = build_post_dominance_frontier_w_cfg(
+        cfg_w_exit, UNIQUE_CFG_EXIT, entry)
 
     # initialize data structures (WRITE TO)
-    id2instr = OrderedDict()
-    id2block = OrderedDict()
-    def2id = OrderedDict()
-    for block in cfg:
-        for instr in cfg[block][INSTRS]:
-            id2instr[id(instr)] = instr
-            if DEST in instr:
-                def2id[instr[DEST]] = id(instr)
-            id2block[id(instr)] = block
+    id2instr, id2block, def2id = build_def_use_indexes(cfg)
+    block2terminator = get_block_terminators(cfg)
 
     # initialize worklist
     marked_instrs = {id(instr): NOT_LIVE for instr in instrs}
     worklist = []
     for instr in instrs:
         curr_block = id2block[id(instr)]
-        if is_io(instr) or is_ret(instr) or is_jmp(instr) or is_call(instr):
+        if is_critical(instr) or is_jmp(instr):
             # mark current instr as live
             marked_instrs[id(instr)] = LIVE
             # add arguments of current instr as live
@@ -227,19 +271,16 @@ def function_safe_adce(func):
                     if a in def2id:
                         worklist.append(def2id[a])
             # add terminator for block for current instr
-            for instr in reversed(cfg[curr_block][INSTRS]):
-                if is_terminator(instr):
-                    worklist.append(id(instr))
+            if block2terminator[curr_block] != None:
+                worklist.append(id(block2terminator[curr_block]))
             # add the control dependency parent of this instruction's block
             for cd_block in control_dependence[curr_block]:
-                for instr in reversed(cfg[cd_block][INSTRS]):
-                    if is_terminator(instr):
-                        worklist.append(id(instr))
+                if block2terminator[cd_block] != None:
+                    worklist.append(id(block2terminator[cd_block]))
         # add terminators for any start of a backedge
         if curr_block in backedge_start_blocks:
-            for instr in reversed(cfg[curr_block][INSTRS]):
-                if is_terminator(instr):
-                    worklist.append(id(instr))
+            if block2terminator[curr_block] != None:
+                worklist.append(id(block2terminator[curr_block]))
 
     # DO WORKLIST
     while worklist != []:
@@ -257,19 +298,16 @@ def function_safe_adce(func):
                     worklist.append(def2id[a])
         # add terminator for block for current instr
         curr_block = id2block[instr_id]
-        for inner_instr in reversed(cfg[curr_block][INSTRS]):
-            if is_terminator(inner_instr):
-                worklist.append(id(inner_instr))
+        if block2terminator[curr_block] != None:
+            worklist.append(id(block2terminator[curr_block]))
         # add the control dependency parent of this instruction's block
         for cd_block in control_dependence[curr_block]:
-            for inner_instr in reversed(cfg[cd_block][INSTRS]):
-                if is_terminator(inner_instr):
-                    worklist.append(id(inner_instr))
+            if block2terminator[cd_block] != None:
+                worklist.append(id(block2terminator[cd_block]))
         # add terminators for any start of a backedge
         if curr_block in backedge_start_blocks:
-            for inner_instr in reversed(cfg[curr_block][INSTRS]):
-                if is_terminator(inner_instr):
-                    worklist.append(id(inner_instr))
+            if block2terminator[curr_block] != None:
+                worklist.append(id(block2terminator[curr_block]))
 
     # FINISH by keeping alive instructions
     final_instrs = []
@@ -286,7 +324,7 @@ def function_adce(func):
     From: http://www.cs.cmu.edu/afs/cs/academic/class/15745-s12/public/lectures/L14-SSA-Optimizations-1up.pdf
     Mark all instructions as Live that are:
         I/O
-        Store into memory TODO: when Bril has memory instructions
+        Store into memory, Free, Speculation
         Terminator - RET
         Calls a function with side effects (e.g. most functions)
         Label
@@ -301,27 +339,18 @@ def function_adce(func):
     cfg = form_cfg_w_blocks(func)
     entry = list(cfg.keys())[0]
     cfg_w_exit = add_unique_exit_to_cfg(cfg, UNIQUE_CFG_EXIT)
-    cdg = reverse_cfg(cfg_w_exit)
-    cdg[entry][PREDS].append(UNIQUE_CFG_EXIT)
-    cdg[UNIQUE_CFG_EXIT][SUCCS].append(entry)
-    control_dependence = build_dominance_frontier_w_cfg(cdg, UNIQUE_CFG_EXIT)
+    control_dependence = build_post_dominance_frontier_w_cfg(
+        cfg_w_exit, UNIQUE_CFG_EXIT, entry)
 
     # initialize data structures (WRITE TO)
-    id2instr = OrderedDict()
-    id2block = OrderedDict()
-    def2id = OrderedDict()
-    for block in cfg:
-        for instr in cfg[block][INSTRS]:
-            id2instr[id(instr)] = instr
-            if DEST in instr:
-                def2id[instr[DEST]] = id(instr)
-            id2block[id(instr)] = block
+    id2instr, id2block, def2id = build_def_use_indexes(cfg)
+    block2terminator = get_block_terminators(cfg)
 
     # initialize worklist
     marked_instrs = {id(instr): NOT_LIVE for instr in instrs}
     worklist = []
     for instr in instrs:
-        if is_io(instr) or is_jmp(instr) or is_ret(instr) or is_call(instr):
+        if is_critical(instr) or is_jmp(instr):
             marked_instrs[id(instr)] = LIVE
             if ARGS in instr:
                 for a in instr[ARGS]:
@@ -330,9 +359,8 @@ def function_adce(func):
                         worklist.append(def2id[a])
             # add the control dependency parent of this instruction's block
             for cd_block in control_dependence[id2block[id(instr)]]:
-                for instr in reversed(cfg[cd_block][INSTRS]):
-                    if is_terminator(instr):
-                        worklist.append(id(instr))
+                if block2terminator[cd_block] != None:
+                    worklist.append(id(block2terminator[cd_block]))
 
     # DO WORKLIST
     while worklist != []:
@@ -350,9 +378,8 @@ def function_adce(func):
                     worklist.append(def2id[a])
 
         for cd_block in control_dependence[id2block[instr_id]]:
-            for instr in reversed(cfg[cd_block][INSTRS]):
-                if is_terminator(instr):
-                    worklist.append(id(instr))
+            if block2terminator[cd_block] != None:
+                worklist.append(id(block2terminator[cd_block]))
 
     # FINISH by keeping oive instructions
     final_instrs = []
@@ -471,6 +498,86 @@ def iterate_dce(program, dce_method):
     return program
 
 
+def worklist_dce_func(func, global_delete=True, local_delete=True):
+    """
+    Trivial DCE of a function in a single worklist pass, over def-use counts.
+
+    An instruction is dead if (global_delete) its destination is never read in
+    the function, or (local_delete) it is written over in its basic block
+    before being read. When an instruction dies, the reads it made are
+    removed from the counts, so transitively dead instructions die in the same
+    pass, rather than one layer per round of delete_unused_dce/local_dce.
+    """
+    instrs = func[INSTRS]
+    live = [True for _ in instrs]
+
+    # var -> indices of its definitions
+    defs = dict()
+    # var -> number of reads in live instructions
+    use_count = dict()
+    # instruction index -> indices of definitions in the same basic block
+    # that it reads
+    local_reads = [[] for _ in instrs]
+    # definition index -> number of reads before the next definition of the
+    # same variable in its basic block, for definitions that are written over
+    local_read_count = dict()
+
+    idx = 0
+    for bb in form_blocks(instrs):
+        last_def = dict()
+        readers = dict()
+        for instr in bb:
+            if ARGS in instr:
+                for a in instr[ARGS]:
+                    use_count[a] = use_count.get(a, 0) + 1
+                    if a in last_def:
+                        local_reads[idx].append(last_def[a])
+                        readers[last_def[a]] += 1
+            if DEST in instr:
+                dst = instr[DEST]
+                defs.setdefault(dst, []).append(idx)
+                if dst in last_def:
+                    local_read_count[last_def[dst]] = readers[last_def[dst]]
+                last_def[dst] = idx
+                readers[idx] = 0
+            idx += 1
+
+    worklist = []
+    if local_delete:
+        for def_idx, count in local_read_count.items():
+            if count == 0:
+                worklist.append(def_idx)
+    if global_delete:
+        for var, var_defs in defs.items():
+            if use_count.get(var, 0) == 0:
+                worklist.extend(var_defs)
+
+    while worklist != []:
+        dead_idx = worklist.pop()
+        if not live[dead_idx]:
+            continue
+        live[dead_idx] = False
+        instr = instrs[dead_idx]
+        if ARGS in instr:
+            for a in instr[ARGS]:
+                use_count[a] -= 1
+                if global_delete and use_count[a] == 0 and a in defs:
+                    worklist.extend(defs[a])
+        for def_idx in local_reads[dead_idx]:
+            if def_idx in local_read_count:
+                local_read_count[def_idx] -= 1
+                if local_delete and local_read_count[def_idx] == 0:
+                    worklist.append(def_idx)
+
+    return [instr for instr, is_live in zip(instrs, live) if is_live]
+
+
+def worklist_dce(program, global_delete=True, local_delete=True):
+    for func in program[FUNCTIONS]:
+        func[INSTRS] = worklist_dce_func(func, global_delete, local_delete)
+    return program
+
+
 def dce(program, global_delete, local_delete, adce, ms):
     """
     Naive DCE wrapper method
@@ -479,13 +586,11 @@ def dce(program, global_delete, local_delete, adce, ms):
         return global_adce(program)
     if bool(ms) == True:
         return mark_sweep_dce(program)
-    if global_delete == None and local_delete == None:
-        return iterate_dce(iterate_dce(program, local_dce), delete_unused_dce)
-    elif global_delete == None and local_delete:
-        return iterate_dce(program, local_dce)
+    if global_delete == None and local_delete:
+        return worklist_dce(program, global_delete=False, local_delete=True)
     elif global_delete and local_delete == None:
-        return iterate_dce(program, delete_unused_dce)
-    return iterate_dce(iterate_dce(program, local_dce), delete_unused_dce)
+        return worklist_dce(program, global_delete=True, local_delete=False)
+    return worklist_dce(program)
 
 
 @click.command()
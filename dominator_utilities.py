@@ -4,12 +4,15 @@ import click
 from collections import OrderedDict
 from copy import deepcopy
 
-from cfg import form_cfg_succs_preds, PREDS, SUCCS
+from cfg import form_cfg_succs_preds, reverse_cfg, PREDS, SUCCS
 from bril_core_constants import NAME
 
 
 NO_PREDECESSOR_HEADER = "no.predecessor.header"
 
+# run the (expensive) brute force checks of the dominator analyses
+DEBUG = False
+
 
 def big_intersection(lst):
     assert type(lst) == list
@@ -70,59 +73,139 @@ def check_domination(domby, cfg, entry=None):
     return domby
 
 
-def get_dominators_helper(cfg, entry=None):
+def reverse_postorder_w_cfg(cfg, entry):
     """
-    Calculates Dominators for a function
+    Reverse postorder of the blocks reachable from entry, using an
+    explicit stack so deep cfgs do not hit the recursion limit
+    """
+    order = []
+    visited = {entry}
+    stack = [(entry, iter(cfg[entry][SUCCS]))]
+    while stack != []:
+        node, succs = stack[-1]
+        advanced = False
+        for s in succs:
+            if s not in visited:
+                visited.add(s)
+                stack.append((s, iter(cfg[s][SUCCS])))
+                advanced = True
+                break
+        if not advanced:
+            order.append(node)
+            stack.pop()
+    order.reverse()
+    return order
+
+
+def get_immediate_dominators_w_cfg(cfg, entry=None):
+    """
+    Calculates Immediate Dominators with the iterative algorithm of
+    Cooper, Harvey and Kennedy ("A Simple, Fast Dominance Algorithm")
 
-    Gives the dominators as a dictionary, e.g. BasicBlock::[Dominators of BasicBlock]
+    Gives the immediate dominators of the blocks reachable from entry, in cfg
+    order, as a dictionary BasicBlock::Immediate Dominator of BasicBlock.
+    The entry is immediately dominated by itself.
     """
+    imm_dom = OrderedDict()
+    if len(cfg) == 0:
+        return imm_dom
     if entry == None:
         entry = list(cfg.keys())[0]
 
-    # set up before iteration
-    # NOTE: I am not sure if this is completely correct, but it *SEEMS* to handle
-    # unreachable blocks. Otherwise, some SCC algorithm is probably needed
-    domby = OrderedDict()
-    reachable_blocks = set()
-    if len(cfg) >= 1:
-        reachable_blocks = dfs(cfg, entry, set())
-    for bb_name in cfg:
-        if bb_name == entry:
-            domby[bb_name] = {bb_name}
-        elif bb_name in reachable_blocks:
-            domby[bb_name] = reachable_blocks
-
-    # iterate to convergence
-    dom_changed = True
-    while dom_changed:
-        old_dom = deepcopy(domby)
-
-        for bb_name in [name for name in cfg if name in reachable_blocks]:
-            dom_predecessors = [domby[p]
-                                for p in cfg[bb_name][PREDS] if p in reachable_blocks]
-
-            if bb_name == entry:
-                continue
-            intersection = big_intersection(dom_predecessors)
-            domby[bb_name] = {bb_name}.union(intersection)
+    rpo = reverse_postorder_w_cfg(cfg, entry)
+    rpo_index = {node: i for i, node in enumerate(rpo)}
+
+    idom = {entry: entry}
+
+    def intersect(b1, b2):
+        while b1 != b2:
+            while rpo_index[b1] > rpo_index[b2]:
+                b1 = idom[b1]
+            while rpo_index[b2] > rpo_index[b1]:
+                b2 = idom[b2]
+        return b1
+
+    changed = True
+    while changed:
+        changed = False
+        for node in rpo[1:]:
+            new_idom = None
+            for p in cfg[node][PREDS]:
+                # skip unreachable and unprocessed predecessors
+                if p not in idom:
+                    continue
+                if new_idom == None:
+                    new_idom = p
+                else:
+                    new_idom = intersect(p, new_idom)
+            if idom.get(node) != new_idom:
+                idom[node] = new_idom
+                changed = True
+
+    for node in cfg:
+        if node in idom:
+            imm_dom[node] = idom[node]
+    return imm_dom
 
-        dom_changed = old_dom != domby
+
+def get_dominated_by_from_idoms(cfg, imm_dom, entry=None):
+    """
+    Derives BasicBlock::{Dominators of BasicBlock} from immediate dominators,
+    by walking up the dominator tree from each block
+    """
+    domby = OrderedDict()
+    if len(cfg) == 0:
+        return domby
+    if entry == None:
+        entry = list(cfg.keys())[0]
+    for node in imm_dom:
+        dominators = {node}
+        runner = node
+        while imm_dom[runner] != runner:
+            runner = imm_dom[runner]
+            dominators.add(runner)
+        domby[node] = dominators
 
     # for unreachable blocks, for the purpose of ssa, we say they are dominated by entry
     # actually they are domijnated by all nodes
     for node in cfg:
-        if node not in reachable_blocks:
+        if node not in imm_dom:
             domby[node] = {entry}
+    return domby
 
+
+def get_dominates_from_dominated_by(cfg, domby):
+    """
+    Inverts BasicBlock::{Dominators of BasicBlock} into
+    BasicBlock::[Blocks BasicBlock dominates]
+    """
+    dominates = OrderedDict((bb, set()) for bb in cfg)
+    for otherbb, dominatedby in domby.items():
+        for bb in dominatedby:
+            dominates[bb].add(otherbb)
     dom = OrderedDict()
     for bb in cfg:
-        dominates = set()
-        for otherbb, dominatedby in domby.items():
-            if bb in dominatedby:
-                dominates.add(otherbb)
-        dom[bb] = list(dominates)
+        dom[bb] = list(dominates[bb])
+    return dom
+
 
-    domby = check_domination(domby, cfg, entry)
+def get_dominators_helper(cfg, entry=None):
+    """
+    Calculates Dominators for a function
+
+    Gives the dominators as a dictionary, e.g. BasicBlock::[Dominators of BasicBlock]
+
+    Dominators are derived from the immediate dominators; the exponential
+    path enumerating self check only runs when DEBUG is set.
+    """
+    if entry == None and len(cfg) >= 1:
+        entry = list(cfg.keys())[0]
+    imm_dom = get_immediate_dominators_w_cfg(cfg, entry)
+    domby = get_dominated_by_from_idoms(cfg, imm_dom, entry)
+    dom = get_dominates_from_dominated_by(cfg, domby)
+
+    if DEBUG:
+        domby = check_domination(domby, cfg, entry)
     return dom, domby
 
 
@@ -169,31 +252,60 @@ def get_immediate_dominators(strict_dom):
     and it is immediately dominated by itself,
 
     (Kinda like a LUB for strict dominators)
+
+    The strict dominators of v form a chain, so u is the strict dominator
+    of v that itself has the most strict dominators.
     """
     imm_dom = OrderedDict()
     for node_A, node_A_strict in strict_dom.items():
-        immediate = []
+        immediate = None
+        depth = -1
         for node_B in node_A_strict:
-            can_add = True
-            for node_C in node_A_strict:
-                if node_B != node_C:
-                    node_C_strict = strict_dom[node_C]
-                    if node_B in node_C_strict:
-                        can_add = False
-                        break
-            if can_add:
-                # B immediately dominates A
-                immediate.append(node_B)
-
-        if immediate != []:
-            assert len(immediate) == 1
-            imm_dom[node_A] = immediate[0]
+            node_B_depth = len(strict_dom[node_B])
+            assert node_B_depth != depth
+            if node_B_depth > depth:
+                immediate = node_B
+                depth = node_B_depth
+
+        if immediate != None:
+            # B immediately dominates A
+            imm_dom[node_A] = immediate
         else:
             # special case: entry is immediately dominated by itself
             imm_dom[node_A] = node_A
     return imm_dom
 
 
+def build_dominance_tree_from_idoms(cfg, imm_dom, entry=None):
+    """
+    Builds the dominance tree, BasicBlock::[Children of BasicBlock], from
+    immediate dominators. Unreachable blocks are children of the entry.
+    """
+    tree = OrderedDict()
+    nodes = OrderedDict()
+    if len(cfg) == 0:
+        return tree, nodes
+    if entry == None:
+        entry = list(cfg.keys())[0]
+    parents = OrderedDict(imm_dom)
+    for bb in cfg:
+        if bb not in parents:
+            parents[bb] = entry
+    for bb, dom_obj in parents.items():
+        nodes[bb] = None
+        if bb != dom_obj:
+            if dom_obj not in tree:
+                tree[dom_obj] = [bb]
+            else:
+                tree[dom_obj].append(bb)
+            if bb not in tree:
+                tree[bb] = []
+        else:
+            # entry point:
+            tree[bb] = []
+    return tree, nodes
+
+
 def build_dominance_tree_helper(domby):
     strict_dom = get_strict_dominators(domby)
     imm_dom = get_immediate_dominators(strict_dom)
@@ -215,13 +327,14 @@ def build_dominance_tree_helper(domby):
 
 
 def build_dominance_tree(func):
-    _, domby = get_dominators(func)
-    return build_dominance_tree_helper(domby)
+    func_instructions = func["instrs"]
+    cfg = form_cfg_succs_preds(func_instructions)
+    return build_dominance_tree_w_cfg(cfg)
 
 
 def build_dominance_tree_w_cfg(cfg, entry=None):
-    _, domby = get_dominators_w_cfg(cfg, entry)
-    return build_dominance_tree_helper(domby)
+    imm_dom = get_immediate_dominators_w_cfg(cfg, entry)
+    return build_dominance_tree_from_idoms(cfg, imm_dom, entry)
 
 
 def get_tree_graph(tree, func, nodes):
@@ -260,6 +373,9 @@ def build_dominance_frontier_helper(cfg, dom, strict_dom):
     The dominator frontier is a set of nodes defined for every node (basic block)
     Consider a basic block A. The dominance frontier of A contains a node B
     iff A does not strictly dominate B but A dominiates some predecessor of B.
+
+    Brute force version, quadratic in the number of nodes: see
+    build_dominance_frontier_from_idoms.
     """
     out = OrderedDict()
     for nodeA in cfg:
@@ -275,21 +391,95 @@ def build_dominance_frontier_helper(cfg, dom, strict_dom):
     return out
 
 
+def build_dominance_frontier_from_idoms(cfg, imm_dom, entry=None):
+    """
+    Dominance frontier from immediate dominators, by walking up the dominator
+    tree from the predecessors of each block (Cooper, Harvey and Kennedy).
+
+    For each block B and each predecessor P of B, every block on the
+    dominator tree path from P up to (but excluding) idom(B) has B in its
+    frontier. The entry has no immediate dominator, so for B the entry the
+    walk goes all the way up to, and includes, the entry.
+
+    Unreachable blocks are dominated by the entry only, by convention, so
+    their frontiers are empty, and an unreachable predecessor of the entry
+    puts the entry in its own frontier.
+
+    Frontiers are listed in cfg order.
+    """
+    out = OrderedDict()
+    if len(cfg) == 0:
+        return out
+    if entry == None:
+        entry = list(cfg.keys())[0]
+
+    frontier = OrderedDict((node, []) for node in cfg)
+    # visit join points in cfg order, so each frontier is built in cfg order
+    for nodeB in cfg:
+        preds = cfg[nodeB][PREDS]
+        if preds == []:
+            continue
+        if nodeB == entry:
+            stop = None
+            frontier[entry].append(entry)
+        elif nodeB not in imm_dom:
+            # unreachable block
+            continue
+        else:
+            stop = imm_dom[nodeB]
+        for p in preds:
+            if p not in imm_dom:
+                # unreachable predecessor
+                continue
+            runner = p
+            while runner != stop:
+                if frontier[runner][-1:] != [nodeB]:
+                    frontier[runner].append(nodeB)
+                if runner == entry:
+                    break
+                runner = imm_dom[runner]
+
+    for node in cfg:
+        out[node] = frontier[node]
+
+    if DEBUG:
+        dom, _ = get_dominators_helper(cfg, entry)
+        strict_dom = get_strict_dominators(dom)
+        brute_force = build_dominance_frontier_helper(cfg, dom, strict_dom)
+        for node in cfg:
+            assert set(out[node]) == set(brute_force[node])
+    return out
+
+
 def build_dominance_frontier(func):
     func_instructions = func["instrs"]
     cfg = form_cfg_succs_preds(func_instructions)
-    dom, _ = get_dominators(func)
-    strict_dom = get_strict_dominators(dom)
-    return build_dominance_frontier_helper(cfg, dom, strict_dom)
+    return build_dominance_frontier_w_cfg(cfg)
 
 
-def build_dominance_frontier_w_cfg(cfg, entry):
+def build_dominance_frontier_w_cfg(cfg, entry=None):
     """
     CFG version of build_dominance_frontier
     """
-    dom, _ = get_dominators_w_cfg(cfg, entry)
-    strict_dom = get_strict_dominators(dom)
-    return build_dominance_frontier_helper(cfg, dom, strict_dom)
+    imm_dom = get_immediate_dominators_w_cfg(cfg, entry)
+    return build_dominance_frontier_from_idoms(cfg, imm_dom, entry)
+
+
+def build_post_dominance_frontier_w_cfg(cfg, exit, entry=None):
+    """
+    Post dominance frontier of a cfg with a unique exit block exit, i.e. the
+    dominance frontier of the reversed cfg, rooted at exit. A block's post
+    dominance frontier holds the blocks it is control dependent on.
+
+    If entry is given, an edge from entry to exit is added to the reversed
+    cfg first, so that blocks that never reach the exit (e.g. infinite loops)
+    are still rooted, and branches feeding them are still found.
+    """
+    cdg = reverse_cfg(cfg)
+    if entry != None:
+        cdg[entry][PREDS].append(exit)
+        cdg[exit][SUCCS].append(entry)
+    return build_dominance_frontier_w_cfg(cdg, exit)
 
 
 def dominance_frontier(prog):
@@ -301,9 +491,11 @@ def dominance_frontier(prog):
 
 def get_backedges_helper(cfg, dom):
     backedges = []
+    order = {node: i for i, node in enumerate(cfg)}
     for A in cfg:
-        for B in cfg:
-            if B in cfg[A][SUCCS] and A in dom[B]:
+        succs = sorted(set(cfg[A][SUCCS]), key=lambda B: order[B])
+        for B in succs:
+            if A in dom[B]:
                 backedges.append((A, B))
     return backedges
 
@@ -332,7 +524,13 @@ def get_natural_loops(func):
     func_instructions = func["instrs"]
     cfg = form_cfg_succs_preds(func_instructions)
     backedges = get_backedges(func)
+    return get_natural_loops_w_cfg(cfg, backedges)
+
 
+def get_natural_loops_w_cfg(cfg, backedges):
+    """
+    CFG version of get_natural_loops, given the backedges of the cfg
+    """
     loops = []
 
     for (A, B) in backedges:
@@ -340,24 +538,26 @@ def get_natural_loops(func):
 
         continue_checking = True
         while continue_checking:
-            new_natural_loop = deepcopy(natural_loop)
+            in_loop = set(natural_loop)
+            new_natural_loop = list(natural_loop)
             for v in natural_loop:
                 if v != B:
                     v_preds = cfg[v][PREDS]
                     for p in v_preds:
-                        if p not in natural_loop:
+                        if p not in in_loop:
                             new_natural_loop.append(p)
 
-            if new_natural_loop == natural_loop:
+            if len(new_natural_loop) == len(natural_loop):
                 continue_checking = False
             natural_loop = new_natural_loop
+        in_loop = set(natural_loop)
 
         # check only 1 entrance to natural loop is via B, the loop header.
         is_natural = True
-        for node in [n for n in cfg if n not in natural_loop]:
+        for node in [n for n in cfg if n not in in_loop]:
             successors = cfg[node][SUCCS]
             for s in successors:
-                if s != B and s in natural_loop:
+                if s != B and s in in_loop:
                     is_natural = False
 
         if is_natural:
@@ -365,7 +565,7 @@ def get_natural_loops(func):
             exits = []
             for node in natural_loop:
                 for s in cfg[node][SUCCS]:
-                    if s not in natural_loop:
+                    if s not in in_loop:
                         exits.append((node, s))
 
             header = B
@@ -374,6 +574,110 @@ def get_natural_loops(func):
     return loops
 
 
+class Loop(object):
+    """
+    A loop of a loop nest forest: the union of the natural loops sharing
+    header, with the loops it is nested in and the loops nested in it
+
+    Depth is 1 for outermost loops.
+    """
+
+    def __init__(self, header, blocks, backedges, exits) -> None:
+        self.header = header
+        self.blocks = frozenset(blocks)
+        self.backedges = backedges
+        self.exits = exits
+        self.parent = None
+        self.children = []
+        self.depth = 1
+
+    def to_natural_loop(self, cfg):
+        """
+        Loop as a (blocks, backedge, header, exits) natural loop tuple, with
+        blocks in cfg order
+        """
+        blocks = [b for b in cfg if b in self.blocks]
+        return (blocks, self.backedges[0], self.header, self.exits)
+
+    def __str__(self) -> str:
+        return f"Loop {self.header} (depth {self.depth}): {{ {', '.join(sorted(self.blocks))} }}"
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+def get_loop_nest_forest_w_cfg(cfg, natural_loops):
+    """
+    Loop nest forest of the cfg, from its natural loops
+
+    Natural loops sharing a header are merged into one Loop. Returns the
+    outermost loops, in cfg order of their headers.
+    """
+    header_loops = OrderedDict()
+    for (natural_loop, backedge, header, _) in natural_loops:
+        if header not in header_loops:
+            header_loops[header] = (set(), [])
+        header_loops[header][0].update(natural_loop)
+        header_loops[header][1].append(backedge)
+
+    loops = []
+    for header, (blocks, backedges) in header_loops.items():
+        exits = []
+        for node in cfg:
+            if node in blocks:
+                for s in cfg[node][SUCCS]:
+                    if s not in blocks:
+                        exits.append((node, s))
+        loops.append(Loop(header, blocks, backedges, exits))
+
+    # the parent of a loop is the smallest loop containing its header
+    order = {node: i for i, node in enumerate(cfg)}
+    loops.sort(key=lambda loop: order[loop.header])
+    for loop in loops:
+        for other in loops:
+            if other is loop or loop.header not in other.blocks:
+                continue
+            if loop.parent == None or len(other.blocks) < len(loop.parent.blocks):
+                loop.parent = other
+
+    roots = []
+    for loop in loops:
+        if loop.parent == None:
+            roots.append(loop)
+        else:
+            loop.parent.children.append(loop)
+
+    stack = list(roots)
+    while stack != []:
+        loop = stack.pop()
+        for child in loop.children:
+            child.depth = loop.depth + 1
+            stack.append(child)
+    return roots
+
+
+def get_loop_nest_forest(func):
+    cfg = form_cfg_succs_preds(func["instrs"])
+    return get_loop_nest_forest_w_cfg(cfg, get_natural_loops_w_cfg(cfg, get_backedges(func)))
+
+
+def loops_innermost_first(roots):
+    """
+    All loops of a loop nest forest, every loop after the loops nested in it
+    """
+    postorder = []
+    stack = [(loop, False) for loop in reversed(roots)]
+    while stack != []:
+        (loop, children_done) = stack.pop()
+        if children_done:
+            postorder.append(loop)
+            continue
+        stack.append((loop, True))
+        for child in reversed(loop.children):
+            stack.append((child, False))
+    return postorder
+
+
 def natural_loops(prog):
     for func in prog["functions"]:
         natural_loops = get_natural_loops(func)
@@ -382,14 +686,25 @@ def natural_loops(prog):
             print(f"\tNatural Loop: {{ {', '.join(loop)} }}")
 
 
+def loop_nest_forest(prog):
+    for func in prog["functions"]:
+        print(func[NAME])
+        for loop in reversed(loops_innermost_first(get_loop_nest_forest(func))):
+            print(f"\t{'  ' * (loop.depth - 1)}{loop}")
+
+
 @click.command()
 @click.option('--dominator', default=False, help='Print Dominators.')
 @click.option('--tree', default=False, help='Print Dominator Tree.')
 @click.option('--frontier', default=False, help='Print Domination Frontier.')
 @click.option('--back', default=False, help='Pretty Back Edges of Program.')
 @click.option('--loops', default=False, help='Pretty Natural Loops of Program.')
+@click.option('--nest', default=False, help='Pretty Loop Nest Forest of Program.')
 @click.option('--pretty-print', default=False, help='Pretty Print Original Program.')
-def main(dominator, tree, frontier, back, loops, pretty_print):
+@click.option('--debug', default=False, help='Check Dominators by Brute Force Path Enumeration.')
+def main(dominator, tree, frontier, back, loops, nest, pretty_print, debug):
+    global DEBUG
+    DEBUG = bool(debug)
     prog = json.load(sys.stdin)
     if pretty_print:
         print(json.dumps(prog, indent=4, sort_keys=True))
@@ -408,6 +723,9 @@ def main(dominator, tree, frontier, back, loops, pretty_print):
     if loops:
         print("Natural Loops")
         natural_loops(prog)
+    if nest:
+        print("Loop Nest Forest")
+        loop_nest_forest(prog)
 
 
 if __name__ == "__main__":
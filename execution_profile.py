@@ -0,0 +1,186 @@
+"""
+Execution Profiles
+
+Collects block, edge and call site execution counts by running a program
+in the reference interpreter, saves them to a compact profile file, and
+annotates the functions of a program with them, under the "profile" key:
+
+    "profile": {
+        "blocks": {block name: count},
+        "edges": [[source block, target block, count], ...],
+        "calls": [count of the first call of the function, ...]
+    }
+
+Blocks are named as in cfg.form_block_dict, and call sites are numbered in
+order of appearance in the function. Passes use the annotations to leave
+cold code alone: inlining skips call sites that never execute, loop
+unrolling and LICM skip loops whose header executes fewer than
+HOT_LOOP_MIN_COUNT times, and partial unrolling unrolls loops by at most
+their average trip count. A pass that finds no annotation, or no count for
+a block or call site (e.g. one created by an earlier pass), treats it as hot.
+
+Usage:
+    bril2json < prog.bril | python3 execution_profile.py --save=prog.prof 10 | python3 inlining.py
+    bril2json < prog.bril | python3 execution_profile.py --profile-file=prog.prof | python3 licm.py --licm=True
+"""
+
+import io
+import sys
+import json
+import click
+from collections import OrderedDict
+
+from bril_interpreter import interpret, BlockProfile
+from bril_core_constants import *
+
+
+PROFILE = "profile"
+BLOCKS = "blocks"
+EDGES = "edges"
+CALLS = "calls"
+
+# a loop is hot if its header executed at least this often, i.e. when its
+# backedge may have been taken
+HOT_LOOP_MIN_COUNT = 2
+# a call site is hot if it executed at least this often
+HOT_CALL_MIN_COUNT = 1
+
+
+def collect_profile(prog, args=()):
+    """
+    Profile of Bril JSON program prog run on args, as a dictionary from
+    function names to function profiles; the output of prog is discarded
+    """
+    block_profile = BlockProfile()
+    interpret(prog, args, out=io.StringIO(), block_profile=block_profile)
+
+    profile = OrderedDict()
+    for func in prog[FUNCTIONS]:
+        profile[func[NAME]] = {BLOCKS: OrderedDict(), EDGES: [], CALLS: []}
+    for (func_name, block), count in block_profile.block_counts.items():
+        profile[func_name][BLOCKS][block] = count
+    for (func_name, source, target), count in block_profile.edge_counts.items():
+        profile[func_name][EDGES].append([source, target, count])
+    for (func_name, _), count in block_profile.call_counts.items():
+        # call sites are added in order
+        profile[func_name][CALLS].append(count)
+    return profile
+
+
+def save_profile(profile, filename):
+    with open(filename, "w") as f:
+        json.dump({FUNCTIONS: profile}, f, separators=(",", ":"))
+
+
+def load_profile(filename):
+    with open(filename) as f:
+        return json.load(f)[FUNCTIONS]
+
+
+def annotate_prog(prog, profile):
+    """
+    Annotates every function of prog with its profile from profile
+    """
+    for func in prog[FUNCTIONS]:
+        if func[NAME] in profile:
+            func[PROFILE] = profile[func[NAME]]
+    return prog
+
+
+def block_count(func, block):
+    """
+    Execution count of block of func, or None if unknown
+    """
+    if PROFILE not in func:
+        return None
+    return func[PROFILE][BLOCKS].get(block)
+
+
+def edge_count(func, source, target):
+    """
+    Execution count of the CFG edge from source to target of func, or None
+    if unknown
+    """
+    if PROFILE not in func:
+        return None
+    profile = func[PROFILE]
+    if source not in profile[BLOCKS] or target not in profile[BLOCKS]:
+        return None
+    for (s, t, count) in profile[EDGES]:
+        if s == source and t == target:
+            return count
+    return 0
+
+
+def call_site_counts(func):
+    """
+    List of (call instruction, execution count) pairs of the call sites of
+    func, or None if unknown
+    """
+    if PROFILE not in func:
+        return None
+    calls = [instr for instr in func[INSTRS] if OP in instr and instr[OP] == CALL]
+    counts = func[PROFILE][CALLS]
+    if len(calls) != len(counts):
+        # the calls changed since profiling
+        return None
+    return list(zip(calls, counts))
+
+
+def loop_is_hot(func, header):
+    """
+    Whether the loop with header of func is hot, or its count is unknown
+    """
+    count = block_count(func, header)
+    return count == None or count >= HOT_LOOP_MIN_COUNT
+
+
+def loop_trip_count(func, header, backedges):
+    """
+    Average number of times the backedges of the loop with header of func
+    were taken per entry into the loop, or None if unknown
+    """
+    header_count = block_count(func, header)
+    if header_count == None:
+        return None
+    num_iterations = 0
+    for (latch, _) in backedges:
+        count = edge_count(func, latch, header)
+        if count == None:
+            return None
+        num_iterations += count
+    num_entries = header_count - num_iterations
+    if num_entries <= 0:
+        return None
+    return num_iterations / num_entries
+
+
+def call_site_is_hot(count):
+    """
+    Whether a call site executed count times is hot, or its count (None) is
+    unknown
+    """
+    return count == None or count >= HOT_CALL_MIN_COUNT
+
+
+@click.command(context_settings={"ignore_unknown_options": True})
+@click.option('--profile-file', default=None, help='Annotate with the Profile in this File instead of Running the Program.')
+@click.option('--save', default=None, help='Save the Collected Profile to this File.')
+@click.option('--pretty-print', default=False, help='Pretty Print Annotated Program.')
+@click.argument('args', nargs=-1, type=click.UNPROCESSED)
+def main(profile_file, save, pretty_print, args):
+    prog = json.load(sys.stdin)
+    if profile_file != None:
+        profile = load_profile(profile_file)
+    else:
+        profile = collect_profile(prog, args)
+    if save != None:
+        save_profile(profile, save)
+    final_prog = annotate_prog(prog, profile)
+    if pretty_print:
+        print(json.dumps(final_prog, indent=4, sort_keys=True))
+    print(json.dumps(final_prog))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,27 +3,42 @@ Global Value Numbering
 
 Implementation of Dominator Based Value Numbering from 
 https://www.cs.tufts.edu/~nr/cs257/archive/keith-cooper/value-numbering.pdf
+
+and of SCC Based Value Numbering (SCCVN), from the same paper, which
+numbers the strongly connected components of the SSA graph optimistically,
+so values that are only equivalent around loop back edges (e.g. duplicate
+induction variables) are still found congruent.
 """
 
 import sys
 import json
 import click
-from copy import deepcopy  # deepcopy used to create the "scoped" hash table
+from collections import OrderedDict
 
 from ssa import is_ssa, bril_to_ssa
 from cfg import form_cfg_w_blocks, join_cfg, INSTRS, SUCCS
-from dominator_utilities import build_dominance_tree
+from analysis_manager import AnalysisManager, DOMINANCE_TREE
+from dominator_utilities import reverse_postorder_w_cfg
+from sccp import fold
+from constant_propagation import NOT_CONSTANT, UNDEFINED
 from bril_core_constants import *
 from bril_core_utilities import (
-    reverse_postorder_traversal,
     is_phi, is_unop, is_binop, is_const, is_id,
     interpret_lvn_value,
 )
 
 
+# optimistic value number of a variable that has not been numbered yet
+TOP = None
+
+
 def instr_to_expr(instr):
     if is_const(instr):
-        return (instr[OP], instr[VALUE], instr[TYPE])
+        typ = instr[TYPE]
+        if type(typ) != str:
+            # parameterized types, e.g. {"ptr": "int"}, are not hashable
+            typ = json.dumps(typ, sort_keys=True)
+        return (instr[OP], instr[VALUE], typ)
     elif is_id(instr) or is_unop(instr) or is_binop(instr) or is_phi(instr):
         return (instr[OP], *instr[ARGS])
     raise RuntimeError(
@@ -61,6 +76,59 @@ def expr_to_instr(dst, expr):
     }
 
 
+class ScopedExprTable(object):
+    """
+    Expression to value number hash table with nested scopes, for the walk
+    over the dominator tree
+
+    Insertions are recorded in an undo log; leaving a scope undoes the
+    insertions made since entering it, so scoping costs O(changes) rather
+    than a copy of the table per dominator tree child. Expressions are
+    interned, so equal expressions share one tuple, and the table keeps the
+    inverse map from value number to expression.
+    """
+
+    def __init__(self) -> None:
+        self.expr2value_num = dict()
+        self.value_num2expr = dict()
+        self.nodes = dict()
+        self.undo_log = []
+        self.scopes = []
+
+    def intern(self, expr):
+        return self.nodes.setdefault(expr, expr)
+
+    def push_scope(self):
+        self.scopes.append(len(self.undo_log))
+
+    def pop_scope(self):
+        mark = self.scopes.pop()
+        while len(self.undo_log) > mark:
+            (expr, old_value_num, value_num) = self.undo_log.pop()
+            del self.value_num2expr[value_num]
+            if old_value_num == None:
+                del self.expr2value_num[expr]
+            else:
+                self.expr2value_num[expr] = old_value_num
+                self.value_num2expr[old_value_num] = expr
+
+    def __contains__(self, expr):
+        return expr in self.expr2value_num
+
+    def __getitem__(self, expr):
+        return self.expr2value_num[expr]
+
+    def __setitem__(self, expr, value_num):
+        expr = self.intern(expr)
+        old_value_num = self.expr2value_num.get(expr)
+        self.undo_log.append((expr, old_value_num, value_num))
+        self.expr2value_num[expr] = value_num
+        self.value_num2expr[value_num] = expr
+
+    def items(self):
+        return self.expr2value_num.items()
+
+
 def canonocalize_expr(expr):
     assert type(expr) == tuple
     assert len(expr) >= 2
@@ -72,11 +140,15 @@ def canonocalize_expr(expr):
     return expr
 
 
-def simplify_expr(expr, var2value_num, expr2value_num):
+def simplify_expr(expr, var2value_num, expr2value_num, memo=None):
     # TODO simplification, with interpretation
     assert type(expr) == tuple
     canonical = canonocalize_expr(expr)
-    interpreted = interpret_lvn_value(canonical, var2value_num, expr2value_num)
+    value_num2expr = None
+    if isinstance(expr2value_num, ScopedExprTable):
+        value_num2expr = expr2value_num.value_num2expr
+    interpreted = interpret_lvn_value(
+        canonical, var2value_num, expr2value_num, value_num2expr, memo)
     return interpreted
 
 
@@ -102,7 +174,7 @@ def redundant(instr, phi2value_num):
     return False, None
 
 
-def dvnt(block, cfg, dominator_tree, var2value_num, expr2value_num):
+def dvnt_block(block, cfg, var2value_num, expr2value_num, memo):
     instrs = cfg[block][INSTRS]
 
     # create local phi to value num hash table
@@ -154,7 +226,8 @@ def dvnt(block, cfg, dominator_tree, var2value_num, expr2value_num):
 
             # get canonical expression
             expr = instr_to_expr(instr)
-            new_expr = simplify_expr(expr, var2value_num, expr2value_num)
+            new_expr = simplify_expr(
+                expr, var2value_num, expr2value_num, memo)
             dst = instr[DEST]
             if new_expr != expr:
                 expr = new_expr
@@ -204,27 +277,38 @@ def dvnt(block, cfg, dominator_tree, var2value_num, expr2value_num):
                         new_args.append(a)
                 s_instr[ARGS] = new_args
 
-    # grab reverse post order
-    reverse_sub_children = reverse_postorder_traversal(block, dominator_tree)
-    actual_children = dominator_tree[block]
-    reverse_children = []
-    for r in reverse_sub_children:
-        if r in actual_children:
-            reverse_children.append(r)
-
-    # traverse children of dominator tree in reverse post order
-    for c in dominator_tree[block]:
-        # deepcopy to create scoping
-        dvnt(c, cfg, dominator_tree, var2value_num, deepcopy(expr2value_num))
 
-
-def gvn_func(func):
+def dvnt(header, cfg, dominator_tree, var2value_num, expr2value_num):
+    """
+    Dominator based value numbering over the dominator tree from header,
+    in preorder with children in order, using an explicit stack;
+    expr2value_num is a ScopedExprTable, scoped to each dominator subtree
+    """
+    # value number -> interpretation of its expression
+    memo = dict()
+    # (block, True) enters block, (block, False) leaves it
+    stack = [(header, True)]
+    while stack != []:
+        block, entering = stack.pop()
+        if not entering:
+            expr2value_num.pop_scope()
+            continue
+        expr2value_num.push_scope()
+        dvnt_block(block, cfg, var2value_num, expr2value_num, memo)
+        stack.append((block, False))
+        for c in reversed(dominator_tree[block]):
+            stack.append((c, True))
+
+
+def gvn_func(func, am=None):
+    if am == None:
+        am = AnalysisManager()
     cfg = form_cfg_w_blocks(func)
-    dominator_tree, _ = build_dominance_tree(func)
+    dominator_tree, _ = am.get(func, DOMINANCE_TREE)
     header = list(cfg.keys())[0]
 
     var2value_num = dict()
-    expr2value_num = dict()
+    expr2value_num = ScopedExprTable()
     # handle functions with arguments
     if ARGS in func:
         for arg in func[ARGS]:
@@ -237,16 +321,263 @@ def gvn_func(func):
     return join_cfg(cfg)
 
 
-def gvn_main(program):
+def sccvn_expr(instr, block_name, valnum, expr_of):
+    """
+    Value numbering expression of instr, under the current value numbers.
+    (ID, n) means the value of instr is value number n, and TOP that it
+    is not known yet.
+    """
+    def num(a):
+        return valnum.get(a, a)
+
+    if is_const(instr) and type(instr[TYPE]) == str:
+        return (CONST, instr[VALUE], instr[TYPE])
+    if is_id(instr):
+        return (ID, num(instr[ARGS][0]))
+    if is_phi(instr):
+        nums = [num(a) for a in instr[ARGS]]
+        known = set(n for n in nums if n != TOP)
+        if len(known) == 0:
+            return TOP
+        if len(known) == 1:
+            # every argument numbered so far agrees
+            return (ID, known.pop())
+        pairs = sorted(zip(instr[LABELS], nums), key=lambda p: p[0])
+        return (PHI, block_name, *pairs)
+    if is_unop(instr) or is_binop(instr):
+        op = instr[OP]
+        nums = [num(a) for a in instr[ARGS]]
+        if TOP not in nums:
+            arg_exprs = [expr_of.get(n) for n in nums]
+            if all(e != None and e[0] == CONST for e in arg_exprs):
+                value = fold(instr, {a: e[1] for a, e in zip(instr[ARGS], arg_exprs)})
+                if value not in [NOT_CONSTANT, UNDEFINED]:
+                    return (CONST, value, instr[TYPE])
+            if op in COMP_OPS and nums[0] == nums[1]:
+                return (CONST, op in [EQ, LE, GE], BOOL)
+        if op in BRIL_COMMUTE_BINOPS:
+            nums = sorted(nums, key=str)
+        return (op, *nums)
+    # calls and other side effecting or uninterpreted instructions
+    return (CALL, instr[DEST])
+
+
+def sccvn_lookup(table, var, expr, expr_of):
+    """
+    Value number of var, which has expression expr, in table
+    """
+    if expr == TOP:
+        return TOP
+    if expr[0] == ID:
+        return expr[1]
+    if expr not in table:
+        table[expr] = var
+        expr_of[var] = expr
+    return table[expr]
+
+
+def ssa_graph_sccs(variables, operands):
+    """
+    Strongly connected components of the SSA graph, where a variable points
+    to the operands of its definition, with operands before their users
+    (Tarjan's algorithm, with an explicit stack)
+    """
+    index = dict()
+    low = dict()
+    on_stack = set()
+    stack = []
+    sccs = []
+    for root in variables:
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(operands[root]))]
+        while work != []:
+            v, children = work[-1]
+            advanced = False
+            for w in children:
+                if w not in operands:
+                    continue
+                if w not in index:
+                    index[w] = low[w] = len(index)
+                    stack.append(w)
+                    on_stack.add(w)
+                    work.append((w, iter(operands[w])))
+                    advanced = True
+                    break
+                elif w in on_stack:
+                    low[v] = min(low[v], index[w])
+            if advanced:
+                continue
+            work.pop()
+            if work != []:
+                u = work[-1][0]
+                low[u] = min(low[u], low[v])
+            if low[v] == index[v]:
+                scc = []
+                while True:
+                    w = stack.pop()
+                    on_stack.remove(w)
+                    scc.append(w)
+                    if w == v:
+                        break
+                sccs.append(scc)
+    return sccs
+
+
+def sccvn_regions(sccs, defs, operands):
+    """
+    Ranges [lo, hi] of sccs, each of which is iterated as one unit: the
+    cyclic components with phis in the same block (e.g. 2 induction
+    variables of 1 loop) and every component between them, so that values
+    congruent across those components are found. Taking whole ranges keeps
+    operands before their users.
+    """
+    block_ranges = dict()
+    for k, scc in enumerate(sccs):
+        if len(scc) == 1 and scc[0] not in operands[scc[0]]:
+            continue
+        for var in scc:
+            (block_name, instr) = defs[var]
+            if is_phi(instr):
+                (lo, hi) = block_ranges.get(block_name, (k, k))
+                block_ranges[block_name] = (min(lo, k), max(hi, k))
+    regions = []
+    for (lo, hi) in sorted(block_ranges.values()):
+        if regions != [] and lo <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], max(regions[-1][1], hi))
+        else:
+            regions.append((lo, hi))
+    return regions
+
+
+def sccvn(cfg, entry):
+    """
+    Value numbers of the variables defined in the blocks of cfg reachable
+    from entry: the variable naming the value, and each such variable's
+    expression
+    """
+    defs = OrderedDict()
+    operands = OrderedDict()
+    for block_name in reverse_postorder_w_cfg(cfg, entry):
+        for instr in cfg[block_name][INSTRS]:
+            if DEST in instr:
+                defs[instr[DEST]] = (block_name, instr)
+                operands[instr[DEST]] = instr.get(ARGS, [])
+    position = {var: i for i, var in enumerate(defs)}
+
+    sccs = ssa_graph_sccs(list(defs.keys()), operands)
+    units = []
+    k = 0
+    for (lo, hi) in sccvn_regions(sccs, defs, operands):
+        units += [(sccs[i], False) for i in range(k, lo)]
+        units.append(([var for scc in sccs[lo:hi + 1] for var in scc], True))
+        k = hi + 1
+    units += [(sccs[i], False) for i in range(k, len(sccs))]
+
+    valnum = {var: TOP for var in defs}
+    expr_of = dict()
+    valid = dict()
+    for (unit, cyclic) in units:
+        unit.sort(key=lambda var: position[var])
+        if cyclic:
+            # optimistically iterate the unit to a fixed point
+            changed = True
+            while changed:
+                changed = False
+                optimistic = dict()
+                for var in unit:
+                    (block_name, instr) = defs[var]
+                    expr = sccvn_expr(instr, block_name, valnum, expr_of)
+                    n = sccvn_lookup(optimistic, var, expr, expr_of)
+                    if n != valnum[var]:
+                        valnum[var] = n
+                        changed = True
+        for var in unit:
+            (block_name, instr) = defs[var]
+            expr = sccvn_expr(instr, block_name, valnum, expr_of)
+            valnum[var] = sccvn_lookup(valid, var, expr, expr_of)
+    return valnum, expr_of
+
+
+def gvn_func_sccvn(func, am=None):
+    """
+    SCCVN, then elimination of every definition whose value is already
+    available from a dominating definition, walking the dominator tree
+
+    Uses are rewritten to the dominating definition, copies included, so
+    phi arguments may name other phis of the same block: leave SSA with
+    ssa.py --from-ssa=True --coalesce=True, which handles such phis. The
+    pass manager runs from-ssa-coalesce for a from-ssa following sccvn.
+    """
+    if am == None:
+        am = AnalysisManager()
+    cfg = form_cfg_w_blocks(func)
+    dominator_tree, _ = am.get(func, DOMINANCE_TREE)
+    header = list(cfg.keys())[0]
+    valnum, expr_of = sccvn(cfg, header)
+
+    # value number -> variable holding it, in the current dominator scope
+    avail = dict()
+    if ARGS in func:
+        for arg in func[ARGS]:
+            avail[arg[NAME]] = arg[NAME]
+    replace = dict()
+    stack = [(header, None)]
+    while stack != []:
+        block, added = stack.pop()
+        if added != None:
+            # leaving the dominator subtree of block
+            for n in added:
+                del avail[n]
+            continue
+        added = []
+        new_instrs = []
+        for instr in cfg[block][INSTRS]:
+            if DEST in instr and valnum.get(instr[DEST]) != TOP:
+                dst = instr[DEST]
+                n = valnum[dst]
+                if n in avail:
+                    replace[dst] = avail[n]
+                    continue
+                avail[n] = dst
+                added.append(n)
+                expr = expr_of.get(n)
+                if expr != None and expr[0] == CONST and not is_const(instr) and not is_phi(instr):
+                    instr = {OP: CONST, DEST: dst,
+                             TYPE: instr[TYPE], VALUE: expr[1]}
+            new_instrs.append(instr)
+        cfg[block][INSTRS] = new_instrs
+        stack.append((block, added))
+        for c in dominator_tree[block]:
+            stack.append((c, None))
+
+    for block in cfg:
+        for instr in cfg[block][INSTRS]:
+            if ARGS in instr:
+                instr[ARGS] = [replace.get(a, a) for a in instr[ARGS]]
+
+    return join_cfg(cfg)
+
+
+def gvn_main(program, am=None, sccvn=False):
+    if am == None:
+        am = AnalysisManager()
+
     # enters as SSA/Or Transform as needed
     try:
         is_ssa(program)
     except:
-        program = bril_to_ssa(program)
+        program = bril_to_ssa(program, am)
 
     # GVN on functions
     for func in program["functions"]:
-        new_instrs = gvn_func(func)
+        if sccvn:
+            new_instrs = gvn_func_sccvn(func, am)
+        else:
+            new_instrs = gvn_func(func, am)
         func["instrs"] = new_instrs
 
     # exit as SSA
@@ -256,13 +587,14 @@ def gvn_main(program):
 
 @click.command()
 @click.option('--gvn', default=False, help='Runs Global Value Numbering on SSA Form Program.')
+@click.option('--sccvn', default=False, help='Runs SCC Based Value Numbering instead, on SSA Form Program.')
 @click.option('--pretty-print', default=False, help='Pretty Print Before and After GVN.')
-def main(gvn, pretty_print):
+def main(gvn, sccvn, pretty_print):
     prog = json.load(sys.stdin)
     if pretty_print:
         print(json.dumps(prog, indent=4, sort_keys=True))
-    if gvn:
-        final_prog = gvn_main(prog)
+    if gvn or sccvn:
+        final_prog = gvn_main(prog, sccvn=sccvn)
     else:
         final_prog = prog
     if pretty_print:
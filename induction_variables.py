@@ -2,27 +2,40 @@
 Implementation of Induction Variable Elimination for Loops
 
 ASSSUMED NOT TO BE IN SSA FORM
+
+For every loop, innermost first:
+1. Basic induction variables i, updated exactly once in the loop by
+i = i + e or i = i - e, with e loop invariant, are found.
+2. Strength Reduction: every multiplication a = c * i, with c loop invariant,
+is replaced by a = id t, where t is a new variable initialized to c * i in
+the loop preheader and incremented by c * e right after every update of i,
+so t = c * i everywhere in the loop.
+3. Linear Function Test Replacement: comparisons of i against a loop invariant
+n are rewritten to compare t against c * n, computed in the preheader, when c
+is a nonzero constant (the comparison is flipped for negative c). This
+assumes c * i and c * n do not overflow.
+4. If i is then only used by its own update, and its value in the loop is not
+used after the loop, the update of i is deleted.
 """
-from copy import deepcopy
 import sys
 import json
 import click
 from collections import OrderedDict
 
 from reaching_definitions import reaching_defs_func
-from licm import insert_preheaders, identify_loop_invariant_instrs, insert_into_bb, LOOP_INVARIANT
+from licm import insert_preheaders, insert_into_bb, build_use_def_index
 from cfg import form_cfg_w_blocks, join_cfg, INSTRS
-from dominator_utilities import get_natural_loops, get_dominators_w_cfg
+from dominator_utilities import get_natural_loops, get_loop_nest_forest, loops_innermost_first
 from bril_core_constants import *
-from bril_core_utilities import is_add, is_mul, is_const, is_int
+from bril_core_utilities import is_add, is_sub, is_mul, is_const, is_int, is_cmp, build_const, build_mul, build_add, build_sub, build_id
 
 
 UNIQUE_VAR_NAME = "unique_var"
 UNIQUE_VAR_IDX = 0
 
 
-BEFORE_I = 0
-AFTER_I = 1
+# comparison after multiplying both sides by a negative number
+FLIPPED_COMP_OPS = {LT: GT, GT: LT, LE: GE, GE: LE, EQ: EQ}
 
 
 def gen_new_var():
@@ -31,6 +44,13 @@ def gen_new_var():
     return f"{UNIQUE_VAR_NAME}_{UNIQUE_VAR_IDX}"
 
 
+def wrap_int(value):
+    """
+    Wrap value to a 64 bit Bril int
+    """
+    return ((value + (1 << 63)) % (1 << 64)) - (1 << 63)
+
+
 class InductionVariable(object):
     """
     Abstract Induction Variable Class
@@ -44,19 +64,23 @@ class BasicInductionVariable(InductionVariable):
     """
     Basic Induction Variable
 
-    Represents i += e
+    Represents i += e (or i -= e, when is_incr is False)
     where i is a defintiion defined exactly once in the loop and e is loop invariant
+
+    e_val is the integer value of e if e is a constant, and otherwise the
+    variable e itself
     """
 
-    def __init__(self, i_id, i, e, e_val, basic_block) -> None:
+    def __init__(self, i_id, i, e, e_val, basic_block, is_incr=True) -> None:
         self.i_id = i_id
         self.i = i
         self.e = e
         self.e_val = e_val
         self.basic_block = basic_block
+        self.is_incr = is_incr
 
     def __str__(self) -> str:
-        return f"{self.i} += {self.e} @{self.i_id}"
+        return f"{self.i} {'+' if self.is_incr else '-'}= {self.e} @{self.i_id}"
 
     def __repr__(self) -> str:
         return self.__str__()
@@ -66,13 +90,18 @@ class MulInvariant(InductionVariable):
     """
     Multiplied Induction Variable
     Represents a = c * i where c is a loop invariant value and i is a basic induction variable
+
+    c_val is the integer value of c if c is a constant, and otherwise the
+    variable c itself
     """
 
-    def __init__(self, a_id, a, c, i) -> None:
+    def __init__(self, a_id, a, c, i, c_val, basic_block) -> None:
         self.a_id = a_id
         self.a = a
         self.c = c
         self.i = i
+        self.c_val = c_val
+        self.basic_block = basic_block
 
     def __str__(self) -> str:
         return f"{self.a} = {self.c} * {self.i} @{self.a_id}"
@@ -81,280 +110,291 @@ class MulInvariant(InductionVariable):
         return self.__str__()
 
 
-class DerivedInductionVariable(InductionVariable):
+class LoopContext(object):
     """
-    Derived Induction Variable
-    Represents j = c * i + d where identifier is the python id of the defining
-    instruction for j.
+    Instructions of a single loop, with the function wide use-def chains
     """
 
-    def __init__(self, j_id, j, c, i, d, basic_block) -> None:
-        self.j_id = j_id
-        self.c = c
-        self.d = d
-        self.i = i
-        self.j = j
-        self.basic_block = basic_block
+    def __init__(self, cfg, loop_blocks, use_def_index, def2instr) -> None:
+        self.cfg = cfg
+        self.loop_blocks = loop_blocks
+        (self.use_defs, self.def_uses, self.instr2def) = use_def_index
+        self.def2instr = def2instr
+        self.loop_ids = set()
+        self.loop_defs = OrderedDict()
+        for block in loop_blocks:
+            for instr in cfg[block][INSTRS]:
+                self.loop_ids.add(id(instr))
+                if DEST in instr:
+                    self.loop_defs.setdefault(instr[DEST], []).append(instr)
+
+    def in_loop(self, definition):
+        return definition > 0 and id(self.def2instr[definition]) in self.loop_ids
+
+    def invariant_value(self, var, user):
+        """
+        Value of argument var of instruction user, if loop invariant:
+        the integer value if var is always a single integer constant, var
+        itself if var is not defined in the loop, and None otherwise
+        """
+        if id(user) not in self.use_defs or var not in self.use_defs[id(user)]:
+            return None
+        definitions = self.use_defs[id(user)][var]
+        if len(definitions) == 1:
+            (definition, ) = definitions
+            if definition > 0:
+                def_instr = self.def2instr[definition]
+                if is_const(def_instr) and is_int(def_instr):
+                    return def_instr[VALUE]
+        if len(definitions) > 0 and var not in self.loop_defs:
+            for definition in definitions:
+                if self.in_loop(definition):
+                    return None
+            return var
+        return None
+
+
+def find_basic_ivs(context):
+    """
+    Find all instructions in the loop that satisfy the form
+    i += e or i -= e
+    where i is defined exactly once in the loop, e is loop invariant, and i
+    has a definition from outside the loop
+    """
+    basic_ivs = OrderedDict()
+    for loop_basic_block in context.loop_blocks:
+        for instr in context.cfg[loop_basic_block][INSTRS]:
+            if not ((is_add(instr) or is_sub(instr)) and is_int(instr)):
+                continue
+            def_var = instr[DEST]
+            if len(context.loop_defs[def_var]) != 1:
+                continue
+            (left, right) = instr[ARGS]
+            if left == def_var and right != def_var:
+                e = right
+            elif right == def_var and left != def_var and is_add(instr):
+                e = left
+            else:
+                continue
+            e_val = context.invariant_value(e, instr)
+            if e_val == None:
+                continue
+            # i needs an initial value for the preheader to use
+            if id(instr) not in context.use_defs:
+                continue
+            i_defs = context.use_defs[id(instr)][def_var]
+            if not any(not context.in_loop(d) for d in i_defs):
+                continue
+            basic_ivs[def_var] = BasicInductionVariable(
+                id(instr), def_var, e, e_val, loop_basic_block, is_add(instr))
+    return basic_ivs
 
-    def __str__(self) -> str:
-        return f"{self.j} = {self.c} * {self.i} + {self.d} @{self.j_id}, {self.basic_block}"
 
-    def __repr__(self) -> str:
-        return self.__str__()
+def find_mul_ivs(context, basic_ivs):
+    """
+    Find all multiplications a = c * i in the loop, where i is a basic
+    induction variable and c is loop invariant
+    """
+    mul_ivs = []
+    for loop_basic_block in context.loop_blocks:
+        for instr in context.cfg[loop_basic_block][INSTRS]:
+            if not (is_mul(instr) and is_int(instr)):
+                continue
+            (left, right) = instr[ARGS]
+            for (i, c) in [(left, right), (right, left)]:
+                if i in basic_ivs and c != i:
+                    c_val = context.invariant_value(c, instr)
+                    if c_val != None:
+                        mul_ivs.append(MulInvariant(
+                            id(instr), instr[DEST], c, i, c_val, loop_basic_block))
+                        break
+    return mul_ivs
+
+
+def materialize(value, preheader_instrs):
+    """
+    Variable holding value in the preheader: value itself if it is a
+    variable, or a constant
+    """
+    if type(value) == str:
+        return value
+    for instr in preheader_instrs:
+        if is_const(instr) and instr[VALUE] == value:
+            return instr[DEST]
+    var = gen_new_var()
+    preheader_instrs.append(build_const(var, INT, value))
+    return var
 
 
-def find_basic_ivs(cfg, loop_blocks, var_invariant_map):
+def multiply(val1, val2, preheader_instrs):
+    """
+    Variable holding val1 * val2 in the preheader, folded if both are constants
     """
-    Find all instructions in loop_basic_block of cfg that satisfy
-    the form
-    i += e
-    where i is defined exactly once in the loop and e is loop invariant
+    if type(val1) == int and type(val2) == int:
+        return materialize(wrap_int(val1 * val2), preheader_instrs)
+    var = gen_new_var()
+    preheader_instrs.append(build_mul(var, materialize(
+        val1, preheader_instrs), materialize(val2, preheader_instrs)))
+    return var
 
-    var_invariant_map maps a variable to whether variable is loop ivnariant or not
 
-    loop_blocks are all the blocks in the loop
+def replace_instr(cfg, block, identifier, new_instrs):
     """
-    basic_ivs = OrderedDict()
-    for loop_basic_block in loop_blocks:
-        for instr in cfg[loop_basic_block][INSTRS]:
-            if is_add(instr):
-                # check i defined only once in the loop
-                defined_once = True
-                for b in loop_blocks:
-                    for b_instr in cfg[b][INSTRS]:
-                        if DEST in b_instr and id(b_instr) != id(instr) and b_instr[DEST] == instr[DEST]:
-                            defined_once = False
-                if not defined_once:
-                    continue
+    Replace the instruction with id identifier in block with new_instrs
+    """
+    final_instrs = []
+    for instr in cfg[block][INSTRS]:
+        if id(instr) == identifier:
+            final_instrs += new_instrs
+        else:
+            final_instrs.append(instr)
+    cfg[block][INSTRS] = final_instrs
 
-                # check i = i + e form
-                def_var = instr[DEST]
-                args = instr[ARGS]
-                if def_var not in args:
-                    continue
 
-                # check e is loop invariant
-                other_arg_invariant = False
-                other_arg = None
-                for a in args:
-                    if a in var_invariant_map and var_invariant_map[a] == LOOP_INVARIANT:
-                        other_arg_invariant = True
-                        other_arg = a
-                if not other_arg_invariant:
-                    continue
+def strength_reduce(context, basic_ivs, mul_ivs, preheader_instrs):
+    """
+    Replace every a = c * i by a = id t, with t = c * i maintained by additions
 
-                # to be restrictive about e, check it is a cosntant
-                is_constant = False
-                constant_instr = None
-                for other_block in loop_blocks:
-                    for other_instr in cfg[other_block][INSTRS]:
-                        if DEST in other_instr and other_instr[DEST] == other_arg:
-                            constant_instr = other_instr
-                            is_constant = is_const(
-                                constant_instr) and is_int(constant_instr)
-                if not is_constant:
+    Returns a map from each basic induction variable to the (t, c_val) pairs
+    tracking multiples of it
+    """
+    reduced = OrderedDict()
+    # one t for every (i, c) pair
+    tracked = OrderedDict()
+    for mul_iv in mul_ivs:
+        basic_iv = basic_ivs[mul_iv.i]
+        key = (mul_iv.i, mul_iv.c_val)
+        if key not in tracked:
+            t = gen_new_var()
+            c = materialize(mul_iv.c_val, preheader_instrs)
+            preheader_instrs.append(build_mul(t, mul_iv.i, c))
+            step = multiply(mul_iv.c_val, basic_iv.e_val, preheader_instrs)
+            if basic_iv.is_incr:
+                t_update = build_add(t, t, step)
+            else:
+                t_update = build_sub(t, t, step)
+            i_instr = None
+            for instr in context.cfg[basic_iv.basic_block][INSTRS]:
+                if id(instr) == basic_iv.i_id:
+                    i_instr = instr
+            assert i_instr != None
+            replace_instr(context.cfg, basic_iv.basic_block,
+                          basic_iv.i_id, [i_instr, t_update])
+            tracked[key] = t
+            reduced.setdefault(mul_iv.i, []).append((t, mul_iv.c_val))
+        if not propagate_locally(context, mul_iv, tracked[key]):
+            replace_instr(context.cfg, mul_iv.basic_block, mul_iv.a_id,
+                          [build_id(mul_iv.a, INT, tracked[key])])
+    return reduced
+
+
+def propagate_locally(context, mul_iv, t):
+    """
+    Replace a by t in all uses of a = c * i, and delete the multiplication,
+    when all those uses follow it in its block with no update of i or t in
+    between. Returns whether the multiplication was deleted.
+    """
+    instrs = context.cfg[mul_iv.basic_block][INSTRS]
+    position = None
+    for idx, instr in enumerate(instrs):
+        if id(instr) == mul_iv.a_id:
+            position = idx
+    if position == None or mul_iv.a_id not in context.instr2def:
+        return False
+    mul_def = context.instr2def[mul_iv.a_id]
+
+    users = set(context.def_uses.get(mul_def, []))
+    local_users = []
+    for instr in instrs[position + 1:]:
+        if len(local_users) == len(users):
+            break
+        if id(instr) in users:
+            if context.use_defs[id(instr)][mul_iv.a] != frozenset([mul_def]):
+                return False
+            local_users.append(instr)
+        if DEST in instr and instr[DEST] in [mul_iv.i, t]:
+            if len(local_users) != len(users):
+                return False
+    if len(local_users) != len(users):
+        return False
+
+    for instr in local_users:
+        instr[ARGS] = [t if a == mul_iv.a else a for a in instr[ARGS]]
+    replace_instr(context.cfg, mul_iv.basic_block, mul_iv.a_id, [])
+    return True
+
+
+def replace_tests(context, reduced, preheader_instrs):
+    """
+    Linear Function Test Replacement: rewrite i < n as t < c * n, for a t
+    tracking c * i with c a nonzero constant, and n loop invariant
+    """
+    for block in context.loop_blocks:
+        for instr in list(context.cfg[block][INSTRS]):
+            if not is_cmp(instr):
+                continue
+            (left, right) = instr[ARGS]
+            for iv_idx, i in enumerate([left, right]):
+                n = right if iv_idx == 0 else left
+                if i not in reduced or n == i:
                     continue
-
-                # add loop invariant instructions
-                assert other_arg != None and constant_instr != None
-                basic_ivs[def_var] = BasicInductionVariable(
-                    id(instr), def_var, other_arg, constant_instr[VALUE], loop_basic_block)
-
-    return basic_ivs
-
-
-def find_derived_ivs(cfg, loop_blocks, var_invariant_map, basic_variable_map):
-    """
-    Find defintions like j = c * i + d
-    where i is a basic indution variable and c, d are loop invariant
-
-    We look for definitions j = a + d where d itself is loop invariant
-    and a is c * i, c is loop invariant, i is basic.
-    """
-    derived_ivs = OrderedDict()
-    mul_invariant_map = OrderedDict()
-    const_map = OrderedDict()
-
-    has_changed = True
-    while has_changed:
-        old_derived_ivs = deepcopy(derived_ivs)
-        old_mul_invariant_map = deepcopy(mul_invariant_map)
-        old_const_map = deepcopy(const_map)
-
-        for loop_basic_block in loop_blocks:
-            for instr in cfg[loop_basic_block][INSTRS]:
-                instr_id = id(instr)
-                if is_mul(instr):
-                    def_var = instr[DEST]
-                    # check only 1 defintion of this variable in the loop
-                    has_one_def = True
-                    for other_block in loop_blocks:
-                        for other_instr in cfg[other_block][INSTRS]:
-                            if DEST in other_instr and id(other_instr) != instr_id and other_instr[DEST] == def_var:
-                                has_one_def = False
-
-                    if has_one_def:
-                        left = instr[ARGS][0]
-                        right = instr[ARGS][1]
-                        if left in basic_variable_map and right in var_invariant_map:
-                            mul_inv = MulInvariant(
-                                instr_id, def_var, right, left)
-                            mul_invariant_map[def_var] = mul_inv
-                        elif right in basic_variable_map and left in var_invariant_map:
-                            mul_inv = MulInvariant(
-                                instr_id, def_var, left, right)
-                            mul_invariant_map[def_var] = mul_inv
-
-                elif is_const(instr):
-                    def_var = instr[DEST]
-                    # check only 1 defintion of this variable in the loop
-                    has_one_def = True
-                    for other_block in loop_blocks:
-                        for other_instr in cfg[other_block][INSTRS]:
-                            if DEST in other_instr and id(other_instr) != instr_id and other_instr[DEST] == def_var:
-                                has_one_def = False
-
-                    if has_one_def and instr[TYPE] == INT:
-                        val = instr[VALUE]
-                        const_map[def_var] = val
-
-                elif is_add(instr):
-                    def_var = instr[DEST]
-                    # check only 1 defintion of this variable in the loop
-                    has_one_def = True
-                    for other_block in loop_blocks:
-                        for other_instr in cfg[other_block][INSTRS]:
-                            if DEST in other_instr and id(other_instr) != instr_id and other_instr[DEST] == def_var:
-                                has_one_def = False
-
-                    if has_one_def:
-                        left = instr[ARGS][0]
-                        right = instr[ARGS][1]
-                        if left in mul_invariant_map and right in const_map:
-                            derived_inv = DerivedInductionVariable(
-                                instr_id, def_var, mul_invariant_map[left].c, mul_invariant_map[left].i, right, loop_basic_block)
-                            derived_ivs[def_var] = derived_inv
-                        elif right in mul_invariant_map and left in const_map:
-                            derived_inv = DerivedInductionVariable(
-                                instr_id, def_var, mul_invariant_map[right].c, mul_invariant_map[right].i, left, loop_basic_block)
-                            derived_ivs[def_var] = derived_inv
-
-        has_changed = old_derived_ivs == derived_ivs and old_mul_invariant_map == mul_invariant_map and old_const_map == const_map
-
-    return derived_ivs, const_map
-
-
-def replace_ivs(cfg, dom, derived_ivs, basic_ivs, const_map, loop_preheader):
-    """
-    Replaces Induction Variables by changing j's update in the loop after i
-    as well as the initialization of j in the preheader
-    """
-    for _, derived_iv in derived_ivs.items():
-        assert type(derived_iv) == DerivedInductionVariable
-
-        # insert initialization of j in the preheader
-        j = derived_iv.j
-        i = derived_iv.i
-        c = derived_iv.c
-        d = derived_iv.d
-        e = basic_ivs[i]
-        e_val = e.e_val
-
-        # we must have a definite domination relation between j's bb and i's bb
-        j_bb = derived_iv.basic_block
-        j_id = derived_iv.j_id
-        i_bb = e.basic_block
-        i_id = e.i_id
-        i_j_domination_relation = None
-        if i_bb == j_bb:
-            i_idx = None
-            j_idx = None
-            for i, instr in enumerate(cfg[i_bb][INSTRS]):
-                if id(instr) == i_id:
-                    i_idx = i
-                elif id(instr) == j_id:
-                    j_idx = i
-            assert i_idx != None and j_idx != None
-            assert i_idx != j_idx
-            i_j_domination_relation = AFTER_I if i_idx < j_idx else BEFORE_I
-        elif j_bb in dom[i_bb]:
-            i_j_domination_relation = AFTER_I
-        elif i_bb in dom[j_bb]:
-            i_j_domination_relation = BEFORE_I
-
-        # cannot figure out what relation j and i have, bail out
-        if i_j_domination_relation == None:
-            continue
-
-        # insert initializer into preheader
-        j_init_instr1 = {DEST: j, TYPE: INT, OP: CONST, VALUE: const_map[d]}
-        insert_into_bb(cfg, loop_preheader, j_init_instr1)
-
-        # insert update of j in the loop
-        update_var1 = gen_new_var()
-        update_var2 = gen_new_var()
-        j_update_instr1 = {DEST: update_var1,
-                           TYPE: INT, OP: CONST, VALUE: e_val}
-        j_update_instr2 = {DEST: update_var2,
-                           TYPE: INT, OP: MUL, ARGS: [c, update_var1]}
-        j_update_instr3 = {DEST: j, TYPE: INT,
-                           OP: ADD, ARGS: [j, update_var2]}
-        # split into cases on where to insert instructions
-        if i_j_domination_relation == AFTER_I:
-            bb_instrs = cfg[j_bb][INSTRS]
-            new_instrs = []
-            for instr in bb_instrs:
-                if id(instr) == j_id:
-                    # do not add back original instr, as a deletion of j's update
-                    new_instrs.append(j_update_instr1)
-                    new_instrs.append(j_update_instr2)
-                    new_instrs.append(j_update_instr3)
-                else:
-                    new_instrs.append(instr)
-            cfg[j_bb][INSTRS] = new_instrs
-        elif i_j_domination_relation == BEFORE_I:
-            # delete old j update
-            bb_instrs = cfg[j_bb][INSTRS]
-            new_instrs = []
-            for instr in bb_instrs:
-                if id(instr) == j_id:
-                    pass
-                else:
-                    new_instrs.append(instr)
-            cfg[j_bb][INSTRS] = new_instrs
-            # insert after i updates
-            bb_instrs = cfg[i_bb][INSTRS]
-            new_instrs = []
-            for instr in bb_instrs:
-                if id(instr) == i_id:
-                    new_instrs.append(instr)
-                    new_instrs.append(j_update_instr1)
-                    new_instrs.append(j_update_instr2)
-                    new_instrs.append(j_update_instr3)
-                else:
-                    new_instrs.append(instr)
-            cfg[i_bb][INSTRS] = new_instrs
-        else:
-            raise RuntimeError(
-                f"Cannot handle i_j_domination_relation {i_j_domination_relation}.")
+                n_val = context.invariant_value(n, instr)
+                if n_val == None:
+                    continue
+                constant_multiples = [(t, c_val) for (t, c_val) in reduced[i]
+                                      if type(c_val) == int and c_val != 0]
+                if constant_multiples == []:
+                    continue
+                (t, c_val) = constant_multiples[0]
+                bound = multiply(c_val, n_val, preheader_instrs)
+                op = instr[OP] if c_val > 0 else FLIPPED_COMP_OPS[instr[OP]]
+                new_args = [t, bound] if iv_idx == 0 else [bound, t]
+                new_instr = {DEST: instr[DEST],
+                             TYPE: BOOL, OP: op, ARGS: new_args}
+                replace_instr(context.cfg, block, id(instr), [new_instr])
+                break
 
 
-def loop_induction_variables(func_args, cfg, dom, reaching_definitions, natural_loop, preheadermap):
+def delete_dead_ivs(context, basic_ivs, reduced):
+    """
+    Delete the update of every reduced basic induction variable i that is
+    now only used by its own update, and whose loop value is not used after
+    the loop
+    """
+    for i in reduced:
+        basic_iv = basic_ivs[i]
+        used = False
+        for block in context.loop_blocks:
+            for instr in context.cfg[block][INSTRS]:
+                if id(instr) != basic_iv.i_id and ARGS in instr and i in instr[ARGS]:
+                    used = True
+        for user in context.def_uses.get(context.instr2def[basic_iv.i_id], []):
+            if user not in context.loop_ids:
+                used = True
+        if not used:
+            replace_instr(context.cfg, basic_iv.basic_block,
+                          basic_iv.i_id, [])
+
+
+def loop_induction_variables(cfg, natural_loop, preheadermap, use_def_index, def2instr):
     """
-    Calculate and move induction variables for a single loop corresponding to natural loop
+    Strength reduce induction variables of a single loop corresponding to
+    natural loop, then replace tests and delete dead induction variables
     """
     (natural_loop_blocks, _, natural_loop_header, _) = natural_loop
-    loop_instrs = []
-    for block in natural_loop_blocks:
-        for instr in cfg[block][INSTRS]:
-            loop_instrs.append((instr, block))
-    _, var_invariant_map = identify_loop_invariant_instrs(
-        cfg, func_args, natural_loop_blocks, loop_instrs, natural_loop_header, reaching_definitions)
-    basic_ivs = find_basic_ivs(cfg, natural_loop_blocks, var_invariant_map)
-    derived_ivs, const_map = find_derived_ivs(
-        cfg, natural_loop_blocks, var_invariant_map, basic_ivs)
-    replace_ivs(cfg, dom, derived_ivs, basic_ivs, const_map,
-                preheadermap[natural_loop_header])
+    context = LoopContext(cfg, natural_loop_blocks, use_def_index, def2instr)
+    basic_ivs = find_basic_ivs(context)
+    mul_ivs = find_mul_ivs(context, basic_ivs)
+    if mul_ivs == []:
+        return
+
+    preheader_instrs = []
+    reduced = strength_reduce(context, basic_ivs, mul_ivs, preheader_instrs)
+    replace_tests(context, reduced, preheader_instrs)
+    delete_dead_ivs(context, basic_ivs, reduced)
+
+    for instr in preheader_instrs:
+        insert_into_bb(cfg, preheadermap[natural_loop_header], instr)
 
 
 def func_induction_variables(func):
@@ -363,12 +403,6 @@ def func_induction_variables(func):
     """
     natural_loops = get_natural_loops(func)
 
-    # grab args
-    func_args = []
-    if ARGS in func:
-        for a in func[ARGS]:
-            func_args.append(a[NAME])
-
     # add preheaders to loops in func
     old_cfg = form_cfg_w_blocks(func)
     instrs_w_blocks = []
@@ -380,12 +414,21 @@ def func_induction_variables(func):
     func[INSTRS] = new_instrs
     cfg = form_cfg_w_blocks(func)
 
-    reaching_definitions = reaching_defs_func(func)
-    dom, _ = get_dominators_w_cfg(cfg, list(cfg.keys())[0])
+    # chains are built before any instruction changes, and follow instructions by id
+    reaching_definitions = reaching_defs_func(func, bitvector=True)
+    use_def_index = build_use_def_index(cfg, reaching_definitions)
+    (_, _, instr2def) = use_def_index
+    def2instr = OrderedDict()
+    for block in cfg:
+        for instr in cfg[block][INSTRS]:
+            if id(instr) in instr2def:
+                def2instr[instr2def[id(instr)]] = instr
 
-    for natural_loop in natural_loops:
-        loop_induction_variables(
-            func_args, cfg, dom, reaching_definitions, natural_loop, preheadermap)
+    for loop in loops_innermost_first(get_loop_nest_forest(func)):
+        if loop.header not in preheadermap:
+            continue
+        loop_induction_variables(cfg, loop.to_natural_loop(
+            cfg), preheadermap, use_def_index, def2instr)
 
     return join_cfg(cfg)
 
@@ -405,13 +448,13 @@ def induction_variables(prog):
 @click.option('--ive', default=False, help='Run Induction Variable Elimination Original Program.')
 def main(pretty_print, ive):
     prog = json.load(sys.stdin)
-    if pretty_print == 'True':
+    if pretty_print:
         print(json.dumps(prog, indent=4, sort_keys=True))
-    if ive == 'True':
+    if ive:
         final_prog = induction_variables(prog)
     else:
         final_prog = prog
-    if pretty_print == 'True':
+    if pretty_print:
         print(json.dumps(final_prog, indent=4, sort_keys=True))
     print(json.dumps(final_prog))
 
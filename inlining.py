@@ -1,5 +1,8 @@
 """
 Aggresively Inline Every Possible Function into a main function
+
+If functions are annotated with an execution profile (see
+execution_profile.py), call sites that never executed are not inlined.
 """
 
 from copy import deepcopy
@@ -9,6 +12,7 @@ import json
 
 from bril_core_constants import *
 from bril_core_utilities import *
+from execution_profile import call_site_counts, call_site_is_hot
 
 
 LABEL_SUFFIX = "inlined"
@@ -117,15 +121,23 @@ def add_new_unique_exit(func, unique_exit_name, new_ret_var_name):
     return has_ret_var
 
 
-def inline_from_into(func1_name, func1, func2_name, func2):
+def inline_from_into(func1_name, func1, func2_name, func2, call_counts=None):
     """
     Inline function 1 into function2, ASSUMING it is possible
+
+    call_counts maps ids of call instructions to (call instruction,
+    execution count) pairs; cold call sites are not inlined, and calls
+    copied out of function 1 take the counts of the calls they copy.
     """
+    if call_counts == None:
+        call_counts = dict()
 
     # grab call sites of func1 in func2
     func1_call_sites = set()
     for instr in func2[INSTRS]:
         if is_call(instr) and instr[FUNCS][0] == func1_name:
+            if id(instr) in call_counts and not call_site_is_hot(call_counts[id(instr)][1]):
+                continue
             func1_call_sites.add(id(instr))
 
     # iterate over every call site of func1 in func2
@@ -138,6 +150,9 @@ def inline_from_into(func1_name, func1, func2_name, func2):
 
         # copy func1 in its entirety
         func1copy = deepcopy(func1)
+        for (func1_instr, copy_instr) in zip(func1[INSTRS], func1copy[INSTRS]):
+            if id(func1_instr) in call_counts:
+                call_counts[id(copy_instr)] = (copy_instr, call_counts[id(func1_instr)][1])
 
         # then change all of func1's variables to be unique, includign its arguments
         # and then change all of func1's labels to be unique
@@ -236,6 +251,15 @@ def inline(prog):
     call_graph = build_call_graph(prog)
     sorted_funcs = topological_sort(call_graph)
     funcs = prog[FUNCTIONS]
+
+    # profiled call counts, before inlining changes any calls; the pairs
+    # keep the calls alive, so their ids are not reused
+    call_counts = dict()
+    for func in funcs:
+        func_call_counts = call_site_counts(func)
+        if func_call_counts != None:
+            for (instr, count) in func_call_counts:
+                call_counts[id(instr)] = (instr, count)
     for callee_func_name in sorted_funcs:
         # irreducible
         if type(callee_func_name) == tuple:
@@ -255,7 +279,7 @@ def inline(prog):
                     callee_func = func
             assert callee_func != None
             inline_from_into(callee_func_name, callee_func,
-                             caller_func_name, caller_func)
+                             caller_func_name, caller_func, call_counts)
 
     return prog
 
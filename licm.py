@@ -1,14 +1,16 @@
-from copy import deepcopy
 from collections import OrderedDict
 import click
 import sys
 import json
 
-from cfg import form_cfg_w_blocks, join_cfg, INSTRS
+from cfg import form_cfg_w_blocks, form_blocks, form_block_dict, join_cfg, INSTRS
 from reaching_definitions import reaching_defs_func
-from dominator_utilities import get_natural_loops, build_dominance_tree
-from bril_core_utilities import has_side_effects, is_label, is_jmp, is_br
+from analysis_manager import AnalysisManager, NATURAL_LOOPS, DOMINANCE_TREE, LOOP_NEST_FOREST
+from dominator_utilities import loops_innermost_first
+from execution_profile import loop_is_hot
+from bril_core_utilities import has_side_effects, is_label, is_jmp, is_br, is_const, is_id, is_unop, is_binop
 from bril_core_constants import *
+from bril_float_constants import FLOAT_OPS
 
 
 LOOP_INVARIANT = True
@@ -23,6 +25,16 @@ NEW_CFG_LABEL = "new.cfg.label"
 NEW_CFG_LABEL_IDX = 0
 
 
+HOISTED_VAR_COUNTER = 0
+HOISTED_VAR_SUFFIX = "licm"
+
+
+def gen_hoisted_var(var):
+    global HOISTED_VAR_COUNTER
+    HOISTED_VAR_COUNTER += 1
+    return f"{var}.{HOISTED_VAR_SUFFIX}.{HOISTED_VAR_COUNTER}"
+
+
 def gen_loop_preheader():
     global LOOP_PREHEADER_COUNTER
     LOOP_PREHEADER_COUNTER += 1
@@ -81,98 +93,119 @@ def insert_preheaders(natural_loops, instrs_w_blocks):
     return preheadermap, final_instrs
 
 
-def identify_li_recursive(cfg, reaching_definitions, func_args, loop_blocks, basic_block, instrs_invariant_map, var_invariant_map):
-    (in_dict, _) = reaching_definitions
-    for basic_block in loop_blocks:
-        instrs = cfg[basic_block][INSTRS]
-        for instr in instrs:
-            # constants
-            if VALUE in instr and DEST in instr:
-                # constants have no arguments, so we just need to make sure there is exactly 1 definition in the loop
-                val_is_loop_invariant = True
-                for other_block in loop_blocks:
-                    for other_instr in cfg[other_block][INSTRS]:
-                        if DEST in other_instr and id(instr) != id(other_instr):
-                            if other_instr[DEST] == instr[DEST]:
-                                val_is_loop_invariant = False
-                instrs_invariant_map[id(
-                    instr)] = LOOP_INVARIANT if val_is_loop_invariant else NOT_LOOP_INVARIANT
-                var_invariant_map[instr[DEST]
-                                  ] = LOOP_INVARIANT if val_is_loop_invariant else NOT_LOOP_INVARIANT
-            # consider instructions with arguments
-            elif ARGS in instr and DEST in instr:
-                args = instr[ARGS]
-                dst = instr[DEST]
-                is_loop_invariant = True
-                for x in args:
-                    # condition 1: Arguments are defined by
-                    # values defined outside of loop
-                    x_reaches_from_outside_loop = True
-                    for block in cfg:
-                        for (_, var) in in_dict[block]:
-                            if var == dst and block in loop_blocks:
-                                x_reaches_from_outside_loop = False
-                                break
-                        if not x_reaches_from_outside_loop:
-                            break
-                    if x_reaches_from_outside_loop:
-                        continue
-
-                    # condition 2: Arguments are defined exactly once
-                    # inside the entire function (not just loop), and the argument itself was
-                    # marked as loop invariant
-                    # We make sure to add function arguments as definitions
-                    x_def_counter = 0
-                    for a in func_args:
-                        if a == dst:
-                            x_def_counter += 1
-                    for def_instr in instrs:
-                        if DEST in def_instr:
-                            other_dst = def_instr[DEST]
-                            if other_dst == dst:
-                                x_def_counter += 1
-                    if x_def_counter == 1 and (x in var_invariant_map and var_invariant_map[x]):
-                        continue
-
-                    is_loop_invariant = False
-                    break
+def is_pure(instr):
+    """
+    Instructions whose result depends only on their arguments, and which can
+    therefore be loop invariant
+    """
+    return DEST in instr and (is_const(instr) or is_id(instr) or is_unop(instr)
+                              or is_binop(instr) or (OP in instr and instr[OP] in FLOAT_OPS))
 
-                if is_loop_invariant:
-                    instrs_invariant_map[id(instr)] = LOOP_INVARIANT
-                    var_invariant_map[dst] = LOOP_INVARIANT
-                else:
-                    instrs_invariant_map[id(instr)] = NOT_LOOP_INVARIANT
-                    var_invariant_map[dst] = NOT_LOOP_INVARIANT
-            else:
-                instrs_invariant_map[id(instr)] = NOT_LOOP_INVARIANT
 
-    return instrs_invariant_map, var_invariant_map
+def build_use_def_index(cfg, reaching_definitions):
+    """
+    Precompute the use-def and def-use chains of a function from its reaching
+    definitions
 
+    Definitions are numbered as in reaching_definitions.number_instrs, with
+    function arguments numbered -1, -2, ...
 
-def identify_loop_invariant_instrs(cfg, func_args, loop_blocks, loop_instrs, loop_header, reaching_definitions):
+    Returns (use_defs, def_uses, instr2def):
+    use_defs maps id(instr) to a map from each argument of instr to the
+    frozenset of definitions of that argument reaching instr,
+    def_uses maps a definition to the ids of the instructions using it, and
+    instr2def maps id(instr) to the definition instr makes.
+    """
+    (in_dict, _) = reaching_definitions
+    use_defs = OrderedDict()
+    def_uses = OrderedDict()
+    instr2def = OrderedDict()
+    i = 1
+    for block_name in cfg:
+        current_defs = OrderedDict()
+        for (idx, var) in in_dict[block_name]:
+            current_defs.setdefault(var, set()).add(idx)
+        for instr in cfg[block_name][INSTRS]:
+            if ARGS in instr:
+                arg_defs = OrderedDict()
+                for a in instr[ARGS]:
+                    arg_defs[a] = frozenset(current_defs.get(a, set()))
+                for definitions in arg_defs.values():
+                    for d in definitions:
+                        def_uses.setdefault(d, []).append(id(instr))
+                use_defs[id(instr)] = arg_defs
+            if DEST in instr:
+                current_defs[instr[DEST]] = {i}
+                instr2def[id(instr)] = i
+            i += 1
+    return use_defs, def_uses, instr2def
+
+
+def identify_loop_invariant_instrs(cfg, func_args, loop_blocks, loop_instrs, loop_header, reaching_definitions, use_def_index=None):
     """
     For a Given Loop, identify those instructions in the loop that are loop invariant
+
+    A pure instruction is loop invariant once every definition of each of its
+    arguments reaching it is outside the loop, or is the only reaching
+    definition and is itself loop invariant. Instructions are marked with a
+    worklist over the def-use chains, so each chain is followed once.
+
+    use_def_index is the result of build_use_def_index, and is computed if
+    not given.
     """
     assert loop_header in loop_blocks
+    if use_def_index == None:
+        use_def_index = build_use_def_index(cfg, reaching_definitions)
+    (use_defs, def_uses, instr2def) = use_def_index
+
+    id2loop_instr = OrderedDict()
+    loop_defs = set()
+    for loop_instr, _ in loop_instrs:
+        id2loop_instr[id(loop_instr)] = loop_instr
+        if id(loop_instr) in instr2def:
+            loop_defs.add(instr2def[id(loop_instr)])
 
     # mark all insdtructions as not loop invariant
     instrs_invariant_map = OrderedDict()
     for loop_instr, _ in loop_instrs:
         instrs_invariant_map[id(loop_instr)] = NOT_LOOP_INVARIANT
 
-    continue_while = True
-    while continue_while:
-        old_loop_instrs = deepcopy(loop_instrs)
-
-        var_invariant_map = OrderedDict()
-        for loop_instr, _ in loop_instrs:
-            if DEST in loop_instr:
-                var_invariant_map[loop_instr[DEST]] = NOT_LOOP_INVARIANT
-        instrs_invariant_map, var_invariant_map = identify_li_recursive(cfg, reaching_definitions, func_args, loop_blocks, loop_header,
-                                                                        instrs_invariant_map, var_invariant_map)
-
-        if loop_instrs == old_loop_instrs:
-            continue_while = False
+    # number of arguments of each candidate waiting on a loop definition
+    pending = OrderedDict()
+    worklist = []
+    for identifier, loop_instr in id2loop_instr.items():
+        if not is_pure(loop_instr):
+            continue
+        waiting = 0
+        for definitions in use_defs.get(identifier, {}).values():
+            if definitions.isdisjoint(loop_defs):
+                continue
+            if len(definitions) != 1:
+                # a loop definition is one of several reaching definitions
+                waiting = None
+                break
+            waiting += 1
+        if waiting == None:
+            continue
+        pending[identifier] = waiting
+        if waiting == 0:
+            worklist.append(identifier)
+
+    while worklist != []:
+        identifier = worklist.pop()
+        instrs_invariant_map[identifier] = LOOP_INVARIANT
+        for user in def_uses.get(instr2def[identifier], []):
+            if user in pending and pending[user] > 0:
+                pending[user] -= 1
+                if pending[user] == 0:
+                    worklist.append(user)
+
+    var_invariant_map = OrderedDict()
+    for loop_instr, _ in loop_instrs:
+        if DEST in loop_instr:
+            dst = loop_instr[DEST]
+            var_invariant_map[dst] = var_invariant_map.get(
+                dst, LOOP_INVARIANT) and instrs_invariant_map[id(loop_instr)]
 
     return instrs_invariant_map, var_invariant_map
 
@@ -185,12 +218,63 @@ def gather_nodes(node, dominator_tree, natural_loop_nodes):
     return nodes
 
 
-def filter_loop_invariant_instrs(cfg, natural_loop, dominator_tree, loop_instrs, loop_instrs_map, id2instr):
+def only_reaching_def(identifier, var, use_def_index):
+    """
+    Whether the definition of var made by instruction identifier is the only
+    definition of var reaching each of its uses
+    """
+    (use_defs, def_uses, instr2def) = use_def_index
+    definition = instr2def[identifier]
+    for user in def_uses.get(definition, []):
+        if use_defs[user].get(var) != frozenset([definition]):
+            return False
+    return True
+
+
+def filter_loop_invariant_instrs(cfg, natural_loop, dominator_tree, loop_instrs, loop_instrs_map, id2instr, use_def_index):
     """
     Filter loop invariant insdtructions to only those that can be moved out of the loop
+
+    Returns the identifiers of the instructions to move, and the subset of
+    those defining a variable that is defined again in the loop, e.g. the
+    temporary lidx in lidx = mul row size; lidx = add lidx i. Those are
+    moved under a fresh name, see rename_hoisted_def.
     """
     (natural_loop_nodes, _, header, exits) = natural_loop
 
+    # position of every instruction in its block, first use of every variable
+    # in a block, and the loop blocks using every variable
+    positions = OrderedDict()
+    first_use = OrderedDict()
+    use_blocks = OrderedDict()
+    used_after_loop = set()
+    for block in cfg:
+        for i, instr in enumerate(cfg[block][INSTRS]):
+            positions[id(instr)] = i
+            if ARGS not in instr:
+                continue
+            for arg in instr[ARGS]:
+                if block in natural_loop_nodes:
+                    first_use.setdefault((block, arg), i)
+                    use_blocks.setdefault(arg, set()).add(block)
+                else:
+                    used_after_loop.add(arg)
+
+    dest_counts = OrderedDict()
+    for instr, _ in loop_instrs:
+        if DEST in instr:
+            dest_counts[instr[DEST]] = dest_counts.get(instr[DEST], 0) + 1
+
+    all_loop_dominated_blocks = set(gather_nodes(
+        header, dominator_tree, natural_loop_nodes))
+    dominated_blocks_map = OrderedDict()
+
+    def dominated_blocks(block):
+        if block not in dominated_blocks_map:
+            dominated_blocks_map[block] = set(gather_nodes(
+                block, dominator_tree, natural_loop_nodes))
+        return dominated_blocks_map[block]
+
     # loop invariant status fklter
     status_filter = []
     for identifier, status in loop_instrs_map.items():
@@ -203,87 +287,81 @@ def filter_loop_invariant_instrs(cfg, natural_loop, dominator_tree, loop_instrs,
         def_instr, identifier_block = id2instr[identifier]
         dst = def_instr[DEST]
 
-        # get position in block
-        position = None
-        for i, instr in enumerate(cfg[identifier_block][INSTRS]):
-            if id(instr) == identifier:
-                position = i
-                break
-        assert position != None
-
         # interblock check
-        does_dominate = True
-        for i, instr in enumerate(cfg[identifier_block][INSTRS]):
-            if ARGS in instr and dst in instr[ARGS]:
-                if i < position:
-                    does_dominate = False
-                    break
-
-        # accumulate all uses
-        dominated_blocks = set(gather_nodes(
-            identifier_block, dominator_tree, natural_loop_nodes))
-        all_loop_dominated_blocks = set(gather_nodes(
-            header, dominator_tree, natural_loop_nodes
-        ))
-        does_not_dominate_blocks = all_loop_dominated_blocks.difference(
-            dominated_blocks)
+        position = positions[identifier]
+        does_dominate = first_use.get((identifier_block, dst), position) >= position
 
-        for block in does_not_dominate_blocks:
-            block_instrs = cfg[block][INSTRS]
-            for instr in block_instrs:
-                if ARGS in instr and dst in instr[ARGS]:
-                    does_dominate = False
-                    break
+        # all uses in the loop are in blocks the instruction dominates
+        does_not_dominate_blocks = all_loop_dominated_blocks.difference(
+            dominated_blocks(identifier_block))
+        if not does_not_dominate_blocks.isdisjoint(use_blocks.get(dst, set())):
+            does_dominate = False
 
         if does_dominate:
             dominate_filter.append(identifier)
 
-    # check no other definitions in same loop,
+    # check no other definitions in same loop, or that the definition is the
+    # only one reaching its uses, which can then read it under a fresh name
     def_filter = []
+    renamed = set()
     for identifier in dominate_filter:
         def_instr, _ = id2instr[identifier]
-        dest = def_instr[DEST]
-        dest_count = 0
-        for instr, _ in loop_instrs:
-            if DEST in instr and instr[DEST] == dest:
-                dest_count += 1
-
-        if dest_count <= 1:
+        dst = def_instr[DEST]
+        if dest_counts[dst] <= 1:
+            def_filter.append(identifier)
+        elif only_reaching_def(identifier, dst, use_def_index):
             def_filter.append(identifier)
+            renamed.add(identifier)
 
     # check instruction dominates all exits
     exit_filter = []
     for identifier in def_filter:
         def_instr, identifier_block = id2instr[identifier]
-        dominated_blocks = set(gather_nodes(
-            identifier_block, dominator_tree, natural_loop_nodes))
 
         dominates_exits = True
         for (start_node, _) in exits:
-            if start_node not in dominated_blocks:
+            if start_node not in dominated_blocks(identifier_block):
                 dominates_exits = False
 
         # Side condition: If variable is dead after loop and has no side effects
-        used_after_loop = False
-        for after_block in cfg:
-            if after_block not in natural_loop_nodes:
-                for after_instr in cfg[after_block][INSTRS]:
-                    if ARGS in after_instr and DEST in def_instr:
-                        for arg in after_instr[ARGS]:
-                            if arg == def_instr[DEST]:
-                                used_after_loop = True
-
-        no_side_effects = False
-        if not has_side_effects(def_instr):
-            no_side_effects = True
-
-        if not used_after_loop and no_side_effects:
+        dead_after_loop = def_instr[DEST] not in used_after_loop
+        if identifier in renamed:
+            # other definitions of the variable are left in place, so only
+            # the uses of this definition read the fresh name
+            (_, def_uses, instr2def) = use_def_index
+            loop_ids = set(id2instr)
+            dead_after_loop = all(user in loop_ids for user in def_uses.get(
+                instr2def[identifier], []))
+        if dead_after_loop and not has_side_effects(def_instr):
             dominates_exits = True
 
         if dominates_exits:
             exit_filter.append(identifier)
 
-    return exit_filter
+    return exit_filter, renamed.intersection(exit_filter)
+
+
+def rename_hoisted_def(cfg, identifier, id2instr, use_def_index):
+    """
+    Give the definition made by instruction identifier a fresh name, read
+    by all of its uses
+
+    The definition is the only one reaching its uses, so they read the same
+    value from the hoisted definition, and other definitions of the variable
+    in the loop no longer see it overwritten at the start of every iteration.
+    Returns the fresh name.
+    """
+    (_, def_uses, instr2def) = use_def_index
+    users = set(def_uses.get(instr2def[identifier], []))
+    def_instr, _ = id2instr[identifier]
+    var = def_instr[DEST]
+    fresh = gen_hoisted_var(var)
+    def_instr[DEST] = fresh
+    for block in cfg:
+        for instr in cfg[block][INSTRS]:
+            if id(instr) in users:
+                instr[ARGS] = [fresh if a == var else a for a in instr[ARGS]]
+    return fresh
 
 
 def insert_into_bb(cfg, basic_block, instr):
@@ -366,7 +444,9 @@ def move_instructions(cfg, header, preheadermap, identifiers_to_move, id2instr,
     return
 
 
-def loop_licm(natural_loop, cfg, func_args, preheadermap, reaching_definitions, dominance_tree):
+def loop_licm(natural_loop, cfg, func_args, preheadermap, reaching_definitions, dominance_tree, use_def_index=None):
+    if use_def_index == None:
+        use_def_index = build_use_def_index(cfg, reaching_definitions)
     # Grab the instructions in a loop
     (loop_blocks, _, header, _) = natural_loop
     loop_instrs = []
@@ -379,17 +459,18 @@ def loop_licm(natural_loop, cfg, func_args, preheadermap, reaching_definitions,
                     vars_inside_loop.add(instr[DEST])
 
     loop_instrs_map, _ = identify_loop_invariant_instrs(
-        cfg, func_args, loop_blocks, loop_instrs, header, reaching_definitions)
+        cfg, func_args, loop_blocks, loop_instrs, header, reaching_definitions, use_def_index)
 
     # buold map from id to identifier
     id2instr = OrderedDict()
-    for identifier in loop_instrs_map:
-        for instr, block_name in loop_instrs:
-            if id(instr) == identifier:
-                id2instr[identifier] = (instr, block_name)
+    for instr, block_name in loop_instrs:
+        id2instr[id(instr)] = (instr, block_name)
 
-    identifiers_to_move = filter_loop_invariant_instrs(
-        cfg, natural_loop, dominance_tree, loop_instrs, loop_instrs_map, id2instr)
+    identifiers_to_move, renamed = filter_loop_invariant_instrs(
+        cfg, natural_loop, dominance_tree, loop_instrs, loop_instrs_map, id2instr, use_def_index)
+    for identifier in renamed:
+        vars_inside_loop.add(rename_hoisted_def(
+            cfg, identifier, id2instr, use_def_index))
 
     move_instructions(cfg, header, preheadermap, identifiers_to_move,
                       id2instr, vars_inside_loop, set())
@@ -397,37 +478,53 @@ def loop_licm(natural_loop, cfg, func_args, preheadermap, reaching_definitions,
     return cfg
 
 
-def func_licm(func):
-    natural_loops = get_natural_loops(func)
-    old_cfg = form_cfg_w_blocks(func)
+def func_licm(func, am=None):
+    if am == None:
+        am = AnalysisManager()
+    natural_loops = am.get(func, NATURAL_LOOPS)
+    old_blocks = form_block_dict(form_blocks(func[INSTRS]))
     instrs_w_blocks = []
-    for block in old_cfg:
-        for instr in old_cfg[block][INSTRS]:
+    for block in old_blocks:
+        for instr in old_blocks[block]:
             instrs_w_blocks.append((instr, block))
     preheadermap, new_instrs = insert_preheaders(
         natural_loops, instrs_w_blocks)
     func[INSTRS] = new_instrs
+    # preheaders change the cfg
+    am.invalidate(func)
     cfg = form_cfg_w_blocks(func)
-    reaching_definitions = reaching_defs_func(func)
-    dominance_tree, _ = build_dominance_tree(func)
+    reaching_definitions = reaching_defs_func(func, bitvector=True)
+    # chains are built before any instruction moves, and follow instructions by id
+    use_def_index = build_use_def_index(cfg, reaching_definitions)
+    dominance_tree, _ = am.get(func, DOMINANCE_TREE)
     func_args = []
     if ARGS in func:
         for a in func[ARGS]:
             func_args.append(a[NAME])
 
-    for natural_loop in natural_loops:
-        cfg = loop_licm(natural_loop, cfg, func_args, preheadermap,
-                        reaching_definitions, dominance_tree)
+    # innermost loops first, so invariants hoisted into the preheader of an
+    # inner loop, which lies in the outer loop, can be hoisted again
+    loop_nest_forest = am.get(func, LOOP_NEST_FOREST)
+    for loop in loops_innermost_first(loop_nest_forest):
+        if loop.header not in preheadermap:
+            continue
+        # hoisting out of a loop that never iterates gains nothing
+        if not loop_is_hot(func, loop.header):
+            continue
+        cfg = loop_licm(loop.to_natural_loop(cfg), cfg, func_args, preheadermap,
+                        reaching_definitions, dominance_tree, use_def_index)
 
     return join_cfg(cfg)
 
 
-def licm_main(program):
+def licm_main(program, am=None):
     """
     LICM wrapper function
     """
+    if am == None:
+        am = AnalysisManager()
     for func in program["functions"]:
-        modified_func_instrs = func_licm(func)
+        modified_func_instrs = func_licm(func, am)
         func["instrs"] = modified_func_instrs
     return program
 
@@ -29,6 +29,7 @@ from collections import OrderedDict
 from cfg import form_cfg, form_blocks, form_block_dict
 from bril_core_constants import *
 from worklist_solver import Worklist
+from bit_vector_lattice import BitVectorUniverse, BitVectorLattice, UNION
 
 
 def defs(block):
@@ -92,19 +93,47 @@ def merge(blocks):
     return result
 
 
-def live_variables_func(function):
+def live_variables_bit_vector(entry, cfg, blocks):
+    """
+    Live variables over bit vectors, with variables numbered once
+    for the whole function. Results are converted back into sets.
+    """
+    universe = BitVectorUniverse()
+    for block in blocks.values():
+        for instr in block:
+            if ARGS in instr:
+                for a in instr[ARGS]:
+                    universe.add(a)
+            if DEST in instr:
+                universe.add(instr[DEST])
+
+    bit_blocks = OrderedDict()
+    for name, block in blocks.items():
+        bit_blocks[name] = (universe.to_bits(uses(block)),
+                            universe.to_bits(defs(block)))
+
+    lattice = BitVectorLattice(universe, UNION)
+    worklist = Worklist(entry, cfg, bit_blocks, 0,
+                        lattice.merge, lattice.transfer)
+    (in_dict, out_dict) = worklist.solve_backwards()
+    return (lattice.to_sets(in_dict), lattice.to_sets(out_dict))
+
+
+def live_variables_func(function, bitvector=False):
     cfg = form_cfg(function)
     assert len(cfg) != 0
     entry = list(cfg.items())[0][0]
     blocks = form_block_dict(form_blocks(function["instrs"]))
+    if bitvector:
+        return live_variables_bit_vector(entry, cfg, blocks)
     init = set()
     worklist = Worklist(entry, cfg, blocks, init, merge, transfer)
     return worklist.solve_backwards()
 
 
-def live_variables(program):
+def live_variables(program, bitvector=False):
     for func in program["functions"]:
-        (in_dict, out_dict) = live_variables_func(func)
+        (in_dict, out_dict) = live_variables_func(func, bitvector)
 
         # sort the dictionaries into lists, where we alphabetically order variables
         final_in_dict = OrderedDict()
@@ -138,11 +167,12 @@ def live_variables(program):
 
 @click.command()
 @click.option('--pretty-print', default=False, help='Pretty Print Original Program.')
-def main(pretty_print):
+@click.option('--bitvector', default=False, help='Solve with Bit Vectors instead of Sets.')
+def main(pretty_print, bitvector):
     prog = json.load(sys.stdin)
     if pretty_print:
         print(json.dumps(prog, indent=4, sort_keys=True))
-    live_variables(prog)
+    live_variables(prog, bitvector)
 
 
 if __name__ == "__main__":
@@ -46,12 +46,14 @@ from copy import deepcopy
 import json
 import sys
 import click
+from collections import OrderedDict
 
-from bril_core_constants import ARGS, COMP_OPS, EQ, FUNCTIONS, GE, GT, LABEL, LABELS, LE, LT, OP, VALUE
-from bril_core_utilities import build_br, build_jmp, build_label, build_void_ret, get_args, get_br_labels, has_args, has_dest, get_dest, is_add, is_br, is_cmp, is_const, is_jmp, is_label, is_sub
+from bril_core_constants import ADD, ARGS, BOOL, COMP_OPS, CONST, DEST, EQ, FUNCTIONS, GE, GT, INT, LABEL, LABELS, LE, LT, OP, TYPE, VALUE
+from bril_core_utilities import build_br, build_jmp, build_label, build_void_ret, get_args, get_br_labels, has_args, has_dest, get_dest, is_add, is_br, is_cmp, is_const, is_jmp, is_label, is_ret, is_sub, is_terminator
 
 from cfg import form_cfg_w_blocks, SUCCS, PREDS, INSTRS, insert_into_cfg_w_blocks, join_cfg
-from dominator_utilities import get_dominators, get_natural_loops, get_strict_dominators
+from dominator_utilities import get_dominators, get_natural_loops, get_strict_dominators, get_loop_nest_forest, loops_innermost_first
+from execution_profile import loop_is_hot, loop_trip_count
 
 UNROLL_FACTOR = 2
 assert UNROLL_FACTOR >= 2
@@ -617,6 +619,8 @@ def unroll_func(func):
             continue
 
         (natural_loop, _, header, exits) = loop
+        if not loop_is_hot(func, header):
+            continue
 
         # insert UNROLL_FACTOR copies of headers and loop bodies into the cfg
         header_labels = []
@@ -708,13 +712,326 @@ def unroll_prog(prog):
     return prog
 
 
+########################### PARTIAL UNROLL #####################################
+
+
+# the cost model unrolls loops so the unrolled body has at most
+# UNROLL_BUDGET instructions, by a factor of at most MAX_UNROLL_FACTOR
+UNROLL_BUDGET = 64
+MAX_UNROLL_FACTOR = 8
+
+UNROLL_SUFFIX = "unroll"
+UNROLL_GUARD_SUFFIX = "unroll.guard"
+UNROLL_VAR_NAME = "unroll.var"
+UNROLL_VAR_IDX = 0
+
+# comparison i op n, rewritten as n op' i
+SWAPPED_COMP_OPS = {LT: GT, GT: LT, LE: GE, GE: LE}
+
+
+def gen_unroll_var():
+    global UNROLL_VAR_IDX
+    UNROLL_VAR_IDX += 1
+    return f"{UNROLL_VAR_NAME}.{UNROLL_VAR_IDX}"
+
+
+class PartiallyUnrollableLoop(object):
+    """
+    Represents a loop with a runtime trip count:
+    header: cond = var comp_op bound; br cond body exit
+    where var is bumped by the constant bump_val exactly once per iteration,
+    outside the header, and bound is not defined in the loop
+    """
+
+    def __init__(self, header, blocks, body_entry, var_name, bump_val, bound, comp_op):
+        assert type(header) == str
+        assert type(blocks) == list  # of str, in cfg order
+        assert type(var_name) == str
+        assert type(bump_val) == int
+        assert type(bound) == str
+        assert comp_op in SWAPPED_COMP_OPS
+
+        self.header = header
+        self.blocks = blocks
+        self.body_entry = body_entry
+        self.var_name = var_name
+        self.bump_val = bump_val
+        self.bound = bound
+        self.comp_op = comp_op
+
+    def body_size(self, cfg):
+        size = 0
+        for block in self.blocks:
+            for instr in cfg[block][INSTRS]:
+                if not is_label(instr):
+                    size += 1
+        return size
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    def __str__(self) -> str:
+        return f"{self.var_name} {self.comp_op} {self.bound}; {self.var_name} += {self.bump_val}"
+
+
+def choose_unroll_factor(body_size):
+    """
+    Cost model: the largest factor keeping the unrolled body within
+    UNROLL_BUDGET instructions, at most MAX_UNROLL_FACTOR, or 1 (do not
+    unroll) if not even 2 copies fit
+    """
+    assert body_size > 0
+    return min(MAX_UNROLL_FACTOR, UNROLL_BUDGET // body_size)
+
+
+def is_partially_unrollable(loop, cfg, domby):
+    """
+    A loop can be partially unrolled if it:
+    - is innermost, with a single back edge and a single exit, via the header
+    - has no returns
+    - has a header ending in br cond, where cond = var comp_op bound is
+      defined in the header, comp_op is <, <=, > or >=, and bound is not
+      defined in the loop
+    - updates var exactly once, by var = var + c or var = var - c, with c a
+      nonzero integer constant moving var towards bound, in a block other
+      than the header that dominates the back edge
+    Returns a PartiallyUnrollableLoop, or False.
+    """
+    if loop.children != [] or len(loop.backedges) != 1 or len(loop.exits) != 1:
+        return False
+    header = loop.header
+    (latch, _) = loop.backedges[0]
+    (exiting, _) = loop.exits[0]
+    if exiting != header:
+        return False
+    blocks = [b for b in cfg if b in loop.blocks]
+
+    loop_defs = dict()
+    for block in blocks:
+        for instr in cfg[block][INSTRS]:
+            if is_ret(instr):
+                return False
+            if has_dest(instr):
+                dest = get_dest(instr)
+                loop_defs[dest] = loop_defs.get(dest, []) + [(block, instr)]
+
+    header_instrs = cfg[header][INSTRS]
+    br_instr = header_instrs[-1]
+    if not is_br(br_instr):
+        return False
+    cond_var = br_instr[ARGS][0]
+    body_entry = [l for l in get_br_labels(br_instr) if l in loop.blocks]
+    if len(body_entry) != 1 or body_entry[0] == header:
+        return False
+    body_entry = body_entry[0]
+
+    cmp_instr = None
+    for instr in header_instrs:
+        if has_dest(instr) and get_dest(instr) == cond_var:
+            cmp_instr = instr
+    if cmp_instr == None or not is_cmp(cmp_instr) or cmp_instr[OP] not in SWAPPED_COMP_OPS:
+        return False
+    if len(loop_defs[cond_var]) != 1:
+        return False
+
+    for var_idx in [0, 1]:
+        var = get_args(cmp_instr)[var_idx]
+        bound = get_args(cmp_instr)[1 - var_idx]
+        comp_op = cmp_instr[OP] if var_idx == 0 else SWAPPED_COMP_OPS[cmp_instr[OP]]
+        if bound in loop_defs or var == bound or len(loop_defs.get(var, [])) != 1:
+            continue
+        (update_block, update_instr) = loop_defs[var][0]
+        if update_block == header or update_block not in domby[latch]:
+            continue
+        if not (is_add(update_instr) or is_sub(update_instr)):
+            continue
+        update_args = get_args(update_instr)
+        if update_args[0] == var:
+            step = update_args[1]
+        elif update_args[1] == var and is_add(update_instr):
+            step = update_args[0]
+        else:
+            continue
+        step_val = arg_is_constant(step, cfg)
+        if type(step_val) != int or type(step_val) == bool or step_val == 0:
+            continue
+        bump_val = step_val if is_add(update_instr) else -step_val
+        if comp_op in (LT, LE) and bump_val < 0:
+            continue
+        if comp_op in (GT, GE) and bump_val > 0:
+            continue
+        return PartiallyUnrollableLoop(header, blocks, body_entry, var, bump_val, bound, comp_op)
+    return False
+
+
+def relabel_targets(instr, relabel):
+    """
+    Copy of a jmp or br instruction, with its targets relabeled
+    """
+    if is_jmp(instr):
+        return build_jmp(relabel(instr[LABELS][0]))
+    assert is_br(instr)
+    (label1, label2) = get_br_labels(instr)
+    return build_br(instr[ARGS][0], relabel(label1), relabel(label2))
+
+
+def partially_unroll_loop(unrollable, cfg, factor):
+    """
+    Unroll the loop factor times into a new loop, entered in place of the
+    original loop:
+
+    guard: limit = var + (factor - 1) * bump; if !(limit comp_op bound) goto header
+    copy 0: header (without test); body
+    ...
+    copy factor - 1: header (without test); body; goto guard
+
+    When the guard holds, the next factor iterations all run, so the copies
+    need no exit tests. The original loop is the remainder loop, and runs
+    the last (fewer than factor) iterations. Assumes var + (factor - 1) * bump
+    does not overflow.
+
+    Returns the new cfg.
+    """
+    assert factor >= 2
+    header = unrollable.header
+    loop_blocks = unrollable.blocks
+    guard = f"{header}.{UNROLL_GUARD_SUFFIX}"
+
+    def copy_name(block, i):
+        return f"{block}.{UNROLL_SUFFIX}.{i}"
+
+    new_blocks = OrderedDict()
+
+    # guard
+    offset_var = gen_unroll_var()
+    limit_var = gen_unroll_var()
+    guard_cond_var = gen_unroll_var()
+    new_blocks[guard] = [
+        build_label(guard),
+        {DEST: offset_var, TYPE: INT, OP: CONST,
+            VALUE: (factor - 1) * unrollable.bump_val},
+        {DEST: limit_var, TYPE: INT, OP: ADD,
+            ARGS: [unrollable.var_name, offset_var]},
+        {DEST: guard_cond_var, TYPE: BOOL, OP: unrollable.comp_op,
+            ARGS: [limit_var, unrollable.bound]},
+        build_br(guard_cond_var, copy_name(header, 0), header),
+    ]
+
+    # the copies do not test the condition, so they need not compute it,
+    # unless the body uses it
+    cond_var = cfg[header][INSTRS][-1][ARGS][0]
+    cond_used = False
+    for block in loop_blocks:
+        for instr in cfg[block][INSTRS]:
+            if has_args(instr) and cond_var in get_args(instr) and not (block == header and is_br(instr)):
+                cond_used = True
+
+    # copies
+    names = list(cfg.keys())
+    for i in range(factor):
+        def relabel(label):
+            if label == header:
+                return copy_name(header, i + 1) if i + 1 < factor else guard
+            return copy_name(label, i)
+
+        for block in loop_blocks:
+            instrs = []
+            for instr in cfg[block][INSTRS]:
+                if is_label(instr):
+                    continue
+                if block == header and is_br(instr):
+                    instrs.append(build_jmp(copy_name(unrollable.body_entry, i)))
+                elif block == header and not cond_used and has_dest(instr) and get_dest(instr) == cond_var:
+                    continue
+                elif is_jmp(instr) or is_br(instr):
+                    instrs.append(relabel_targets(instr, relabel))
+                else:
+                    instrs.append(deepcopy(instr))
+            if instrs == [] or not is_terminator(instrs[-1]):
+                # make fall through explicit, as copies are not in cfg order
+                fall_through = names[names.index(block) + 1]
+                instrs.append(build_jmp(relabel(fall_through)))
+            new_blocks[copy_name(block, i)] = [
+                build_label(copy_name(block, i))] + instrs
+
+    # fall through instead of jumping to the next block
+    copy_names = list(new_blocks.keys())
+    for name, next_name in zip(copy_names, copy_names[1:]):
+        last_instr = new_blocks[name][-1]
+        if is_jmp(last_instr) and last_instr[LABELS][0] == next_name:
+            new_blocks[name] = new_blocks[name][:-1]
+
+    # enter the guard instead of the header from outside the loop
+    new_cfg = OrderedDict()
+    for block in cfg:
+        if block == header:
+            for name, instrs in new_blocks.items():
+                new_cfg[name] = {INSTRS: instrs, PREDS: [], SUCCS: []}
+        instrs = cfg[block][INSTRS]
+        if block not in loop_blocks and instrs != [] and (is_jmp(instrs[-1]) or is_br(instrs[-1])):
+            instrs = instrs[:-1] + [relabel_targets(instrs[-1],
+                                                    lambda l: guard if l == header else l)]
+        elif block in loop_blocks and (instrs == [] or not is_terminator(instrs[-1])):
+            # the guard and copies now follow the block falling through to the header
+            fall_through = names[names.index(block) + 1]
+            if fall_through == header:
+                instrs = instrs + [build_jmp(header)]
+        new_cfg[block] = {INSTRS: instrs,
+                          PREDS: cfg[block][PREDS], SUCCS: cfg[block][SUCCS]}
+    return new_cfg
+
+
+def partially_unroll_func(func, factor=None):
+    """
+    Partially unroll every unrollable hot loop of func, by factor, or by the
+    factor chosen by the cost model if factor is None, which is at most the
+    profiled trip count of the loop if func has a profile
+    """
+    cfg = form_cfg_w_blocks(func)
+    if len(cfg) == 0:
+        return func
+    _, domby = get_dominators(func)
+    loops = loops_innermost_first(get_loop_nest_forest(func))
+
+    for loop in loops:
+        if not loop_is_hot(func, loop.header):
+            continue
+        unrollable = is_partially_unrollable(loop, cfg, domby)
+        if type(unrollable) == bool and unrollable == False:
+            continue
+        loop_factor = factor
+        if loop_factor == None:
+            loop_factor = choose_unroll_factor(unrollable.body_size(cfg))
+            # the guard fails every time in loops running fewer iterations
+            trip_count = loop_trip_count(func, loop.header, loop.backedges)
+            if trip_count != None:
+                loop_factor = min(loop_factor, int(trip_count))
+        if loop_factor < 2:
+            continue
+        cfg = partially_unroll_loop(unrollable, cfg, loop_factor)
+
+    func[INSTRS] = join_cfg(cfg)
+    return func
+
+
+def partially_unroll_prog(prog, factor=None):
+    for func in prog[FUNCTIONS]:
+        partially_unroll_func(func, factor)
+    return prog
+
+
 @click.command()
+@click.option('--partial', default=False, help='Partially Unroll Loops with Runtime Trip Counts, with a Remainder Loop.')
+@click.option('--factor', default=0, help='Partial Unrolling Factor; 0 lets the Cost Model Choose.')
 @click.option('--pretty-print', default=False, help='Pretty Print Original Program.')
-def main(pretty_print):
+def main(partial, factor, pretty_print):
     prog = json.load(sys.stdin)
     if pretty_print:
         print(json.dumps(prog, indent=4, sort_keys=True))
-    final_prog = fully_unroll_prog(prog)
+    if partial:
+        final_prog = partially_unroll_prog(prog, factor if factor != 0 else None)
+    else:
+        final_prog = fully_unroll_prog(prog)
     if pretty_print:
         print(json.dumps(prog, indent=4, sort_keys=True))
     print(json.dumps(final_prog))
@@ -31,29 +31,111 @@ import sys
 import json
 
 from collections import OrderedDict
-from bril_core_utilities import build_id, commutes
+from bril_core_utilities import build_id
 
 
 from cfg import form_cfg_w_blocks, join_cfg
 from bril_core_constants import *
+from bril_float_constants import *
+from bril_memory_extension_constants import *
 
 
-LVN_NUMBER = -1
 VARIABLE_NUMBER = -1
 
 
 BLOCK_VAR = "Block Var"
 
 
-def reset_lvn_num():
-    global LVN_NUMBER
-    LVN_NUMBER = -1
+# ops whose value depends only on their arguments, and which can be numbered
+PURE_OPS = [*BRIL_CORE_OPS, ID, CONST, *FLOAT_OPS, PTRADD]
+COMMUTATIVE_OPS = [*BRIL_COMMUTE_BINOPS, FADD, FMUL]
+# a > b is b < a, and a >= b is b <= a
+SWAPPED_COMPARISONS = {GT: LT, GE: LE}
+# ops interpret_lvn_value knows how to evaluate
+INTERPRETED_OPS = [*BRIL_CORE_OPS, ID, CONST]
 
 
-def gen_fresh_lvn_num():
-    global LVN_NUMBER
-    LVN_NUMBER += 1
-    return LVN_NUMBER
+class LVNTable(object):
+    """
+    LVN table, indexed both ways.
+
+    Value numbers are positions in values and homes, the value and the
+    canonical variable (home) of each number. key2num maps the canonical
+    key of each numbered value back to its number, so looking up a value
+    is a single hash lookup.
+
+    Keys are canonicalized when values are added and looked up: commutative
+    operands are sorted, a > b is keyed as b < a (a >= b as b <= a), a * 2 as
+    a + a, and constants are keyed with their type, so true and 1 differ.
+    Values of side effecting ops (calls, memory ops, ...) have no key, and are
+    never reused.
+    """
+
+    def __init__(self) -> None:
+        self.values = []
+        self.homes = []
+        self.key2num = dict()
+
+    def __len__(self):
+        return len(self.values)
+
+    def get_value(self, num):
+        return self.values[num]
+
+    def get_home(self, num):
+        return self.homes[num]
+
+    def is_int_const(self, num, n):
+        value = self.values[num]
+        return lvn_value_is_const(value) and type(value[1]) == int and value[1] == n
+
+    def key(self, lvn_value, typ=None):
+        """
+        Canonical hash key of lvn_value, or None if it can never be reused
+        """
+        op = lvn_value[0]
+        if lvn_value_is_block_var(lvn_value):
+            return lvn_value
+        if op not in PURE_OPS:
+            return None
+        if op == CONST:
+            (_, const) = lvn_value
+            if typ == None or type(typ) != str:
+                typ = BOOL if type(const) == bool else INT
+            return (CONST, typ, const)
+        args = lvn_value[1:]
+        if op in SWAPPED_COMPARISONS:
+            op = SWAPPED_COMPARISONS[op]
+            args = tuple(reversed(args))
+        elif op == MUL and len(args) == 2:
+            if self.is_int_const(args[1], 2):
+                op, args = ADD, (args[0], args[0])
+            elif self.is_int_const(args[0], 2):
+                op, args = ADD, (args[1], args[1])
+        if op in COMMUTATIVE_OPS:
+            args = tuple(sorted(args))
+        return (op, *args)
+
+    def lookup(self, lvn_value, typ=None):
+        """
+        Number of lvn_value, or None if lvn_value is not in the table
+        """
+        key = self.key(lvn_value, typ)
+        if key == None:
+            return None
+        return self.key2num.get(key)
+
+    def add(self, lvn_value, home, typ=None):
+        """
+        Number lvn_value, with home as its canonical variable
+        """
+        num = len(self.values)
+        self.values.append(lvn_value)
+        self.homes.append(home)
+        key = self.key(lvn_value, typ)
+        if key != None and key not in self.key2num:
+            self.key2num[key] = num
+        return num
 
 
 def gen_fresh_variable(var):
@@ -68,28 +150,32 @@ def lvn_value_to_instr(dst, lvn_value, table, original_instr):
     first = lvn_value[0]
     if first == CONST:
         assert len(lvn_value) == 2
-        return {DEST: dst, OP: CONST, TYPE: INT, VALUE: lvn_value[1]}
+        if TYPE in original_instr:
+            typ = original_instr[TYPE]
+        else:
+            typ = BOOL if type(lvn_value[1]) == bool else INT
+        return {DEST: dst, OP: CONST, TYPE: typ, VALUE: lvn_value[1]}
     elif first in [ADD, SUB, MUL, DIV]:
         assert len(lvn_value) == 3
-        arg1 = get_from_table(table, lvn_value[1])[1]
-        arg2 = get_from_table(table, lvn_value[2])[1]
+        arg1 = table.get_home(lvn_value[1])
+        arg2 = table.get_home(lvn_value[2])
         return {DEST: dst, OP: first, TYPE: INT, ARGS: [arg1, arg2]}
     elif first in [EQ, LT, GT, LE, GE, AND, OR]:
         assert len(lvn_value) == 3
-        arg1 = get_from_table(table, lvn_value[1])[1]
-        arg2 = get_from_table(table, lvn_value[2])[1]
+        arg1 = table.get_home(lvn_value[1])
+        arg2 = table.get_home(lvn_value[2])
         return {DEST: dst, OP: first, TYPE: BOOL, ARGS: [arg1, arg2]}
     elif first in [NOT]:
         assert len(lvn_value) == 2
-        arg1 = get_from_table(table, lvn_value[1])[1]
+        arg1 = table.get_home(lvn_value[1])
         return {DEST: dst, OP: NOT, TYPE: BOOL, ARGS: [arg1]}
     elif first in [CALL]:
         assert len(lvn_value) >= 2
-        args = list(map(lambda a: get_from_table(table, a)[1], lvn_value[1:]))
+        args = list(map(lambda a: table.get_home(a), lvn_value[1:]))
         return {DEST: dst, OP: CALL, ARGS: args, FUNCS: original_instr[FUNCS], TYPE: original_instr[TYPE]}
     elif first in [ID]:
         assert len(lvn_value) == 2
-        arg1 = get_from_table(table, lvn_value[1])[1]
+        arg1 = table.get_home(lvn_value[1])
         return {DEST: dst, OP: ID, ARGS: [arg1]}
     else:
         raise RuntimeError(f"Unmatched LVN Value type {lvn_value}")
@@ -102,7 +188,7 @@ def lvn_value_is_const(lvn_value):
 
 def lvn_value_is_block_var(lvn_value):
     assert type(lvn_value) == tuple
-    return lvn_value[0][:len(BLOCK_VAR)] == BLOCK_VAR
+    return type(lvn_value[0]) == str and lvn_value[0][:len(BLOCK_VAR)] == BLOCK_VAR
 
 
 def lvn_value_is_id(lvn_value):
@@ -116,10 +202,13 @@ def interpret_lvn_value(lvn_value, table):
         return lvn_value
     elif lvn_value_is_block_var(lvn_value):
         return lvn_value
+    elif lvn_value[0] not in INTERPRETED_OPS:
+        # uninterpreted op
+        return lvn_value
+    # values in the table are already interpreted
     new_args = []
     for arg_lvn_num in lvn_value[1:]:
-        arg_lvn_value = get_value_from_table(table, arg_lvn_num)
-        new_args.append(interpret_lvn_value(arg_lvn_value, table))
+        new_args.append(table.get_value(arg_lvn_num))
     all_constants = True
     for a in new_args:
         if not lvn_value_is_const(a):
@@ -226,13 +315,9 @@ def instr_to_lvn_value(instr, var2num, table):
 
     args = []
     if ARGS in instr:
-        # basic commutativity for algebraic identity
-        if commutes(instr):
-            args = sorted(instr[ARGS])
-        else:
-            args = instr[ARGS]
-        args = list(map(lambda a: var2num[a], args))
-    else:
+        # commutative operands are sorted by the table
+        args = list(map(lambda a: var2num[a], instr[ARGS]))
+    elif VALUE in instr:
         args = [instr[VALUE]]
 
     lvn_value = (instr[OP], *args)
@@ -244,7 +329,8 @@ def instr_to_lvn_value(instr, var2num, table):
 
 def get_var_types(func):
     """
-    Build map from vars to typs in a function
+    Build map from vars to typs in a function, from its arguments and its
+    typed definitions
     """
     var2typ = dict()
 
@@ -257,7 +343,7 @@ def get_var_types(func):
 
     # get regular instructions
     for instr in func[INSTRS]:
-        if DEST in instr:
+        if DEST in instr and TYPE in instr:
             dst = instr[DEST]
             typ = instr[TYPE]
             var2typ[dst] = typ
@@ -335,16 +421,15 @@ def handle_block_vars(instrs, var2typ):
     """
     block_vars = get_block_vars(instrs)
 
+    defined_vars = set()
+    for instr in instrs:
+        if DEST in instr:
+            defined_vars.add(instr[DEST])
+
     n_inserts = 0
     updated_block_vars = set()
     for old_var_name in block_vars:
-
-        has_old_var_def = False
-        for instr in instrs:
-            if DEST in instr and instr[DEST] == old_var_name:
-                has_old_var_def = True
-
-        if has_old_var_def:
+        if old_var_name in defined_vars:
             n_inserts += 1
             updated_block_vars.add(old_var_name)
 
@@ -358,78 +443,36 @@ def handle_block_vars(instrs, var2typ):
     return block_vars, n_inserts, updated_block_vars
 
 
-def var_will_be_overwritten(instrs, idx, var):
+def get_last_defs(instrs):
     """
-    True iff var will be overwritten after index idx in instrs
+    Map from each variable defined in instrs to the index of its last definition
     """
-    for instr in instrs[idx + 1:]:
-        if DEST in instr and instr[DEST] == var:
-            return True
-    return False
-
-
-def get_from_table(table, num):
-    var = list(table.items())[num][1]
-    return var
-
-
-def get_value_from_table(table, num):
-    return list(table.keys())[num]
+    last_defs = dict()
+    for idx, instr in enumerate(instrs):
+        if DEST in instr:
+            last_defs[instr[DEST]] = idx
+    return last_defs
 
 
-def lvn_value_equality(lvn_val1, lvn_val2, table):
-    """
-    True if 2 LVN Values are Semantically equivalent
-    """
-    if lvn_val1 == lvn_val2:
-        return True
-
-    # Do Algebraic Simplication
-    op1 = lvn_val1[0]
-    op2 = lvn_val2[0]
-
-    # A + A = 2 * A
-    if op1 == ADD and op2 == MUL:
-        if lvn_val1[1] == lvn_val1[2] and lvn_val2[1] == lvn_val1[1] and get_from_table(table, lvn_val2[2]) == (CONST, 2):
-            return True
-        elif lvn_val1[1] == lvn_val1[2] and lvn_val2[2] == lvn_val1[1] and get_from_table(table, lvn_val2[1]) == (CONST, 2):
-            return True
-    elif op1 == MUL and op2 == ADD:
-        if lvn_val2[1] == lvn_val2[2] and lvn_val1[1] == lvn_val2[1] and get_from_table(table, lvn_val1[2]) == (CONST, 2):
-            return True
-        elif lvn_val2[1] == lvn_val2[2] and lvn_val1[2] == lvn_val2[1] and get_from_table(table, lvn_val1[1]) == (CONST, 2):
-            return True
-
-    # gt == le
-    elif op1 == GT and op2 == LE:
-        if lvn_val1[1] == lvn_val1[2] and lvn_val2[2] == lvn_val1[1]:
-            return True
-    elif op1 == LE and op2 == GT:
-        if lvn_val1[1] == lvn_val1[2] and lvn_val2[2] == lvn_val1[1]:
-            return True
-    # lt == ge
-    elif op1 == LT and op2 == GE:
-        if lvn_val1[1] == lvn_val1[2] and lvn_val2[2] == lvn_val1[1]:
-            return True
-    elif op1 == GE and op2 == LT:
-        if lvn_val1[1] == lvn_val1[2] and lvn_val2[2] == lvn_val1[1]:
-            return True
-
-    # add on more identities here...
-    return False
-
-
-def value_in_table(value, table):
+def var_will_be_overwritten(last_defs, idx, var):
     """
-    True, value in table if Value is in the Table, else False, None
+    True iff var will be overwritten after index idx, given the last
+    definitions of the block
     """
-    assert type(value) == tuple
+    return last_defs.get(var, -1) > idx
 
-    for table_value, pair in table.items():
-        if lvn_value_equality(value, table_value, table):
-            return True, pair
 
-    return False, (None, None)
+def get_propagated_arg(table, var2num, arg, updated_block_vars):
+    """
+    Variable to use in place of arg: its home, or the home of the variable
+    it copies
+    """
+    num = var2num[arg]
+    value = table.get_value(num)
+    new_arg = table.get_home(num)
+    if lvn_value_is_id(value) and table.get_home(value[1]) not in updated_block_vars:
+        new_arg = table.get_home(value[1])
+    return new_arg
 
 
 def lvn_basic_block(basic_block, var2typ):
@@ -437,60 +480,53 @@ def lvn_basic_block(basic_block, var2typ):
     Perform LVN on a basic block
     """
 
-    # reset counters
-    reset_lvn_num()
-
     # set up preliminary data structures for lvn pass on basic block
     var2num = dict()
-    table = OrderedDict()
+    table = LVNTable()
 
     instrs = basic_block[INSTRS]
     block_vars, n_inserts, updated_block_vars = handle_block_vars(
         instrs, var2typ)
+    last_defs = get_last_defs(instrs)
 
     # add in block vars into data structures
     for block_var in block_vars:
-        block_num = gen_fresh_lvn_num()
-        block_value = (f"{BLOCK_VAR}_{block_num}",)
-        var2num[block_var] = block_num
-        table[block_value] = block_num, block_var
+        block_value = (f"{BLOCK_VAR}_{len(table)}",)
+        var2num[block_var] = table.add(block_value, block_var)
 
     new_instrs = []
     # skip over an inserted block var instructions
     for idx, instr in enumerate(instrs[n_inserts:], n_inserts):
         if DEST in instr:
             dst = instr[DEST]
-            old_dst = deepcopy(dst)
+            old_dst = dst
+            typ = instr[TYPE] if TYPE in instr else None
             value, value_has_changed = instr_to_lvn_value(
                 instr, var2num, table)
 
-            value_is_in_table, pair = value_in_table(value, table)
-            if value_is_in_table:
-                num, var = pair
+            num = table.lookup(value, typ)
+            if num != None:
+                var = table.get_home(num)
                 new_id_instr = build_id(dst, var2typ[dst], var)
                 new_instrs.append(new_id_instr)
             else:
-                num = gen_fresh_lvn_num()
                 new_instr = deepcopy(instr)
 
-                if var_will_be_overwritten(instrs, idx, dst):
+                if var_will_be_overwritten(last_defs, idx, dst):
                     dst = gen_fresh_variable(dst)
                 else:
                     dst = instr[DEST]
                 new_instr[DEST] = dst
 
-                table[value] = num, dst
+                num = table.add(value, dst, typ)
 
                 # if value did not change, keep changing the new instr
                 if not value_has_changed:
                     if ARGS in instr:
                         new_args = []
                         for arg in instr[ARGS]:
-                            value, (_, new_arg) = list(
-                                table.items())[var2num[arg]]
-                            if lvn_value_is_id(value) and get_from_table(table, value[1])[1] not in updated_block_vars:
-                                new_arg = get_from_table(table, value[1])[1]
-                            new_args.append(new_arg)
+                            new_args.append(get_propagated_arg(
+                                table, var2num, arg, updated_block_vars))
                         new_instr[ARGS] = new_args
                 # otherwise generate a new instruction completely
                 else:
@@ -507,11 +543,8 @@ def lvn_basic_block(basic_block, var2typ):
             if ARGS in instr:
                 new_args = []
                 for arg in instr[ARGS]:
-                    value, (_, new_arg) = list(
-                        table.items())[var2num[arg]]
-                    if lvn_value_is_id(value) and get_from_table(table, value[1])[1] not in updated_block_vars:
-                        new_arg = get_from_table(table, value[1])[1]
-                    new_args.append(new_arg)
+                    new_args.append(get_propagated_arg(
+                        table, var2num, arg, updated_block_vars))
                 instr[ARGS] = new_args
 
             new_instrs.append(instr)
@@ -0,0 +1,173 @@
+"""
+Pass Manager
+
+Runs a whole optimization pipeline on a single, in-memory Bril program.
+
+The brench pipelines chain passes through separate python3 processes, so every
+stage pays for interpreter startup, importing click and a full
+json.load/json.dumps round trip of the program. The pass manager parses the
+program once, hands the same program dict from pass to pass, and prints the
+result once at the end.
+
+A single AnalysisManager is shared by the whole pipeline. Each pass declares
+which analyses it preserves; everything else is invalidated after the pass
+runs, so preserved analyses (e.g. the dominance tree computed while going into
+SSA, and reused by GVN) are not recomputed.
+
+Usage:
+    bril2json < prog.bril | python3 pass_manager.py --passes to-ssa,gvn,adce,from-ssa,dce
+"""
+
+import sys
+import json
+import click
+
+from ssa import bril_to_ssa, ssa_to_bril, SEMI_PRUNED, PRUNED
+from gvn import gvn_main
+from sccp import sccp_main
+from dce import dce, global_adce, mark_sweep_dce
+from lvn import lvn
+from licm import licm_main
+from induction_variables import induction_variables
+from loop_unrolling import fully_unroll_prog, unroll_prog, partially_unroll_prog
+from inlining import inline
+from analysis_manager import AnalysisManager, PRESERVES_NONE, PRESERVES_CFG
+
+
+PASS_SEPARATOR = ","
+
+
+def trivial_dce(program):
+    """
+    Iterated local and global trivial DCE, as run by default by dce.py
+    """
+    return dce(program, 1, 1, False, False)
+
+
+def semi_pruned_to_ssa(program, am):
+    return bril_to_ssa(program, am, SEMI_PRUNED)
+
+
+def pruned_to_ssa(program, am):
+    return bril_to_ssa(program, am, PRUNED)
+
+
+def coalescing_from_ssa(program, am):
+    return ssa_to_bril(program, coalesce=True)
+
+
+def sccvn(program, am):
+    return gvn_main(program, am, sccvn=True)
+
+
+def without_analyses(pass_routine):
+    """
+    Adapt a pass that does not use the analysis manager
+    """
+    def run(program, am):
+        return pass_routine(program)
+    return run
+
+
+# pass name -> (function from (program, analysis manager) to the transformed
+# program, analyses the pass preserves)
+PASSES = {
+    # to-ssa computes its analyses after adding the unique header; inserting
+    # phis and renaming leave the cfg unchanged afterwards
+    "to-ssa": (bril_to_ssa, PRESERVES_CFG),
+    "to-ssa-semi-pruned": (semi_pruned_to_ssa, PRESERVES_CFG),
+    "to-ssa-pruned": (pruned_to_ssa, PRESERVES_CFG),
+    # copies are placed inside existing predecessor blocks
+    "from-ssa": (without_analyses(ssa_to_bril), PRESERVES_CFG),
+    # splits critical edges
+    "from-ssa-coalesce": (coalescing_from_ssa, PRESERVES_NONE),
+    # gvn rewrites and removes instructions, but never terminators or labels
+    "gvn": (gvn_main, PRESERVES_CFG),
+    "sccvn": (sccvn, PRESERVES_CFG),
+    # sccp deletes blocks and folds branches
+    "sccp": (sccp_main, PRESERVES_NONE),
+    "adce": (without_analyses(global_adce), PRESERVES_NONE),
+    "ms": (without_analyses(mark_sweep_dce), PRESERVES_NONE),
+    "dce": (without_analyses(trivial_dce), PRESERVES_NONE),
+    "lvn": (without_analyses(lvn), PRESERVES_NONE),
+    "licm": (licm_main, PRESERVES_NONE),
+    "ive": (without_analyses(induction_variables), PRESERVES_NONE),
+    "full-unroll": (without_analyses(fully_unroll_prog), PRESERVES_NONE),
+    "unroll": (without_analyses(unroll_prog), PRESERVES_NONE),
+    "partial-unroll": (without_analyses(partially_unroll_prog), PRESERVES_NONE),
+    "inline": (without_analyses(inline), PRESERVES_NONE),
+}
+
+
+# passes whose output is SSA, but not conventional SSA: phi arguments may
+# name other phis of the same block, and phi destinations may be live past
+# the copies the naive from-ssa places in predecessors
+NON_CONVENTIONAL_SSA_PASSES = {"sccvn"}
+
+
+def conventional_from_ssa(pass_names):
+    """
+    Replace each from-ssa leaving a non conventional SSA program with
+    from-ssa-coalesce, which splits critical edges and sequentializes the
+    parallel copies of each edge
+    """
+    new_pass_names = []
+    conventional = True
+    for p in pass_names:
+        if p in NON_CONVENTIONAL_SSA_PASSES:
+            conventional = False
+        elif p == "from-ssa" and not conventional:
+            p = "from-ssa-coalesce"
+        if p in ("from-ssa", "from-ssa-coalesce"):
+            conventional = True
+        new_pass_names.append(p)
+    return new_pass_names
+
+
+def parse_passes(passes):
+    """
+    Parse a comma separated pass list into a list of pass names
+    """
+    pass_names = [p.strip() for p in passes.split(PASS_SEPARATOR) if p.strip() != ""]
+    for p in pass_names:
+        if p not in PASSES:
+            raise RuntimeError(
+                f"Unknown pass {p}: available passes are {', '.join(PASSES)}.")
+    return conventional_from_ssa(pass_names)
+
+
+def run_passes(program, pass_names, am=None):
+    """
+    Run each pass in pass_names, in order, on program, sharing analyses
+    between passes through am
+    """
+    if am == None:
+        am = AnalysisManager()
+    for p in pass_names:
+        pass_routine, preserved = PASSES[p]
+        program = pass_routine(program, am)
+        am.invalidate_all(preserved)
+    return program
+
+
+@click.command()
+@click.option('--passes', default="", help='Comma Separated List of Passes to Run, in Order.')
+@click.option('--list-passes', default=False, help='List Available Passes.')
+@click.option('--pretty-print', default=False, help='Pretty Print Before and After Optimization.')
+def main(passes, list_passes, pretty_print):
+    if list_passes:
+        for p in PASSES:
+            print(p)
+        return
+    pass_names = parse_passes(passes)
+    prog = json.load(sys.stdin)
+    if pretty_print:
+        print(json.dumps(prog, indent=4, sort_keys=True))
+    final_prog = run_passes(prog, pass_names)
+    if pretty_print:
+        print(json.dumps(final_prog, indent=4, sort_keys=True))
+    print(json.dumps(final_prog))
+
+
+if __name__ == "__main__":
+    main()
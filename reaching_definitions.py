@@ -6,6 +6,7 @@ from collections import OrderedDict
 from cfg import form_cfg, form_blocks, form_block_dict
 from bril_core_constants import *
 from worklist_solver import Worklist
+from bit_vector_lattice import BitVectorUniverse, BitVectorLattice, UNION
 
 
 def kills(block):
@@ -76,7 +77,40 @@ def number_instrs(blocks):
     return new_blocks
 
 
-def reaching_defs_func(function):
+def reaching_defs_bit_vector(entry, cfg, blocks, init):
+    """
+    Reaching definitions over bit vectors, with definitions numbered once
+    for the whole function. Results are converted back into sets.
+    """
+    universe = BitVectorUniverse(sorted(init))
+    var2defs = dict()
+    for (idx, var) in init:
+        var2defs[var] = var2defs.get(var, 0) | universe.bit((idx, var))
+    for block in blocks.values():
+        for (idx, instr) in block:
+            if DEST in instr:
+                definition = (idx, instr[DEST])
+                universe.add(definition)
+                var2defs[instr[DEST]] = var2defs.get(
+                    instr[DEST], 0) | universe.bit(definition)
+
+    bit_blocks = OrderedDict()
+    for name, block in blocks.items():
+        gen = universe.to_bits(defs(block))
+        kill = 0
+        for (_, instr) in block:
+            if DEST in instr:
+                kill |= var2defs[instr[DEST]]
+        bit_blocks[name] = (gen, kill)
+
+    lattice = BitVectorLattice(universe, UNION)
+    worklist = Worklist(entry, cfg, bit_blocks, universe.to_bits(init),
+                        lattice.merge, lattice.transfer)
+    (in_dict, out_dict) = worklist.solve()
+    return (lattice.to_sets(in_dict), lattice.to_sets(out_dict))
+
+
+def reaching_defs_func(function, bitvector=False):
     cfg = form_cfg(function)
     assert len(cfg) != 0
     entry = list(cfg.items())[0][0]
@@ -86,13 +120,15 @@ def reaching_defs_func(function):
         args = function[ARGS]
         for i, a in enumerate(args, 1):
             init.add((-i, a[NAME]))
+    if bitvector:
+        return reaching_defs_bit_vector(entry, cfg, blocks, init)
     worklist = Worklist(entry, cfg, blocks, init, merge, transfer)
     return worklist.solve()
 
 
-def reaching_defs(program):
+def reaching_defs(program, bitvector=False):
     for func in program["functions"]:
-        (in_dict, out_dict) = reaching_defs_func(func)
+        (in_dict, out_dict) = reaching_defs_func(func, bitvector)
 
         final_in_dict = OrderedDict()
         for (key, inner_set) in in_dict.items():
@@ -125,11 +161,12 @@ def reaching_defs(program):
 
 @click.command()
 @click.option('--pretty-print', default=False, help='Pretty Print Original Program.')
-def main(pretty_print):
+@click.option('--bitvector', default=False, help='Solve with Bit Vectors instead of Sets.')
+def main(pretty_print, bitvector):
     prog = json.load(sys.stdin)
     if pretty_print:
         print(json.dumps(prog, indent=4, sort_keys=True))
-    reaching_defs(prog)
+    reaching_defs(prog, bitvector)
 
 
 if __name__ == "__main__":
@@ -13,6 +13,8 @@ echo "Running LVN Tests"
 turnt lvn-tests/*.bril
 echo "Running DCE Tests"
 turnt dce-tests/*.bril
+echo "Running ADCE Tests"
+turnt adce-tests/*.bril
 echo "Running LVN & DCE Tests"
 turnt lvn-dce-tests/*.bril
 echo "Running Dominator Utilities"
@@ -23,7 +25,22 @@ echo "Running To SSA Tests"
 turnt to-ssa-tests/*.bril
 echo "Running To GVN Tests"
 turnt gvn-tests/*.bril
+echo "Running SCCP Tests"
+turnt sccp-tests/*.bril
+echo "Running SCCVN Tests"
+turnt sccvn-tests/*.bril
+turnt sccvn-from-ssa-tests/*.bril
 echo "Running To LICM Tests"
 turnt licm-tests/*.bril
 echo "Running To IVE Tests"
-turnt ive-tests/*.bril
\ No newline at end of file
+turnt ive-tests/*.bril
+echo "Running Partial Unrolling Tests"
+turnt partial-unrolling-tests/*.bril
+echo "Running Interpreter Tests"
+turnt interpreter-tests/*.bril
+echo "Running Vector Engine Tests"
+turnt vector-engine-tests/*.bril
+echo "Running Profile Tests"
+turnt profile-tests/*.bril
+echo "Running Hot Tracing Tests"
+turnt hot-tracing-tests/*.bril
\ No newline at end of file
@@ -0,0 +1,266 @@
+"""
+Sparse Conditional Constant Propagation
+
+Implementation of Wegman and Zadeck's SCCP on SSA form, from
+https://dl.acm.org/doi/10.1145/103135.103136
+
+Values are propagated along SSA def-use edges, and only along CFG edges that
+can execute given the constants found so far: a branch on a constant only
+makes one of its edges executable, and a phi only meets the arguments of
+executable edges. Afterwards, variables with constant values are defined by
+consts, branches on constants become jumps, and blocks that can never
+execute are deleted, along with the phi arguments of edges that can never
+execute.
+"""
+
+import sys
+import json
+import click
+from collections import OrderedDict
+
+from ssa import is_ssa, bril_to_ssa
+from cfg import form_cfg_w_blocks, join_cfg, INSTRS, PREDS, SUCCS
+from analysis_manager import AnalysisManager
+from constant_propagation import interpret_expr, NOT_CONSTANT, UNDEFINED
+from bril_core_constants import *
+from bril_core_utilities import is_phi, is_const, is_id, is_unop, is_binop, is_br, is_jmp, build_jmp
+
+
+# 64 bit integer range of Bril ints
+INT_MIN = -(1 << 63)
+INT_MAX = (1 << 63) - 1
+
+
+def meet(val1, val2):
+    """
+    Meet of 2 lattice values: UNDEFINED is top and NOT_CONSTANT is bottom
+    """
+    if val1 == UNDEFINED:
+        return val2
+    if val2 == UNDEFINED:
+        return val1
+    if val1 == NOT_CONSTANT or val2 == NOT_CONSTANT:
+        return NOT_CONSTANT
+    if type(val1) == type(val2) and val1 == val2:
+        return val1
+    return NOT_CONSTANT
+
+
+def fold(instr, values):
+    """
+    Lattice value of the destination of a core instruction, given the lattice
+    values of its arguments
+    """
+    if is_const(instr):
+        return instr[VALUE]
+    arg_values = [values[a] for a in instr[ARGS]]
+    if NOT_CONSTANT in arg_values:
+        return NOT_CONSTANT
+    if UNDEFINED in arg_values:
+        # optimistically wait for the arguments
+        return UNDEFINED
+    if is_id(instr):
+        return arg_values[0]
+    op = instr[OP]
+    if op == DIV:
+        (numerator, denominator) = arg_values
+        if denominator == 0:
+            # division by zero traps at runtime
+            return NOT_CONSTANT
+        # Bril division truncates towards 0, where interpret_expr floors
+        result = abs(numerator) // abs(denominator)
+        if (numerator < 0) != (denominator < 0):
+            result = -result
+    else:
+        try:
+            result = interpret_expr(instr, dict(zip(instr[ARGS], arg_values)))
+        except:
+            return NOT_CONSTANT
+    if type(result) == int and not (INT_MIN <= result <= INT_MAX):
+        return NOT_CONSTANT
+    return result
+
+
+def sccp_analysis(func, cfg, entry):
+    """
+    Lattice value of every variable, and the executable blocks and CFG edges
+    of func
+    """
+    values = dict()
+    uses = dict()
+    def_block = dict()
+    if ARGS in func:
+        for a in func[ARGS]:
+            values[a[NAME]] = NOT_CONSTANT
+    for block_name, block in cfg.items():
+        for instr in block[INSTRS]:
+            if DEST in instr:
+                values[instr[DEST]] = UNDEFINED
+                def_block[instr[DEST]] = block_name
+            if ARGS in instr:
+                for a in instr[ARGS]:
+                    uses.setdefault(a, []).append((block_name, instr))
+                    if a not in values:
+                        # used without any definition
+                        values[a] = NOT_CONSTANT
+
+    executable_blocks = set()
+    executable_edges = set()
+    flow_worklist = [(None, entry)]
+    ssa_worklist = []
+
+    def set_value(var, val):
+        new_val = meet(values[var], val)
+        if new_val != values[var] or type(new_val) != type(values[var]):
+            values[var] = new_val
+            ssa_worklist.append(var)
+
+    def visit_phi(block_name, instr):
+        val = UNDEFINED
+        for a, l in zip(instr[ARGS], instr[LABELS]):
+            if (l, block_name) in executable_edges:
+                val = meet(val, values[a])
+        set_value(instr[DEST], val)
+
+    def visit_instr(block_name, instr):
+        if is_phi(instr):
+            visit_phi(block_name, instr)
+        elif is_br(instr):
+            cond = values[instr[ARGS][0]]
+            (true_label, false_label) = instr[LABELS]
+            if cond == NOT_CONSTANT:
+                flow_worklist.append((block_name, true_label))
+                flow_worklist.append((block_name, false_label))
+            elif cond == True:
+                flow_worklist.append((block_name, true_label))
+            elif cond == False:
+                flow_worklist.append((block_name, false_label))
+        elif DEST in instr:
+            if is_const(instr) or is_id(instr) or is_unop(instr) or is_binop(instr):
+                set_value(instr[DEST], fold(instr, values))
+            else:
+                # calls, memory and float operations are not interpreted
+                set_value(instr[DEST], NOT_CONSTANT)
+
+    while flow_worklist != [] or ssa_worklist != []:
+        while flow_worklist != []:
+            (pred, block_name) = flow_worklist.pop()
+            if (pred, block_name) in executable_edges:
+                continue
+            executable_edges.add((pred, block_name))
+            instrs = cfg[block_name][INSTRS]
+            if block_name in executable_blocks:
+                # only the phis see the new edge
+                for instr in instrs:
+                    if is_phi(instr):
+                        visit_phi(block_name, instr)
+                continue
+            executable_blocks.add(block_name)
+            for instr in instrs:
+                visit_instr(block_name, instr)
+            if instrs == [] or not (is_br(instrs[-1]) or is_jmp(instrs[-1])):
+                for s in cfg[block_name][SUCCS]:
+                    flow_worklist.append((block_name, s))
+            elif is_jmp(instrs[-1]):
+                flow_worklist.append((block_name, instrs[-1][LABELS][0]))
+        while ssa_worklist != []:
+            var = ssa_worklist.pop()
+            for (block_name, instr) in uses.get(var, []):
+                if block_name in executable_blocks:
+                    visit_instr(block_name, instr)
+
+    return values, executable_blocks, executable_edges
+
+
+def sccp_func(func, am=None):
+    cfg = form_cfg_w_blocks(func)
+    if len(cfg) == 0:
+        return func[INSTRS]
+    entry = list(cfg.keys())[0]
+    values, executable_blocks, executable_edges = sccp_analysis(
+        func, cfg, entry)
+
+    def is_constant(var):
+        return values.get(var) not in [NOT_CONSTANT, UNDEFINED]
+
+    new_cfg = OrderedDict()
+    for block_name, block in cfg.items():
+        if block_name not in executable_blocks:
+            continue
+        labels = []
+        phis = []
+        consts = []
+        others = []
+        for instr in block[INSTRS]:
+            if LABEL in instr:
+                labels.append(instr)
+            elif DEST in instr and is_constant(instr[DEST]):
+                dst = instr[DEST]
+                new_instr = {OP: CONST, DEST: dst,
+                             TYPE: instr[TYPE], VALUE: values[dst]}
+                if is_phi(instr):
+                    consts.append(new_instr)
+                else:
+                    others.append(new_instr)
+            elif is_phi(instr):
+                new_args = []
+                new_labels = []
+                for a, l in zip(instr[ARGS], instr[LABELS]):
+                    if (l, block_name) in executable_edges:
+                        new_args.append(a)
+                        new_labels.append(l)
+                new_instr = dict(instr)
+                new_instr[ARGS] = new_args
+                new_instr[LABELS] = new_labels
+                phis.append(new_instr)
+            elif is_br(instr) and is_constant(instr[ARGS][0]):
+                (true_label, false_label) = instr[LABELS]
+                if values[instr[ARGS][0]] == True:
+                    others.append(build_jmp(true_label))
+                else:
+                    others.append(build_jmp(false_label))
+            else:
+                others.append(instr)
+        new_cfg[block_name] = {INSTRS: labels + phis + consts + others,
+                               PREDS: block[PREDS], SUCCS: block[SUCCS]}
+
+    return join_cfg(new_cfg)
+
+
+def sccp_main(program, am=None):
+    if am == None:
+        am = AnalysisManager()
+
+    # enters as SSA/Or Transform as needed
+    try:
+        is_ssa(program)
+    except:
+        program = bril_to_ssa(program, am)
+
+    for func in program["functions"]:
+        new_instrs = sccp_func(func, am)
+        func["instrs"] = new_instrs
+
+    # exit as SSA
+    is_ssa(program)
+    return program
+
+
+@click.command()
+@click.option('--sccp', default=False, help='Runs Sparse Conditional Constant Propagation on SSA Form Program.')
+@click.option('--pretty-print', default=False, help='Pretty Print Before and After SCCP.')
+def main(sccp, pretty_print):
+    prog = json.load(sys.stdin)
+    if pretty_print:
+        print(json.dumps(prog, indent=4, sort_keys=True))
+    if sccp:
+        final_prog = sccp_main(prog)
+    else:
+        final_prog = prog
+    if pretty_print:
+        print(json.dumps(final_prog, indent=4, sort_keys=True))
+    print(json.dumps(final_prog))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,18 +2,27 @@ from copy import deepcopy
 import click
 import sys
 import json
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 
 from bril_core_constants import *
 from bril_core_utilities import *
 from bril_float_constants import *
 from bril_memory_extension_utilities import is_ptr_type
-from cfg import PREDS, SUCCS, TERMINATORS, form_cfg_succs_preds, form_blocks, form_block_dict, join_blocks_w_labels
-from dominator_utilities import build_dominance_tree, build_dominance_frontier
+from cfg import PREDS, SUCCS, TERMINATORS, form_cfg_succs_preds, form_blocks, form_block_dict, get_cfg_w_blocks, join_blocks_w_labels
+from analysis_manager import AnalysisManager, CFG, DOMINANCE_TREE, DOMINANCE_FRONTIER
+from live_variables import live_variables_func
 
 
 UNIQUE_HEADER = "UNIQUE.HEADER"
 
+# phi placement: a phi for every variable at its iterated dominance
+# frontier (minimal), only for variables used in some block before being
+# defined in it (semi-pruned), or only where the variable is live (pruned)
+MINIMAL = "minimal"
+SEMI_PRUNED = "semi-pruned"
+PRUNED = "pruned"
+PHI_PLACEMENTS = [MINIMAL, SEMI_PRUNED, PRUNED]
+
 
 def insert_at_end_of_bb(block, instr):
     if len(block) == 0:
@@ -62,15 +71,356 @@ def func_from_ssa(func):
     return join_blocks_w_labels(block_dict)
 
 
-def ssa_to_bril(program):
+def sequentialize_parallel_copy(copies, gen_temp):
+    """
+    Orders the parallel copy copies, a list of (dst, src) pairs with distinct
+    dsts, into a list of sequential (dst, src) copies. Copies whose dst is
+    still needed as a src wait until it has been read; a temporary from
+    gen_temp(var) is only used to break a cycle, one per cycle.
+    (Boissinot et al., Revisiting Out-of-SSA Translation)
+    """
+    copies = [(dst, src) for (dst, src) in copies if dst != src]
+    # loc[a]: where the original value of a currently lives
+    # pred[b]: the variable whose value b receives
+    loc = dict()
+    pred = dict()
+    to_do = []
+    ready = []
+    for (dst, src) in copies:
+        loc[src] = src
+        pred[dst] = src
+        to_do.append(dst)
+    for (dst, _) in copies:
+        if dst not in loc:
+            # dst is not read by any other copy
+            ready.append(dst)
+
+    sequential = []
+    while to_do != []:
+        while ready != []:
+            b = ready.pop()
+            a = pred[b]
+            c = loc[a]
+            sequential.append((b, c))
+            loc[a] = b
+            if a == c and a in pred:
+                # a has been read, so its own copy can now overwrite it
+                ready.append(a)
+        b = to_do.pop()
+        if b != loc[pred[b]]:
+            # b is on a cycle: save it, then overwrite it
+            temp = gen_temp(b)
+            sequential.append((temp, b))
+            loc[b] = temp
+            ready.append(b)
+    return sequential
+
+
+def find_class(classes, var):
+    """
+    Union find root of var, with path halving
+    """
+    while classes[var] != var:
+        classes[var] = classes[classes[var]]
+        var = classes[var]
+    return var
+
+
+def ssa_live_out(block_dict, succs, phis):
+    """
+    Live variables at the end of every block, where the arguments of a phi
+    are used on the edge from their label, and its destination is defined at
+    the top of its block
+    """
+    uses = dict()
+    defs = dict()
+    for name, instrs in block_dict.items():
+        used = set()
+        defined = set(phi[DEST] for phi in phis[name])
+        for instr in instrs:
+            if OP in instr and instr[OP] == PHI:
+                continue
+            if ARGS in instr:
+                for a in instr[ARGS]:
+                    if a not in defined:
+                        used.add(a)
+            if DEST in instr:
+                defined.add(instr[DEST])
+        uses[name] = used
+        defs[name] = defined
+
+    # phi uses of each edge
+    edge_uses = defaultdict(set)
+    for name in block_dict:
+        for phi in phis[name]:
+            for a, l in zip(phi[ARGS], phi[LABELS]):
+                edge_uses[(l, name)].add(a)
+
+    # phi labels need not be cfg predecessors
+    edge_succs = {name: set(s for s in succs[name] if s in block_dict)
+                  for name in block_dict}
+    for (l, s) in edge_uses:
+        if l in edge_succs:
+            edge_succs[l].add(s)
+
+    live_in = {name: set() for name in block_dict}
+    live_out = {name: set() for name in block_dict}
+    order = list(reversed(block_dict.keys()))
+    changed = True
+    while changed:
+        changed = False
+        for name in order:
+            out = set()
+            for s in edge_succs[name]:
+                out |= live_in[s]
+                out |= edge_uses[(name, s)]
+            new_in = uses[name] | (out - defs[name])
+            live_out[name] = out
+            if new_in != live_in[name]:
+                live_in[name] = new_in
+                changed = True
+    return live_out
+
+
+def ssa_interference(block_dict, phis, live_out, func_args):
+    """
+    Interference graph of the variables of a function: two variables
+    interfere if one is live where the other is defined. Phi destinations are
+    defined together at the top of their block, and function arguments
+    together at entry.
+    """
+    interference = defaultdict(set)
+
+    def add_edge(a, b):
+        if a != b:
+            interference[a].add(b)
+            interference[b].add(a)
+
+    for name, instrs in block_dict.items():
+        live = set(live_out[name])
+        for instr in reversed(instrs):
+            if OP in instr and instr[OP] == PHI:
+                continue
+            if DEST in instr:
+                dst = instr[DEST]
+                for v in live:
+                    add_edge(dst, v)
+                live.discard(dst)
+            if ARGS in instr:
+                live |= set(instr[ARGS])
+        phi_dsts = [phi[DEST] for phi in phis[name]]
+        for d in phi_dsts:
+            for v in live:
+                add_edge(d, v)
+            for other in phi_dsts:
+                add_edge(d, other)
+    for a in func_args:
+        for other in func_args:
+            add_edge(a, other)
+    return interference
+
+
+def coalesce_phi_names(block_dict, phis, live_out, func_args):
+    """
+    Union each phi destination with its arguments whenever their live ranges
+    do not interfere, so that the copy between them disappears. Returns a map
+    from each variable to its class name; a class containing a function
+    argument is named after that argument.
+    """
+    interference = ssa_interference(block_dict, phis, live_out, func_args)
+    classes = dict()
+    members = dict()
+
+    def add(var):
+        if var not in classes:
+            classes[var] = var
+            members[var] = [var]
+
+    for a in func_args:
+        add(a)
+    for name in block_dict:
+        for phi in phis[name]:
+            add(phi[DEST])
+            for a in phi[ARGS]:
+                add(a)
+
+    for name in block_dict:
+        for phi in phis[name]:
+            for a in phi[ARGS]:
+                dst_root = find_class(classes, phi[DEST])
+                arg_root = find_class(classes, a)
+                if dst_root == arg_root:
+                    continue
+                neighbours = set()
+                for m in members[dst_root]:
+                    neighbours |= interference[m]
+                if any(m in neighbours for m in members[arg_root]):
+                    continue
+                # keep argument names as class names
+                if arg_root in func_args:
+                    dst_root, arg_root = arg_root, dst_root
+                classes[arg_root] = dst_root
+                members[dst_root] += members[arg_root]
+                del members[arg_root]
+
+    return {var: find_class(classes, var) for var in classes}
+
+
+def func_from_ssa_coalesced(func):
+    """
+    Out of SSA through parallel copies: critical edges into blocks with phis
+    are split, the phis of each edge become one parallel copy on that edge,
+    phi related names that do not interfere are coalesced into one name, and
+    the remaining copies are sequentialized with a temporary per copy cycle.
+    """
+    assert type(func) == dict
+    block_dict = form_block_dict(form_blocks(func[INSTRS]))
+    cfg = get_cfg_w_blocks(block_dict)
+
+    phis = OrderedDict()
+    var_types = dict()
+    variables = set()
+    func_args = []
+    if ARGS in func:
+        for a in func[ARGS]:
+            func_args.append(a[NAME])
+            var_types[a[NAME]] = a[TYPE]
+            variables.add(a[NAME])
+    for name, instrs in block_dict.items():
+        phis[name] = []
+        for instr in instrs:
+            if OP in instr and instr[OP] == PHI:
+                phis[name].append(instr)
+            if DEST in instr:
+                var_types[instr[DEST]] = instr[TYPE]
+                variables.add(instr[DEST])
+            if ARGS in instr:
+                variables |= set(instr[ARGS])
+    if all(phis[name] == [] for name in block_dict):
+        return func[INSTRS]
+
+    succs = {name: cfg[name][SUCCS] for name in block_dict}
+    live_out = ssa_live_out(block_dict, succs, phis)
+    class_of = coalesce_phi_names(block_dict, phis, live_out, func_args)
+
+    def rename_var(var):
+        return class_of.get(var, var)
+
+    # edge (pred, block) -> parallel copy of (dst, src) pairs, the last phi
+    # for a destination winning as with sequential copies
+    edge_copies = OrderedDict()
+    for name in block_dict:
+        for phi in phis[name]:
+            dst = rename_var(phi[DEST])
+            for a, l in zip(phi[ARGS], phi[LABELS]):
+                copies = edge_copies.setdefault((l, name), OrderedDict())
+                copies[dst] = rename_var(a)
+
+    temp_index = [0]
+
+    def gen_temp(var):
+        while True:
+            temp_index[0] += 1
+            temp = f"{var}.tmp.{temp_index[0]}"
+            if temp not in variables:
+                variables.add(temp)
+                var_types[temp] = var_types[var]
+                return temp
+
+    new_block_dict = OrderedDict()
+    for name, instrs in block_dict.items():
+        new_instrs = []
+        for instr in instrs:
+            if OP in instr and instr[OP] == PHI:
+                continue
+            instr = dict(instr)
+            if DEST in instr:
+                instr[DEST] = rename_var(instr[DEST])
+            if ARGS in instr:
+                instr[ARGS] = [rename_var(a) for a in instr[ARGS]]
+            new_instrs.append(instr)
+        new_block_dict[name] = new_instrs
+
+    # blocks that split a critical edge, inserted after the block they
+    # leave from
+    split_blocks = defaultdict(list)
+    split_names = set()
+    for (pred, succ), copies in edge_copies.items():
+        sequential = sequentialize_parallel_copy(list(copies.items()), gen_temp)
+        if sequential == [] or pred not in new_block_dict:
+            continue
+        copy_instrs = [{OP: ID, TYPE: var_types[dst], ARGS: [src], DEST: dst}
+                       for (dst, src) in sequential]
+        pred_instrs = new_block_dict[pred]
+        last = pred_instrs[-1] if pred_instrs != [] else None
+        branches = last != None and OP in last and last[OP] == BR
+        if not branches:
+            # the edge is the only way out of pred
+            for instr in copy_instrs:
+                insert_at_end_of_bb(pred_instrs, instr)
+        elif len(cfg[succ][PREDS]) == 1:
+            # the edge is the only way into succ
+            succ_instrs = new_block_dict[succ]
+            for instr in reversed(copy_instrs):
+                insert_at_front_of_bb(succ_instrs, instr)
+        else:
+            # critical edge: route it through a new block
+            split_name = f"{pred}.{succ}.split"
+            while split_name in block_dict or split_name in split_names:
+                split_name = f"{split_name}.1"
+            split_names.add(split_name)
+            split_blocks[pred].append(
+                (split_name, [{LABEL: split_name}] + copy_instrs + [build_jmp(succ)]))
+            new_branch = dict(last)
+            new_branch[LABELS] = [split_name if l == succ else l
+                                  for l in last[LABELS]]
+            pred_instrs[-1] = new_branch
+
+    final_block_dict = OrderedDict()
+    for name, instrs in new_block_dict.items():
+        final_block_dict[name] = instrs
+        for split_name, split_instrs in split_blocks[name]:
+            final_block_dict[split_name] = split_instrs
+    return join_blocks_w_labels(final_block_dict)
+
+
+def ssa_to_bril(program, coalesce=False):
     for func in program["functions"]:
-        new_func_instrs = func_from_ssa(func["instrs"])
+        if coalesce:
+            new_func_instrs = func_from_ssa_coalesced(func)
+        else:
+            new_func_instrs = func_from_ssa(func["instrs"])
         func["instrs"] = new_func_instrs
     return is_not_ssa(program)
 
 
-def insert_phi(func, df, cfg, block_dict, entry):
+def get_global_names(block_dict):
+    """
+    Variables used in some block before any definition in that block, i.e.
+    the only variables that can be live across blocks
+    """
+    global_names = set()
+    for instrs in block_dict.values():
+        defined = set()
+        for instr in instrs:
+            if ARGS in instr:
+                for a in instr[ARGS]:
+                    if a not in defined:
+                        global_names.add(a)
+            if DEST in instr:
+                defined.add(instr[DEST])
+    return global_names
+
+
+def insert_phi(func, df, cfg, block_dict, entry, pruning=MINIMAL, live_in=None):
+    """
+    Insert phis at the iterated dominance frontier of the definitions of
+    each variable, as restricted by the pruning mode. Pruned placement needs
+    live_in, the live variables at the start of each block.
+    """
     assert type(func) == dict
+    assert pruning in PHI_PLACEMENTS
+    assert pruning != PRUNED or live_in != None
 
     variables = defaultdict(list)
     var_types = dict()
@@ -93,17 +443,26 @@ def insert_phi(func, df, cfg, block_dict, entry):
                         raise RuntimeError(
                             f"SSA: INSERT PHI: Undefined variable {a} used in {instr}.")
 
+    global_names = None
+    if pruning == SEMI_PRUNED:
+        global_names = get_global_names(block_dict)
+
     for v in variables:
+        if global_names != None and v not in global_names:
+            continue
         added_blocks = set()
         for defined_block in variables[v]:
             for df_block in df[defined_block]:
+                if pruning == PRUNED and v not in live_in[df_block]:
+                    # a phi here would be dead
+                    continue
                 if df_block not in added_blocks:
                     args = []
                     preds = cfg[df_block][PREDS]
                     for _ in range(len(preds)):
                         args.append(v)
                     phi = {OP: PHI, TYPE: var_types[v],
-                           LABELS: preds,  ARGS: args, DEST: v}
+                           LABELS: list(preds),  ARGS: args, DEST: v}
                     insert_at_front_of_bb(block_dict[df_block], phi)
                     added_blocks.add(df_block)
                 if df_block not in variables[v]:
@@ -168,8 +527,14 @@ def insert_into_new_branch(block_dict, succ_name, cfg, var_to_fresh_index, a, i,
     return new_var
 
 
-def rename(block_dict, block_name, stack, cfg, dom_tree, var_to_fresh_index):
-    pushed_names = defaultdict(list)
+def rename_block(block_dict, block_name, stack, cfg, var_to_fresh_index, block_phis):
+    """
+    Rename the definitions and uses in block_name, and fill in the arguments
+    of the phis of its successors that come from block_name.
+
+    Returns how many names were pushed onto the stack of each variable.
+    """
+    pushed_counts = dict()
 
     block = block_dict[block_name]
     for instr in block:
@@ -186,175 +551,94 @@ def rename(block_dict, block_name, stack, cfg, dom_tree, var_to_fresh_index):
             new_name = gen_new_var(dst, var_to_fresh_index)
             instr[DEST] = new_name
             stack[dst].append(new_name)
-            pushed_names[dst].append(new_name)
+            pushed_counts[dst] = pushed_counts.get(dst, 0) + 1
 
     for succ_name in cfg[block_name][SUCCS]:
-        succ_phi_nodes = []
-        for instr in block_dict[succ_name]:
-            if OP in instr and instr[OP] == PHI:
-                succ_phi_nodes.append(instr)
-
-        for phi_node in succ_phi_nodes:
-            p_args = phi_node[ARGS]
-            p_labels = phi_node[LABELS]
-            if block_name not in p_labels:
+        for phi_node, label_index in block_phis[succ_name]:
+            if block_name not in label_index:
                 raise RuntimeError(
                     f"Block name {block_name} is not in the labels of phi node {phi_node} in basic block {succ_name}.")
-
-            label_index = p_labels.index(block_name)
-            new_p_args = []
-            for i, a in enumerate(p_args):
-                if i != label_index:
-                    new_p_args.append(a)
-                    continue
-                # a was defined before
-                if a in stack:
-                    # if stack[a] is empty, a is not defined along a certain branch
-                    if stack[a] == []:
-                        new_var = insert_into_new_branch(
-                            block_dict, succ_name, cfg, var_to_fresh_index, a, i, phi_node)
-                    else:
-                        new_var = stack[a][-1]
-                elif is_ssa_var(a):
-                    new_var = a
-                # a was never defined before, we add a new branch
-                else:
-                    if a not in var_to_fresh_index:
-                        var_to_fresh_index[a] = 0
+            i = label_index[block_name]
+            a = phi_node[ARGS][i]
+            # a was defined before
+            if a in stack:
+                # if stack[a] is empty, a is not defined along a certain branch
+                if stack[a] == []:
                     new_var = insert_into_new_branch(
                         block_dict, succ_name, cfg, var_to_fresh_index, a, i, phi_node)
-
-                new_p_args.append(new_var)
-            phi_node[ARGS] = new_p_args
-
-    for new_block_name in dom_tree[block_name]:
-        rename(block_dict, new_block_name, stack,
-               cfg, dom_tree, var_to_fresh_index)
-
-    for var, new_names in pushed_names.items():
-        while new_names != []:
-            new_names.pop()
-            stack[var].pop()
-
-
-def rename_old(block_dict, block_name, stack, cfg, dom_tree, var_to_fresh_index):
-    pushed_names = defaultdict(list)
-
-    block = block_dict[block_name]
-    for instr in block:
-        if ARGS in instr:
-            old_args = instr[ARGS]
-            new_args = []
-            for old in old_args:
-                if not is_phi(instr):
-                    var = stack[old][-1]
-                    new_args.append(var)
-                elif old not in stack and is_phi(instr):
-                    new_args.append(old)
                 else:
-                    # was not successor block replaced, have to go back a few blocks.
-                    var = stack[old][-1]
-                    new_args.append(var)
-            instr[ARGS] = new_args
-        if DEST in instr:
-            dst = instr[DEST]
-
-            if dst not in var_to_fresh_index:
-                var_to_fresh_index[dst] = 0
-
-            new_name = f"{dst}_{var_to_fresh_index[dst] + 1}"
-            var_to_fresh_index[dst] += 1
-
-            instr[DEST] = new_name
-            stack[dst].append(new_name)
-
-            pushed_names[dst].append(new_name)
-
-    for succ_name in cfg[block_name][SUCCS]:
-        s_phi_nodes = []
-        for instr in block_dict[succ_name]:
-            if OP in instr and instr[OP] == PHI:
-                s_phi_nodes.append(instr)
-        for p in s_phi_nodes:
-            p_args = p[ARGS]
-            p_labels = p[LABELS]
-            if block_name in p_labels:
-                label_index = p_labels.index(block_name)
-                new_p_args = []
-                for i, a in enumerate(p_args):
-                    if i == label_index:
-                        if a in stack:
-                            # if stack[a] is empty, a is not defined along a certain branch
-                            # to fix, we insert a pseudo-unused instruction
-                            # at least according to the user, who expects
-                            # that branch never to have a used
-                            if stack[a] == []:
-                                pred_block_name = cfg[succ_name][PREDS][i]
-                                new_var = f"{a}_{var_to_fresh_index[a] + 1}"
-                                var_to_fresh_index[a] += 1
-                                new_instr_type = p[TYPE]
-                                if new_instr_type == BOOL:
-                                    new_instr = {OP: CONST,
-                                                 VALUE: True, DEST: new_var, TYPE: BOOL}
-                                elif new_instr_type == INT:
-                                    new_instr = {OP: CONST,
-                                                 VALUE: 0, DEST: new_var, TYPE: INT}
-                                else:
-                                    raise RuntimeError(
-                                        f"Unhandled type {new_instr_type}.")
-                                insert_at_end_of_bb(
-                                    block_dict[pred_block_name], new_instr)
-                            else:
-                                new_var = stack[a][-1]
-                        elif "_" in a and (a[a.rindex("_") + 1:]).isnumeric():
-                            new_var = a
-                        else:
-                            pred_block_name = cfg[succ_name][PREDS][i]
-                            var_to_fresh_index[a] = 0
-                            new_var = f"{a}_{var_to_fresh_index[a] + 1}"
-                            var_to_fresh_index[a] += 1
-                            new_instr_type = p[TYPE]
-                            if new_instr_type == BOOL:
-                                new_instr = {OP: CONST,
-                                             VALUE: True, DEST: new_var, TYPE: BOOL}
-                            elif new_instr_type == INT:
-                                new_instr = {OP: CONST,
-                                             VALUE: 0, DEST: new_var, TYPE: INT}
-                            else:
-                                raise RuntimeError(
-                                    f"Unhandled type {new_instr_type}.")
-                            insert_at_end_of_bb(
-                                block_dict[pred_block_name], new_instr)
-
-                        new_p_args.append(new_var)
-                    else:
-                        new_p_args.append(a)
-                p[ARGS] = new_p_args
+                    new_var = stack[a][-1]
+            elif is_ssa_var(a):
+                new_var = a
+            # a was never defined before, we add a new branch
             else:
-                raise RuntimeError(
-                    f"Block name {block_name} is not in the labels of phi node {p} in basic block {succ_name}.")
-
-    for new_block_name in dom_tree[block_name]:
-        rename_old(block_dict, new_block_name, stack,
-                   cfg, dom_tree, var_to_fresh_index)
+                if a not in var_to_fresh_index:
+                    var_to_fresh_index[a] = 0
+                new_var = insert_into_new_branch(
+                    block_dict, succ_name, cfg, var_to_fresh_index, a, i, phi_node)
+            phi_node[ARGS][i] = new_var
+
+    return pushed_counts
+
+
+def rename(block_dict, entry, stack, cfg, dom_tree, var_to_fresh_index):
+    """
+    Rename variables over a preorder walk of the dominator tree from entry.
+
+    The walk uses an explicit stack rather than recursion, so deep dominator
+    trees do not hit the recursion limit. When the subtree of a block is
+    done, the names it pushed are popped off, using the count of names it
+    pushed for each variable.
+    """
+    # phis of each block, each with the index of each of its labels
+    block_phis = dict()
+    for block_name, block in block_dict.items():
+        block_phis[block_name] = []
+        for instr in block:
+            if is_phi(instr):
+                label_index = dict()
+                for i, l in enumerate(instr[LABELS]):
+                    label_index.setdefault(l, i)
+                block_phis[block_name].append((instr, label_index))
+
+    # (block name, names pushed by the block, or None if not yet renamed)
+    walk = [(entry, None)]
+    while walk != []:
+        block_name, pushed_counts = walk.pop()
+        if pushed_counts != None:
+            # leaving the subtree of block_name
+            for var, count in pushed_counts.items():
+                del stack[var][-count:]
+            continue
+
+        pushed_counts = rename_block(block_dict, block_name, stack, cfg,
+                                     var_to_fresh_index, block_phis)
+        walk.append((block_name, pushed_counts))
+        for child in reversed(dom_tree[block_name]):
+            walk.append((child, None))
+
+
+def func_to_ssa(func, am=None, pruning=MINIMAL):
+    if am == None:
+        am = AnalysisManager()
 
-    for var, new_names in pushed_names.items():
-        while new_names != []:
-            _ = new_names.pop()
-            stack[var].pop()
-
-
-def func_to_ssa(func):
     # add in unique header to stop issues with header not having previous
     func[INSTRS].insert(0, {LABEL: UNIQUE_HEADER})
+    # the new header changes the cfg, but inserting phis, renaming
+    # and inserting constants into predecessors afterwards do not
+    am.invalidate(func)
 
-    cfg = form_cfg_succs_preds(func["instrs"])
+    cfg = am.get(func, CFG)
     block_dict = form_block_dict(form_blocks(func["instrs"]))
-    dom_tree, _ = build_dominance_tree(func)
-    dom_frontier = build_dominance_frontier(func)
+    dom_tree, _ = am.get(func, DOMINANCE_TREE)
+    dom_frontier = am.get(func, DOMINANCE_FRONTIER)
     entry = list(block_dict.keys())[0]
 
-    insert_phi(func, dom_frontier, cfg, block_dict, entry)
+    live_in = None
+    if pruning == PRUNED:
+        live_in, _ = live_variables_func(func, bitvector=True)
+
+    insert_phi(func, dom_frontier, cfg, block_dict, entry, pruning, live_in)
 
     # set up stack with arguments as needed
     stack = defaultdict(list)
@@ -375,12 +659,12 @@ def func_to_ssa(func):
     return join_blocks_w_labels(block_dict)
 
 
-def bril_to_ssa(program):
+def bril_to_ssa(program, am=None, pruning=MINIMAL):
     if prog_has_ssa_var(program):
         raise RuntimeError(
             f"Program has SSA Variable Naming: Please rename any variables with names ending with _0, _1, ...")
     for func in program["functions"]:
-        new_instrs = func_to_ssa(func)
+        new_instrs = func_to_ssa(func, am, pruning)
         func["instrs"] = new_instrs
     return is_ssa(program)
 
@@ -413,16 +697,18 @@ def is_not_ssa(program):
 @click.command()
 @click.option('--to-ssa', default=False, help='Converts Bril program to SSA from.')
 @click.option('--from-ssa', default=False, help='Converts Bril program out of SSA form.')
+@click.option('--coalesce', default=False, help='With --from-ssa, Split Critical Edges, Coalesce Phi Names and Sequentialize Parallel Copies.')
+@click.option('--pruning', default=MINIMAL, help='Phi Placement for --to-ssa: minimal, semi-pruned or pruned.')
 @click.option('--pretty-print', default=False, help='Print transformed program.')
-def main(to_ssa, from_ssa, pretty_print):
+def main(to_ssa, from_ssa, coalesce, pruning, pretty_print):
     prog = json.load(sys.stdin)
-    if prog_has_ssa_var(prog):
+    if pruning not in PHI_PLACEMENTS:
         raise RuntimeError(
-            f"Program has SSA Variable Naming: Please rename any variables with names ending with _0, _1, ...")
+            f"Unknown phi placement {pruning}: choose one of {', '.join(PHI_PLACEMENTS)}.")
     if to_ssa:
-        prog = bril_to_ssa(prog)
+        prog = bril_to_ssa(prog, pruning=pruning)
     if from_ssa:
-        prog = ssa_to_bril(prog)
+        prog = ssa_to_bril(prog, coalesce)
     if pretty_print:
         print(json.dumps(prog, indent=4, sort_keys=True))
     print(json.dumps(prog))
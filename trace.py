@@ -3,44 +3,125 @@ Trace Based Optimizer for Ahead of Time Trace Optimization
 
 Simplication of JIT to do everything on a trace AOT.
 
-TODO: Change tracing to take arbitray end points
-Current traces entire execution!
+Reads a {"prog": ..., "trace": ...} pair, with a trace recorded by brili-tr,
+and inserts the whole trace at the start of the traced function.
+
+With --hot, reads a program instead, and picks traces itself from an
+execution profile (see execution_profile.py), collected by running the
+program on the given args if its functions are not already annotated. Every
+hot loop gets a trace of its hottest path, from the header around to the
+header, following the most frequent CFG edge out of each block. Each trace
+is optimized with LVN (which folds constants) and DCE against the variables
+live into the header, and placed at the header:
+
+    .header:
+      speculate
+      <optimized trace, with a guard for each branch, up to its last guard>
+      commit
+      <rest of the optimized trace>
+      jmp .header
+    .bailout.label.header:
+      <original header>
+
+so each iteration runs the trace, and falls back to the original loop when a
+guard fails. Nothing before the last guard may have side effects, as a failed
+guard only rolls back variables. A trace is only inserted if the profile says
+it saves more instructions than its failed attempts waste.
+
+Guards are then optimized (see GUARD OPTIMIZATION): implied guards are
+deleted and invariant guards hoisted to the start of the trace. Guards left
+at the start of a hot trace become branches to the bailout before the
+speculate, and a trace with no other guards does not speculate at all.
 """
 import click
 import sys
 import json
+from copy import deepcopy
 
 
 from bril_speculation_constants import *
 from bril_speculation_utilities import *
 from bril_core_constants import *
 from bril_core_utilities import *
-from bril_memory_extension_utilities import is_mem
+from bril_memory_extension_constants import LOAD, PTRADD
+from bril_float_constants import FLOAT_OPS, FLOAT_COMP_OPS
 from bril_float_utilities import is_float
+from cfg import form_cfg_w_blocks, join_cfg, SUCCS
+from dominator_utilities import get_loop_nest_forest, loops_innermost_first
+from live_variables import live_variables_func
+from execution_profile import PROFILE, HOT_LOOP_MIN_COUNT, collect_profile, annotate_prog, block_count, edge_count
 
-from lvn import lvn
+from lvn import lvn, get_var_types, PURE_OPS, SWAPPED_COMPARISONS
 
 
 BAILOUT_LABEL = "bailout.label"
 FINISH_LABEL = "finish.label"
+TRACE_LABEL = "trace.label"
 
 GUARD_VAR = "guard_var"
 
 LVN_FUNC = "lvn_func"
 
-
-def trace(instrs: list) -> list:
-    # check trace for memory instructions, print instructions or other side effects
-    # bail if found
+# ops that can run speculatively: a failed guard rolls back variables, but
+# not the heap, output or calls
+TRACEABLE_OPS = [*PURE_OPS, *FLOAT_COMP_OPS, LOAD, NOP, JMP, BR]
+# ops that cannot be part of a trace at all
+UNTRACEABLE_OPS = [RET, PHI, *SPEC_OPS]
+
+# traces are cut off at this many blocks
+MAX_TRACE_BLOCKS = 32
+
+# negations of integer comparisons; eq has none
+NEGATED_COMPARISONS = {LT: GE, LE: GT, GT: LE, GE: LT}
+# ops that cannot fail, so can be hoisted above a guard
+HOISTABLE_OPS = [CONST, ID, ADD, SUB, MUL, *BOOL_OPS, *FLOAT_OPS,
+                 *FLOAT_COMP_OPS, PTRADD]
+
+
+def is_traceable(instr):
+    return is_label(instr) or instr[OP] in TRACEABLE_OPS
+
+
+def last_branch_index(instrs):
+    """
+    Index of the last branch of the trace instrs, or -1 if there is none
+    """
+    last_br = -1
+    for idx, instr_pair in enumerate(instrs):
+        if is_br(instr_pair["instr"]):
+            last_br = idx
+    return last_br
+
+
+def has_speculative_side_effects(instrs):
+    """
+    Whether the trace instrs has side effects that a failed guard could not
+    undo, i.e. before its last branch
+    """
+    for instr_pair in instrs[:last_branch_index(instrs)]:
+        if not is_traceable(instr_pair["instr"]):
+            return True
     for instr_pair in instrs:
         instr = instr_pair["instr"]
-        if is_mem(instr) or is_print(instr):
-            raise RuntimeError("Should not have mem or print instructions")
+        if OP in instr and instr[OP] in UNTRACEABLE_OPS:
+            return True
+    return False
+
+
+def trace(instrs: list, bailout_label=BAILOUT_LABEL) -> list:
+    # check trace for stores, print instructions or other side effects before
+    # the last guard, bail if found. The trace commits after its last guard,
+    # so anything can run after it.
+    if has_speculative_side_effects(instrs):
+        raise RuntimeError(
+            "Should not have side effecting instructions before the last guard")
+    last_br = last_branch_index(instrs)
 
     final_instrs = []
-    spec_instr = build_speculate()
-    final_instrs.append(spec_instr)
-    for instr_pair in instrs:
+    if last_br >= 0:
+        spec_instr = build_speculate()
+        final_instrs.append(spec_instr)
+    for idx, instr_pair in enumerate(instrs):
         instr = instr_pair["instr"]
         if is_jmp(instr):
             continue
@@ -48,21 +129,22 @@ def trace(instrs: list) -> list:
             br_cond = instr_pair["branch"]
             assert type(br_cond) == bool
             if br_cond:
-                guard_instr = build_guard(instr[ARGS][0], BAILOUT_LABEL)
+                guard_instr = build_guard(instr[ARGS][0], bailout_label)
                 final_instrs.append(guard_instr)
             else:
                 # get false branch of br instr for guard and jump to BAILOUT_LABEL
                 guard_negation = {DEST: GUARD_VAR, OP: NOT,
                                   TYPE: BOOL, ARGS: [instr[ARGS][0]]}
                 final_instrs.append(guard_negation)
-                guard_instr = build_guard(GUARD_VAR, BAILOUT_LABEL)
+                guard_instr = build_guard(GUARD_VAR, bailout_label)
                 final_instrs.append(guard_instr)
+            if idx == last_br:
+                commit_instr = build_commit()
+                final_instrs.append(commit_instr)
         elif is_label(instr):
             continue
         else:
             final_instrs.append(instr)
-    commit_instr = build_commit()
-    final_instrs.append(commit_instr)
     return final_instrs
 
 
@@ -148,12 +230,527 @@ def call_lvn(trace_instrs):
 
 
 def optimize(trace_instrs):
-    return call_lvn(trace_instrs)
+    trace_instrs = call_lvn(trace_instrs)
+    optimized_instrs = optimize_guards(trace_instrs)
+    # a trace that always fails is left to fail
+    if optimized_instrs == None:
+        return trace_instrs
+    return optimized_instrs
+
+
+# GUARD OPTIMIZATION
+# ----------------------------------------------------------------------------
+# Traces are straight line code, so each guard tells the rest of the trace
+# that its condition is true. Guards implied by earlier guards or constants
+# are deleted, which also merges repeated guards on the same condition, the
+# not of a negated guard is folded into the comparison it negates, and guards
+# computed only from values the trace starts with are hoisted to the start
+# of the trace, where they fail before any work is wasted.
+#
+# Each pass keeps a list of detectors, the instruction that now catches the
+# failure of each original guard of the trace, in order: the guard itself,
+# the guard implying it, or None for a guard that cannot fail.
+
+
+def comparison_facts(op, a, b, value):
+    """
+    Facts (op, a, b, value), over lt, le and eq only, implied by the integer
+    comparison op a b being value
+    """
+    if op in SWAPPED_COMPARISONS:
+        op, a, b = SWAPPED_COMPARISONS[op], b, a
+    if op == EQ:
+        if value:
+            return [(EQ, a, b, True), (EQ, b, a, True), (LE, a, b, True),
+                    (LE, b, a, True), (LT, a, b, False), (LT, b, a, False)]
+        return [(EQ, a, b, False), (EQ, b, a, False)]
+    if op == LT:
+        if value:
+            return [(LT, a, b, True), (LE, a, b, True), (LT, b, a, False),
+                    (LE, b, a, False), (EQ, a, b, False), (EQ, b, a, False)]
+        return [(LT, a, b, False), (LE, b, a, True)]
+    assert op == LE
+    if value:
+        return [(LE, a, b, True), (LT, b, a, False)]
+    # a > b
+    return comparison_facts(LT, b, a, True)
+
+
+def lookup_comparison(facts, op, a, b):
+    if op in SWAPPED_COMPARISONS:
+        op, a, b = SWAPPED_COMPARISONS[op], b, a
+    return facts.get((op, a, b))
+
+
+def replace_detector(detectors, old, new):
+    if detectors == None:
+        return
+    for idx, detector in enumerate(detectors):
+        if detector is old:
+            detectors[idx] = new
+
+
+def remove_implied_guards(trace_instrs, detectors=None):
+    """
+    Deletes the guards of trace_instrs whose condition is known to be true,
+    because it is a constant, or follows from the conditions of earlier
+    guards, through ids, nots and integer comparisons of the same operands
+
+    Returns None if a guard is known to fail.
+    """
+    # var -> (known value, guard it is known from, or None for constants)
+    known = dict()
+    # (op, a, b) -> (known value, guard it is known from)
+    facts = dict()
+    # var -> (defining instr, versions of its arguments when defined)
+    defs = dict()
+    version = dict()
+
+    def unchanged_def(var):
+        if var not in defs:
+            return None
+        (instr, arg_versions) = defs[var]
+        if ARGS in instr and tuple(version.get(a, 0) for a in instr[ARGS]) != arg_versions:
+            return None
+        return instr
+
+    def learn(var, value, source):
+        known[var] = (value, source)
+        instr = unchanged_def(var)
+        if instr == None:
+            return
+        if instr[OP] == NOT:
+            learn(instr[ARGS][0], not value, source)
+        elif instr[OP] == ID:
+            learn(instr[ARGS][0], value, source)
+        elif instr[OP] in COMP_OPS:
+            (a, b) = instr[ARGS]
+            for (op, x, y, v) in comparison_facts(instr[OP], a, b, value):
+                facts[(op, x, y)] = (v, source)
+
+    new_instrs = []
+    for instr in trace_instrs:
+        if is_guard(instr):
+            cond = instr[ARGS][0]
+            if cond in known:
+                (value, source) = known[cond]
+                if not value:
+                    return None
+                replace_detector(detectors, instr, source)
+                continue
+            learn(cond, True, instr)
+        elif DEST in instr:
+            dst = instr[DEST]
+            # what is known about dst, from its arguments before it is defined
+            fact = None
+            if instr[OP] == CONST and type(instr[VALUE]) == bool:
+                fact = (instr[VALUE], None)
+            elif instr[OP] == ID and instr[ARGS][0] in known:
+                fact = known[instr[ARGS][0]]
+            elif instr[OP] == NOT and instr[ARGS][0] in known:
+                (value, source) = known[instr[ARGS][0]]
+                fact = (not value, source)
+            elif instr[OP] in COMP_OPS:
+                fact = lookup_comparison(facts, instr[OP], *instr[ARGS])
+
+            version[dst] = version.get(dst, 0) + 1
+            known.pop(dst, None)
+            for key in [key for key in facts if dst in key[1:]]:
+                del facts[key]
+            defs[dst] = (instr, tuple(version.get(a, 0)
+                                      for a in instr.get(ARGS, [])))
+            if fact != None:
+                known[dst] = fact
+        new_instrs.append(instr)
+    return new_instrs
+
+
+def fold_guard_negations(trace_instrs):
+    """
+    Replaces each not of an integer comparison defined earlier in
+    trace_instrs, from operands that are still unchanged, with the negated
+    comparison, so the comparison itself can become dead
+    """
+    new_instrs = list(trace_instrs)
+    for idx, instr in enumerate(new_instrs):
+        if OP not in instr or instr[OP] != NOT:
+            continue
+        arg = instr[ARGS][0]
+        for def_idx in reversed(range(idx)):
+            def_instr = new_instrs[def_idx]
+            if DEST in def_instr and def_instr[DEST] == arg:
+                break
+        else:
+            continue
+        if def_instr[OP] not in NEGATED_COMPARISONS:
+            continue
+        redefined = False
+        for between in new_instrs[def_idx + 1:idx]:
+            if DEST in between and between[DEST] in def_instr[ARGS]:
+                redefined = True
+        if redefined:
+            continue
+        new_instrs[idx] = {DEST: instr[DEST], OP: NEGATED_COMPARISONS[def_instr[OP]],
+                           TYPE: BOOL, ARGS: list(def_instr[ARGS])}
+    return new_instrs
+
+
+def hoist_invariant_guards(trace_instrs):
+    """
+    Moves every guard of trace_instrs whose condition is computed, by ops
+    that cannot fail, only from values the trace starts with, to the start
+    of the trace, along with the computation of its condition
+
+    A failed guard rolls back to the start of the trace wherever it is, so a
+    guard may fail earlier, but must still compute the same condition.
+    """
+    instrs = list(trace_instrs)
+    spec_idx = None
+    for idx, instr in enumerate(instrs):
+        if is_speculate(instr):
+            spec_idx = idx
+            break
+    if spec_idx == None:
+        return instrs
+
+    # end of the guards hoisted so far
+    entry_end = spec_idx + 1
+    idx = entry_end
+    while idx < len(instrs):
+        if not is_guard(instrs[idx]):
+            idx += 1
+            continue
+        # backwards slice of the condition, down to the hoisted guards
+        needed = set(instrs[idx][ARGS])
+        slice_idxs = []
+        hoistable = True
+        for def_idx in reversed(range(entry_end, idx)):
+            instr = instrs[def_idx]
+            if DEST not in instr or instr[DEST] not in needed:
+                continue
+            if instr[OP] not in HOISTABLE_OPS:
+                hoistable = False
+                break
+            needed.discard(instr[DEST])
+            needed.update(instr.get(ARGS, []))
+            slice_idxs.append(def_idx)
+        slice_idxs.reverse()
+        # the slice must not write over a value read or written before it
+        if hoistable:
+            for def_idx in slice_idxs:
+                dst = instrs[def_idx][DEST]
+                for other_idx in range(entry_end, def_idx):
+                    if other_idx in slice_idxs:
+                        continue
+                    other = instrs[other_idx]
+                    if dst in other.get(ARGS, []) or other.get(DEST) == dst:
+                        hoistable = False
+        if not hoistable:
+            idx += 1
+            continue
 
+        moved = [instrs[i] for i in slice_idxs] + [instrs[idx]]
+        rest = [instr for i, instr in enumerate(instrs[entry_end:], entry_end)
+                if i not in slice_idxs and i != idx]
+        instrs = instrs[:entry_end] + moved + rest
+        entry_end += len(moved)
+        idx = entry_end
+    return instrs
+
+
+def drop_unguarded_speculation(trace_instrs):
+    """
+    Deletes the speculate and commit of trace_instrs if it has no guards left
+    """
+    if any(is_guard(instr) for instr in trace_instrs):
+        return trace_instrs
+    return [instr for instr in trace_instrs
+            if not is_speculate(instr) and not is_commit(instr)]
+
+
+def optimize_guards(trace_instrs, live_out=None, detectors=None):
+    """
+    Guard optimization of speculative trace_instrs: folds nots into
+    comparisons (only with the variables live_out of the trace known, so the
+    comparisons can be deleted), deletes implied guards and hoists invariant
+    guards to the start of the trace
+
+    Returns None if the trace always fails.
+    """
+    if live_out != None:
+        trace_instrs = trace_dce(fold_guard_negations(trace_instrs), live_out)
+    trace_instrs = remove_implied_guards(trace_instrs, detectors)
+    if trace_instrs == None:
+        return None
+    trace_instrs = hoist_invariant_guards(trace_instrs)
+    return drop_unguarded_speculation(trace_instrs)
+
+
+def optimize_trace(trace_instrs, var2typ, live_out):
+    """
+    Optimizes a speculative trace, with its free variables typed by var2typ,
+    by LVN, which also folds constants and propagates copies, then by DCE of
+    every definition not read later in the trace or live out of it
+
+    Returns None if a free variable of the trace has no type.
+    """
+    free_vars = []
+    defined_vars = set()
+    for instr in trace_instrs:
+        if ARGS in instr:
+            for a in instr[ARGS]:
+                if a not in defined_vars and a not in free_vars:
+                    if a not in var2typ:
+                        return None
+                    free_vars.append(a)
+        if DEST in instr:
+            defined_vars.add(instr[DEST])
 
-@click.command()
+    function = {NAME: LVN_FUNC,
+                ARGS: [{NAME: a, TYPE: var2typ[a]} for a in free_vars],
+                INSTRS: deepcopy(trace_instrs)}
+    optimized_prog = lvn({FUNCTIONS: [function]})
+    # LVN labels the trace as a basic block
+    optimized_instrs = [instr for instr in optimized_prog[FUNCTIONS][0][INSTRS]
+                        if not is_label(instr)]
+    return trace_dce(optimized_instrs, live_out)
+
+
+def trace_dce(trace_instrs, live_out):
+    """
+    Deletes side effect free definitions of trace_instrs that are neither
+    read later in the trace nor in live_out. A failed guard rolls back every
+    variable, so only a trace that runs to its end needs its definitions.
+    """
+    live = set(live_out)
+    new_instrs = []
+    for instr in reversed(trace_instrs):
+        if DEST in instr:
+            if instr[DEST] not in live and is_traceable(instr):
+                continue
+            live.discard(instr[DEST])
+        if ARGS in instr:
+            live.update(instr[ARGS])
+        new_instrs.append(instr)
+    return list(reversed(new_instrs))
+
+
+def select_hot_path(func, cfg, loop):
+    """
+    Hottest path through loop of func, as a list of (block, successor)
+    pairs, from its header back around to its header, following the most
+    frequent edge out of each block, or None if the path leaves the loop,
+    goes around an inner loop or is too long
+    """
+    path = []
+    visited = set()
+    block = loop.header
+    while len(path) < MAX_TRACE_BLOCKS:
+        if block not in loop.blocks or block in visited:
+            return None
+        visited.add(block)
+
+        best_succ = None
+        best_count = 0
+        for succ in cfg[block][SUCCS]:
+            count = edge_count(func, block, succ)
+            if count != None and count > best_count:
+                best_succ, best_count = succ, count
+        if best_succ == None:
+            return None
+
+        path.append((block, best_succ))
+        if best_succ == loop.header:
+            return path
+        block = best_succ
+    return None
+
+
+def path_to_trace(path, cfg):
+    """
+    Instructions along path, paired with the direction of each branch, as
+    brili-tr records them
+    """
+    instr_pairs = []
+    for (block, succ) in path:
+        for instr in cfg[block][INSTRS]:
+            pair = {"instr": instr}
+            if is_br(instr):
+                pair["branch"] = get_br_labels(instr)[0] == succ
+            instr_pairs.append(pair)
+    return instr_pairs
+
+
+def trace_savings(func, path, cfg, trace_instrs, detectors):
+    """
+    Expected number of instructions saved per execution of the loop header,
+    by running trace_instrs, the optimized trace of path, in place of path,
+    with the probability of each branch taken as in the profile of func, and
+    the failure of the guard of each branch caught by its detector
+
+    A trace that completes saves the difference in length, a trace that fails
+    wastes every instruction up to the detector, as well as the jump back to
+    the header of the trace.
+    """
+    path_length = 0
+    probabilities = []
+    for (block, succ) in path:
+        instrs = cfg[block][INSTRS]
+        path_length += len([i for i in instrs if not is_label(i)])
+        if instrs != [] and is_br(instrs[-1]):
+            taken = edge_count(func, block, succ)
+            probabilities.append(taken / block_count(func, block))
+
+    assert len(detectors) == len(probabilities)
+    # number of instructions run up to and including each instruction
+    positions = dict()
+    position = 0
+    for instr in trace_instrs:
+        if not is_label(instr):
+            position += 1
+        positions[id(instr)] = position
+
+    completes = 1
+    wasted = 0
+    for (detector, probability) in zip(detectors, probabilities):
+        if detector != None:
+            wasted += completes * (1 - probability) * positions[id(detector)]
+        completes *= probability
+    # the jump back to the header
+    trace_length = position + 1
+    return completes * (path_length - trace_length) - wasted
+
+
+def branch_entry_guards(trace_instrs, live_in, label_prefix, detectors=None):
+    """
+    Runs the guards at the start of trace_instrs before it speculates, as
+    branches to their bailout, with labels named from label_prefix
+
+    The guards are hoisted there, and the definitions before them can run
+    without speculation if none of them is live_in to the bailout.
+    """
+    spec_idx = None
+    for idx, instr in enumerate(trace_instrs):
+        if is_speculate(instr):
+            spec_idx = idx
+            break
+    if spec_idx == None:
+        return trace_instrs
+
+    last_guard_idx = None
+    for idx in range(spec_idx + 1, len(trace_instrs)):
+        instr = trace_instrs[idx]
+        if is_guard(instr):
+            last_guard_idx = idx
+        elif DEST not in instr or instr[DEST] in live_in or not is_traceable(instr):
+            break
+    if last_guard_idx == None:
+        return trace_instrs
+
+    entry_instrs = []
+    for instr in trace_instrs[spec_idx + 1:last_guard_idx + 1]:
+        if not is_guard(instr):
+            entry_instrs.append(instr)
+            continue
+        continue_label = f"{label_prefix}.{len(entry_instrs)}"
+        br_instr = build_br(instr[ARGS][0], continue_label, instr[LABELS][0])
+        replace_detector(detectors, instr, br_instr)
+        entry_instrs += [br_instr, build_label(continue_label)]
+    new_instrs = [*trace_instrs[:spec_idx], *entry_instrs, trace_instrs[spec_idx],
+                  *trace_instrs[last_guard_idx + 1:]]
+    return drop_unguarded_speculation(new_instrs)
+
+
+def compile_hot_traces_func(func):
+    """
+    Inserts an optimized trace at the header of every hot loop of func that
+    is expected to save instructions, using the profile of func
+    """
+    if PROFILE not in func:
+        return func
+    for instr in func[INSTRS]:
+        if is_phi(instr):
+            return func
+    cfg = form_cfg_w_blocks(func)
+    if len(cfg) == 0:
+        return func
+    live_in, _ = live_variables_func(func)
+    var2typ = get_var_types(func)
+    var2typ[GUARD_VAR] = BOOL
+
+    traces = []
+    for loop in loops_innermost_first(get_loop_nest_forest(func)):
+        count = block_count(func, loop.header)
+        if count == None or count < HOT_LOOP_MIN_COUNT:
+            continue
+        header_instrs = cfg[loop.header][INSTRS]
+        if header_instrs == [] or not is_label(header_instrs[0]):
+            continue
+        path = select_hot_path(func, cfg, loop)
+        if path == None:
+            continue
+
+        instr_pairs = path_to_trace(path, cfg)
+        if has_speculative_side_effects(instr_pairs):
+            continue
+        bailout_label = f"{BAILOUT_LABEL}.{loop.header}"
+        trace_instrs = trace(instr_pairs, bailout_label)
+        trace_instrs = optimize_trace(
+            trace_instrs, var2typ, live_in[loop.header])
+        if trace_instrs == None:
+            continue
+        detectors = [instr for instr in trace_instrs if is_guard(instr)]
+        trace_instrs = optimize_guards(
+            trace_instrs, live_in[loop.header], detectors)
+        if trace_instrs == None:
+            continue
+        trace_instrs = branch_entry_guards(
+            trace_instrs, live_in[loop.header], f"{TRACE_LABEL}.{loop.header}", detectors)
+        if trace_savings(func, path, cfg, trace_instrs, detectors) <= 0:
+            continue
+        traces.append((loop.header, bailout_label, trace_instrs))
+    if traces == []:
+        return func
+
+    # every path is read before any header is changed
+    for (header, bailout_label, trace_instrs) in traces:
+        header_instrs = cfg[header][INSTRS]
+        cfg[header][INSTRS] = [header_instrs[0], *trace_instrs,
+                               build_jmp(header), build_label(bailout_label),
+                               *header_instrs[1:]]
+
+    func[INSTRS] = join_cfg(cfg)
+    return func
+
+
+def compile_hot_traces(prog, args=()):
+    """
+    Compiles traces of the hot loops of every function of prog, using the
+    profile annotations of prog, or a profile of prog run on args if it has
+    none
+    """
+    if not any(PROFILE in func for func in prog[FUNCTIONS]):
+        annotate_prog(prog, collect_profile(prog, args))
+    for func in prog[FUNCTIONS]:
+        compile_hot_traces_func(func)
+    return prog
+
+
+@click.command(context_settings={"ignore_unknown_options": True})
+@click.option('--hot', default=False, help='Pick Traces of Hot Loops from an Execution Profile.')
 @click.option('--pretty-print', default=False, help='Pretty Print Before and After Trace Optimization.')
-def main(pretty_print):
+@click.argument('args', nargs=-1, type=click.UNPROCESSED)
+def main(hot, pretty_print, args):
+    if bool(hot) == True:
+        program = json.load(sys.stdin)
+        if bool(pretty_print) == True:
+            print(json.dumps(program, indent=4, sort_keys=True))
+        new_program = compile_hot_traces(program, args)
+        if bool(pretty_print) == True:
+            print(json.dumps(new_program, indent=4, sort_keys=True))
+        print(json.dumps(new_program))
+        return
+
     program_dict = json.load(sys.stdin)
     program = program_dict["prog"]
     trace_file = program_dict["trace"]
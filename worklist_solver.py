@@ -1,6 +1,7 @@
 """
 Generic Worklist Data Flow Solver
 """
+import heapq
 from collections import OrderedDict
 
 
@@ -12,16 +13,68 @@ class Worklist(object):
         self.init = init
         self.merge = merge
         self.transfer = transfer
+        self.predecessors = None
+        self.successors = None
+
+    def build_edge_maps(self):
+        """
+        Builds predecessor and successor maps once, restricted to blocks,
+        with each list deduplicated and in block order
+        """
+        if self.predecessors != None:
+            return
+        block_index = {name: i for i, name in enumerate(self.blocks)}
+        preds = OrderedDict((name, []) for name in self.blocks)
+        succs = OrderedDict()
+        for name in self.blocks:
+            succ_names = {s for s in self.cfg[name] if s in block_index}
+            succs[name] = sorted(succ_names, key=lambda s: block_index[s])
+            for s in succs[name]:
+                preds[s].append(name)
+        self.predecessors = preds
+        self.successors = succs
 
     def get_predecessors(self, block_name):
-        cfg = self.cfg
-        preds = set()
-        for other_block_name, succs in cfg.items():
-            for s in succs:
-                if s == block_name:
-                    preds.add(other_block_name)
-                    break
-        return list(preds)
+        self.build_edge_maps()
+        return self.predecessors[block_name]
+
+    def get_successors(self, block_name):
+        self.build_edge_maps()
+        return self.successors[block_name]
+
+    def dfs_postorder(self):
+        """
+        Reachable blocks in postorder of a DFS from the entry, and the
+        unreachable blocks in block order
+        """
+        self.build_edge_maps()
+        order = []
+        visited = set()
+        if self.entry in self.blocks:
+            visited.add(self.entry)
+            stack = [(self.entry, iter(self.successors[self.entry]))]
+            while stack != []:
+                node, children = stack[-1]
+                advanced = False
+                for c in children:
+                    if c not in visited:
+                        visited.add(c)
+                        stack.append((c, iter(self.successors[c])))
+                        advanced = True
+                        break
+                if not advanced:
+                    order.append(node)
+                    stack.pop()
+        unreachable = [name for name in self.blocks if name not in visited]
+        return order, unreachable
+
+    def postorder(self):
+        order, unreachable = self.dfs_postorder()
+        return order + unreachable
+
+    def reverse_postorder(self):
+        order, unreachable = self.dfs_postorder()
+        return list(reversed(order)) + unreachable
 
     def solve(self):
         in_dict = OrderedDict()
@@ -34,29 +87,31 @@ class Worklist(object):
         for name in self.blocks:
             out_dict[name] = self.init
 
-        worklist = [(name, self.blocks[name]) for name in self.blocks]
+        # priority worklist: blocks are processed in reverse postorder,
+        # each block queued at most once at a time
+        order = self.reverse_postorder()
+        priority = {name: i for i, name in enumerate(order)}
+        worklist = list(range(len(order)))
+        queued = set(order)
         while worklist != []:
-            (block_name, block) = worklist.pop()
-            pred_names = self.get_predecessors(block_name)
-            preds = []
-            for name, _ in self.blocks.items():
-                if name in pred_names:
-                    preds.append(out_dict[name])
+            block_name = order[heapq.heappop(worklist)]
+            queued.remove(block_name)
+            block = self.blocks[block_name]
+            preds = [out_dict[name]
+                     for name in self.predecessors[block_name]]
             # if no preds, it is the entry location. Add args as needed.
             if preds == []:
-                if len(in_dict[self.entry]) != 0:
-                    preds.append(in_dict[self.entry])
+                if self.init:
+                    preds.append(self.init)
             in_b = self.merge(preds)
             in_dict[block_name] = in_b
             new_out_b = self.transfer(in_b, block)
             old_out_b = out_dict[block_name]
             if new_out_b != old_out_b:
-                successor_names = self.cfg[block_name]
-                successors = []
-                for succ_name, succ_blocks in self.blocks.items():
-                    if succ_name in successor_names:
-                        successors.append((succ_name, succ_blocks))
-                worklist += successors
+                for succ_name in self.successors[block_name]:
+                    if succ_name not in queued:
+                        queued.add(succ_name)
+                        heapq.heappush(worklist, priority[succ_name])
             out_dict[block_name] = new_out_b
         return (in_dict, out_dict)
 
@@ -71,28 +126,29 @@ class Worklist(object):
         for name in self.blocks:
             in_dict[name] = self.init
 
-        worklist = [(name, self.blocks[name]) for name in self.blocks]
+        # priority worklist: blocks are processed in postorder,
+        # each block queued at most once at a time
+        order = self.postorder()
+        priority = {name: i for i, name in enumerate(order)}
+        worklist = list(range(len(order)))
+        queued = set(order)
         while worklist != []:
-            (block_name, block) = worklist.pop()
-            succ_names = self.cfg[block_name]
-            succs = []
-            for name, _ in self.blocks.items():
-                if name in succ_names:
-                    succs.append(in_dict[name])
-            # if no successors, it is the entry location. Add args as needed.
+            block_name = order[heapq.heappop(worklist)]
+            queued.remove(block_name)
+            block = self.blocks[block_name]
+            succs = [in_dict[name] for name in self.successors[block_name]]
+            # if no successors, it is the exit location. Add args as needed.
             if succs == []:
-                if len(out_dict[self.entry]) != 0:
-                    succs.append(out_dict[self.entry])
+                if self.init:
+                    succs.append(self.init)
             out_b = self.merge(succs)
             out_dict[block_name] = out_b
             new_in_b = self.transfer(out_b, block)
             old_in_b = in_dict[block_name]
             if new_in_b != old_in_b:
-                predecessor_names = self.get_predecessors(block_name)
-                predecessors = []
-                for pred_name, pred_blocks in self.blocks.items():
-                    if pred_name in predecessor_names:
-                        predecessors.append((pred_name, pred_blocks))
-                worklist += predecessors
+                for pred_name in self.predecessors[block_name]:
+                    if pred_name not in queued:
+                        queued.add(pred_name)
+                        heapq.heappush(worklist, priority[pred_name])
             in_dict[block_name] = new_in_b
         return (in_dict, out_dict)